@@ -0,0 +1,68 @@
+'''Approval sources on the configured database backend.
+
+Times writing approvals, reading their sources back, finding approvals
+by the value they set and approving them in bulk. Run it once per
+backend to compare them:
+
+    python -m benchmarks.bench_backends --rows 10000
+    DB_BACKEND=sqlite python -m benchmarks.bench_backends --rows 10000
+'''
+import argparse
+
+from benchmarks.utils import benchmark_database, setup_django, timed
+
+
+def approvals(children):
+    from django.contrib.contenttypes.models import ContentType
+
+    from django_approval.models import Approval
+    from django_approval.test_utils.test_app.models import Child
+
+    content_type = ContentType.objects.get_for_model(Child)
+    for child in children:
+        edited = Child(pk=child.pk, field1='edited-{}'.format(child.pk), field2=child.field2, parent=child.parent)
+        yield Approval(
+            content_type=content_type, object_id=child.pk, action='update',
+            source=Approval.make_source(edited, fields=['field1']),
+            changed_fields=['field1'], diff=''
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    from django_approval.models import Approval
+    from django_approval.test_utils.test_app.models import Child, Parent
+
+    with benchmark_database():
+        print(connection.display_name)
+        parent = Parent.objects.create(name='parent')
+        children = Child.objects.bulk_create([
+            Child(field1='field1', field2='field2', parent=parent) for _ in range(args.rows)
+        ])
+        if not children[0].pk:
+            children = list(Child.objects.select_related('parent'))
+
+        with timed('write {} approvals'.format(args.rows)):
+            Approval.objects.bulk_create(approvals(children), batch_size=1000)
+
+        with timed('read {} sources'.format(args.rows)):
+            for approval in Approval.objects.all().select_related(None).only('source').iterator():
+                approval.get_source_object()
+
+        wanted = 'edited-{}'.format(children[len(children) // 2].pk)
+        with timed('changing(), 100 lookups'):
+            for _ in range(100):
+                list(Approval.objects.all().changing(field1=wanted))
+
+        with timed('approve {} updates'.format(args.rows)):
+            Approval.objects.all().approve()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''Paging and counting the approval changelist.
+
+Compares an OFFSET page deep into the list with the keyset page at the same
+position, and COUNT(*) with the estimates of ApprovalPaginator.
+
+    python -m benchmarks.bench_changelist --rows 1000000 --depth 5000
+
+Needs the PostgreSQL database configured in tests/settings.py.
+'''
+import argparse
+
+from benchmarks.utils import benchmark_database, seed_approvals, setup_django, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--depth', type=int, default=5000, help='the page number to read')
+    parser.add_argument('--per-page', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.paginator import Paginator
+
+    from django_approval.models import Approval
+    from django_approval.paginator import KEYSET_ORDERING, ApprovalPaginator, make_cursor, parse_cursor
+
+    with benchmark_database():
+        with timed('seeding {} approvals'.format(args.rows)):
+            seed_approvals(args.rows)
+
+        queryset = Approval.objects.order_by(*KEYSET_ORDERING)
+        offset = (args.depth - 1) * args.per_page
+        before = queryset[offset - 1]
+        paginator = Paginator(queryset, args.per_page)
+        with timed('OFFSET page {}'.format(args.depth)):
+            offset_rows = list(paginator.page(args.depth).object_list)
+        paginator = ApprovalPaginator(
+            queryset, args.per_page, cursor=parse_cursor(make_cursor(before.created, before.pk)), keyset=True
+        )
+        with timed('keyset page {}'.format(args.depth)):
+            keyset_rows = list(paginator.page(1).object_list)
+        assert offset_rows == keyset_rows
+
+        for label, filtered in [
+            ('unfiltered', queryset),
+            ('action filter', queryset.filter(action='update')),
+        ]:
+            with timed('COUNT(*), {}'.format(label)):
+                exact = filtered.count()
+            paginator = ApprovalPaginator(filtered, args.per_page, estimate=True)
+            with timed('estimate, {}'.format(label)):
+                estimate = paginator.count
+            print('{:<40} {:>10} ~{}'.format('  rows', exact, estimate))
+
+
+if __name__ == '__main__':
+    main()
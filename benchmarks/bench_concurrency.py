@@ -0,0 +1,123 @@
+'''Concurrent approvers deciding competing updates.
+
+Every object gets --editors update approvals which were all made against
+the same version of the object, like editors submitting the same form at
+the same time. --approvers threads then try to approve every approval in
+a random order. Afterwards each object must have exactly one approved
+update and hold the values of that update, anything else is a lost
+update. Needs PostgreSQL, the approvers use their own connections.
+
+    python -m benchmarks.bench_concurrency --objects 500 --approvers 8
+    python -m benchmarks.bench_concurrency --no-snapshot
+'''
+import argparse
+import random
+import threading
+from collections import Counter
+
+from benchmarks.utils import benchmark_database, setup_django, timed
+
+
+def seed(objects, editors, snapshot=True):
+    from django.contrib.contenttypes.models import ContentType
+
+    from django_approval.models import Approval
+    from django_approval.snapshot import get_snapshots
+    from django_approval.test_utils.test_app.models import Child, Parent
+
+    parent = Parent.objects.create(name='parent')
+    children = Child.objects.bulk_create([
+        Child(field1='original', field2='field2', parent=parent) for _ in range(objects)
+    ])
+    snapshots = get_snapshots(
+        Child, [child.pk for child in children], fields=['field1']
+    ) if snapshot else {}
+    content_type = ContentType.objects.get_for_model(Child)
+    approvals = []
+    for child in children:
+        for editor in range(editors):
+            edited = Child(pk=child.pk, field1='editor-{}'.format(editor), field2='field2', parent=parent)
+            approvals.append(Approval(
+                content_type=content_type, object_id=child.pk, action='update',
+                source=Approval.make_source(edited, fields=['field1']), diff='',
+                changed_fields=['field1'], snapshot=snapshots.get(child.pk, '')
+            ))
+    return [approval.pk for approval in Approval.objects.bulk_create(approvals)]
+
+
+def approver(pks, outcomes, lock):
+    from django.db import connection
+
+    from django_approval.exceptions import AlreadyDecided, StaleApproval
+    from django_approval.models import Approval
+
+    counts = Counter()
+    try:
+        for pk in random.sample(pks, len(pks)):
+            approval = Approval.objects.get(pk=pk)
+            if approval.status:
+                counts['skipped'] += 1
+                continue
+            try:
+                approval.approve()
+                counts['approved'] += 1
+            except AlreadyDecided:
+                counts['already decided'] += 1
+            except StaleApproval:
+                counts['stale'] += 1
+    finally:
+        connection.close()
+    with lock:
+        outcomes.update(counts)
+
+
+def check():
+    '''The number of lost updates'''
+    from django_approval.models import Approval
+    from django_approval.test_utils.test_app.models import Child
+
+    approved = {}
+    lost = 0
+    for approval in Approval.objects.filter(status='approved'):
+        if approval.object_id in approved:
+            lost += 1
+        approved[approval.object_id] = approval.get_source_object().field1
+    for child in Child.objects.all():
+        if approved.get(child.pk) != child.field1:
+            lost += 1
+    return lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--objects', type=int, default=200)
+    parser.add_argument('--editors', type=int, default=3)
+    parser.add_argument('--approvers', type=int, default=8)
+    parser.add_argument('--no-snapshot', action='store_true', help='make the approvals without a snapshot')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        pks = seed(args.objects, args.editors, snapshot=not args.no_snapshot)
+        outcomes = Counter()
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=approver, args=(pks, outcomes, lock))
+            for _ in range(args.approvers)
+        ]
+        label = '{} approvals, {} approvers'.format(len(pks), args.approvers)
+        with timed(label) as elapsed:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        decided = outcomes['approved'] + outcomes['stale']
+        print('{:<40} {:>10.0f}/s'.format('decided approvals', decided / elapsed()))
+        for outcome, count in sorted(outcomes.items()):
+            print('{:<40} {:>10}'.format(outcome, count))
+        print('{:<40} {:>10}'.format('lost updates', check()))
+
+
+if __name__ == '__main__':
+    main()
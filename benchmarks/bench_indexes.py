@@ -0,0 +1,76 @@
+'''Query plans of the approval access paths, before and after the indexes.
+
+The "before" plans are taken inside a transaction that drops the indexes
+from 0002_approval_indexes and is rolled back afterwards.
+
+    python -m benchmarks.bench_indexes --rows 1000000
+
+Needs the PostgreSQL database configured in tests/settings.py.
+'''
+import argparse
+
+from benchmarks.utils import benchmark_database, seed_approvals, setup_django, timed
+
+INDEXES = ['approval_target_idx', 'approval_pending_idx', 'approval_status_idx']
+# the default ordering before 0002_approval_indexes
+OLD_ORDERING = ('content_type__app_label', 'content_type__model', 'object_id')
+
+
+class Rollback(Exception):
+    pass
+
+
+def access_paths():
+    from django.contrib.contenttypes.models import ContentType
+
+    from django_approval.choices import Status
+    from django_approval.models import Approval
+    from django_approval.test_utils.test_app.models import Child
+
+    content_type = ContentType.objects.get_for_model(Child)
+    target = Approval.objects.filter(content_type=content_type, object_id=43)
+    return [
+        ('changelist, old ordering', Approval.objects.order_by(*OLD_ORDERING)[:100]),
+        ('changelist, default ordering', Approval.objects.all()[:100]),
+        ('pending for target', target.filter(status=Status.none)),
+        ('history of target', target.order_by('-created')[:20]),
+        ('status filter', Approval.objects.filter(status=Status.none, action='update')[:100]),
+    ]
+
+
+def explain_all(title):
+    print('=' * 20, title, '=' * 20)
+    for label, queryset in access_paths():
+        with timed(label):
+            plan = queryset.explain(analyze=True)
+        print(plan, end='\n\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--keepdb', action='store_true')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection, transaction
+
+    with benchmark_database(keepdb=args.keepdb):
+        with timed('seeding {} approvals'.format(args.rows)):
+            seed_approvals(args.rows)
+
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in INDEXES:
+                        cursor.execute('DROP INDEX {}'.format(index))
+                explain_all('without indexes')
+                raise Rollback
+        except Rollback:
+            pass
+
+        explain_all('with indexes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''Time spent on the "Decide" column of the approval inline.
+
+Compares reversing both urls for every row, like the inline used to do,
+with the url templates of reverse_admin_name, and times the full change
+view of a parent with that many pending child approvals.
+
+    python -m benchmarks.bench_inline --rows 1000
+'''
+import argparse
+
+from benchmarks.utils import benchmark_database, setup_django, timed
+
+
+def seed(rows):
+    from django.contrib.contenttypes.models import ContentType
+
+    from django_approval.models import Approval
+    from django_approval.test_utils.test_app.models import Child, Parent
+
+    parent = Parent.objects.create(name='parent')
+    children = Child.objects.bulk_create([
+        Child(field1='field1-{}'.format(index), field2='field2', parent=parent)
+        for index in range(rows)
+    ])
+    content_type = ContentType.objects.get_for_model(Child)
+    Approval.objects.bulk_create([
+        Approval(content_type=content_type, object_id=child.pk, action='update', source={}, diff='')
+        for child in children
+    ])
+    return parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.admin.sites import site
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+
+    from django_approval.admin import APPROVE_NAME, REJECT_NAME, get_admin_name, reverse_admin_name
+    from django_approval.models import Approval
+    from django_approval.test_utils.test_app.admin import ChildApprovalAdmin
+    from django_approval.test_utils.test_app.models import Parent
+
+    with benchmark_database():
+        parent = seed(args.rows)
+        approvals = list(Approval.objects.all())
+        inline = ChildApprovalAdmin(Parent, site)
+        inline.ParentModel = Parent
+
+        with timed('reverse() per row, {} rows'.format(args.rows)):
+            for _ in range(args.repeat):
+                for approval in approvals:
+                    for name in (APPROVE_NAME, REJECT_NAME):
+                        reverse(
+                            'admin:{}'.format(get_admin_name('test_app.Parent', name)),
+                            kwargs={'approval_id': approval.pk}
+                        )
+
+        with timed('reverse_admin_name, {} rows'.format(args.rows)):
+            for _ in range(args.repeat):
+                for approval in approvals:
+                    for name in (APPROVE_NAME, REJECT_NAME):
+                        reverse_admin_name(Parent, name, kwargs={'approval_id': approval.pk})
+
+        with timed('inline column, {} rows'.format(args.rows)):
+            for _ in range(args.repeat):
+                for approval in approvals:
+                    inline.approval(approval)
+
+        user = User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+        client = Client()
+        client.force_login(user)
+        url = reverse_admin_name(Parent, 'change', args=[parent.pk])
+        client.get(url)
+        with timed('parent change view, {} rows'.format(args.rows)):
+            for _ in range(args.repeat):
+                client.get(url)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+'''The benchmark suite of the approval hot paths.
+
+Every case runs --iterations operations on fixtures made with the factories
+of django_approval.test_utils, next to a table of --size other approvals of
+other objects.
+It reports the latency (p50 and p95), the throughput and the number of
+queries of one operation:
+
+    form_save       FormUsingApproval.save of an update
+    approve         Approval.approve of an update
+    bulk_approve    ApprovalQueryset.approve of 100 updates
+    for_model       ApprovalManager.for_model limited to the children of a parent
+    admin_inline    the change view of a parent with 20 pending child approvals
+    changelist      the first page of the approval changelist
+
+The results are compared with benchmarks/baseline.json, --save stores them
+as the new baseline of the size. With --check the run fails when a case
+makes more queries, or is more than --tolerance times slower, than the
+baseline.
+
+    python -m benchmarks.suite --size 1k
+    python -m benchmarks.suite --size 100k --save
+    python -m benchmarks.suite --size 1M --check
+
+Needs the PostgreSQL database configured in tests/settings.py.
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from benchmarks.utils import benchmark_database, seed_approvals, setup_django, timed
+
+SIZES = {'1k': 1000, '100k': 100000, '1M': 1000000}
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+BULK_SIZE = 100
+# the seeded approvals target ids above the objects of the factories, so that
+# the cases measure the size of the table and not the history of their objects
+SEEDED_OBJECTS = 10 ** 9
+INLINE_ROWS = 20
+
+
+def make_updates(count, parent=None):
+    '''count pending update approvals made through FormUsingApproval'''
+    from django_approval.test_utils import factories as factory
+    from django_approval.test_utils.test_app.forms import ChildModelForm
+
+    parent = parent or factory.ParentFactory()
+    return [save_form(ChildModelForm, child) for child in factory.ChildFactory.create_batch(count, parent=parent)]
+
+
+def save_form(form_class, child):
+    data = {'field1': 'edited-{}'.format(child.pk), 'field2': child.field2, 'parent': child.parent_id}
+    form = form_class(data=data, instance=child)
+    if not form.is_valid():
+        raise ValueError(form.errors)
+    return form.save()
+
+
+def admin_client():
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    user = User.objects.filter(username='bench').first()
+    if user is None:
+        user = User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def case_form_save(iterations):
+    from django_approval.test_utils import factories as factory
+    from django_approval.test_utils.test_app.forms import ChildModelForm
+
+    parent = factory.ParentFactory()
+    return [
+        (lambda child=child: save_form(ChildModelForm, child))
+        for child in factory.ChildFactory.create_batch(iterations, parent=parent)
+    ]
+
+
+def case_approve(iterations):
+    return [approval.approve for approval in make_updates(iterations)]
+
+
+def case_bulk_approve(iterations):
+    from django_approval.models import Approval
+
+    pks = [approval.pk for approval in make_updates(iterations * BULK_SIZE)]
+    return [
+        (lambda chunk=pks[start:start + BULK_SIZE]: Approval.objects.filter(pk__in=chunk).approve())
+        for start in range(0, len(pks), BULK_SIZE)
+    ]
+
+
+def case_for_model(iterations):
+    from django_approval.models import Approval
+    from django_approval.test_utils import factories as factory
+    from django_approval.test_utils.test_app.models import Child
+
+    parent = factory.ParentFactory()
+    make_updates(INLINE_ROWS, parent=parent)
+    children = Child.objects.filter(parent=parent)
+    return [lambda: list(Approval.objects.for_model(Child, queryset=children))] * iterations
+
+
+def case_admin_inline(iterations):
+    from django_approval.admin import reverse_admin_name
+    from django_approval.test_utils import factories as factory
+    from django_approval.test_utils.test_app.models import Parent
+
+    parent = factory.ParentFactory()
+    make_updates(INLINE_ROWS, parent=parent)
+    client = admin_client()
+    url = reverse_admin_name(Parent, 'change', args=[parent.pk])
+    return [lambda: client.get(url)] * iterations
+
+
+def case_changelist(iterations):
+    from django.urls import reverse
+
+    client = admin_client()
+    url = reverse('admin:django_approval_approval_changelist')
+    return [lambda: client.get(url)] * iterations
+
+
+CASES = {
+    'form_save': case_form_save,
+    'approve': case_approve,
+    'bulk_approve': case_bulk_approve,
+    'for_model': case_for_model,
+    'admin_inline': case_admin_inline,
+    'changelist': case_changelist,
+}
+
+
+def measure(operations):
+    '''Runs the operations one by one, the first one only warms up'''
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies, queries = [], []
+    for index, operation in enumerate(operations):
+        # the query log is capped, counts are taken from an empty one
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - start
+        if index:
+            latencies.append(elapsed)
+            # savepoints depend on the transaction the case runs in
+            queries.append(len([
+                query for query in context.captured_queries
+                if 'SAVEPOINT' not in query['sql'].split(' ', 2)[:2] and query['sql'] != 'BEGIN'
+            ]))
+    latencies.sort()
+    return {
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        'ops_per_s': round(len(latencies) / sum(latencies), 1),
+        'queries': max(queries),
+    }
+
+
+def environment():
+    import django
+    from django.db import connection
+
+    version = connection.pg_version if connection.vendor == 'postgresql' else ''
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': '{} {}'.format(connection.vendor, version),
+    }
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE):
+        return {}
+    with open(BASELINE) as stream:
+        return json.load(stream)
+
+
+def compare(results, baseline, tolerance):
+    '''Prints the results next to the baseline, returns the regressed cases'''
+    regressions = []
+    print('{:<14} {:>10} {:>10} {:>10} {:>8} {:>16}'.format(
+        'case', 'p50 ms', 'p95 ms', 'ops/s', 'queries', 'vs baseline'
+    ))
+    for name, result in results.items():
+        base = baseline.get(name)
+        versus = ''
+        if base:
+            ratio = result['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1
+            versus = '{:.2f}x {:+d}q'.format(ratio, result['queries'] - base['queries'])
+            if ratio > tolerance or result['queries'] > base['queries']:
+                regressions.append(name)
+        print('{:<14} {:>10.2f} {:>10.2f} {:>10.1f} {:>8} {:>16}'.format(
+            name, result['p50_ms'], result['p95_ms'], result['ops_per_s'], result['queries'], versus
+        ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=SIZES, default='1k')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--case', action='append', choices=CASES, help='run only these cases')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--check', action='store_true', help='fail on a regression')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    args = parser.parse_args()
+
+    setup_django()
+    results = {}
+    with benchmark_database():
+        with timed('seeding {} approvals'.format(args.size)):
+            seed_approvals(SIZES[args.size], first_object=SEEDED_OBJECTS)
+        for name in args.case or CASES:
+            operations = CASES[name](args.iterations + 1)
+            results[name] = measure(operations)
+        env = environment()
+
+    baselines = load_baseline()
+    baseline = baselines.get(args.size, {})
+    print()
+    regressions = compare(results, baseline.get('results', {}), args.tolerance)
+    if args.save:
+        baseline = {'environment': env, 'results': dict(baseline.get('results', {}), **results)}
+        baselines[args.size] = baseline
+        with open(BASELINE, 'w') as stream:
+            json.dump(baselines, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+    if regressions:
+        print('regressions: {}'.format(', '.join(regressions)))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import os
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    '''Runs the benchmark against a throwaway test database'''
+    from django.test.utils import setup_databases, teardown_databases
+
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        if not keepdb:
+            teardown_databases(old_config, verbosity=0)
+
+
+@contextmanager
+def timed(label):
+    '''Prints the time spent in the block, yields a function returning it'''
+    start = time.perf_counter()
+    timing = {}
+    yield lambda: timing.get('elapsed', time.perf_counter() - start)
+    timing['elapsed'] = time.perf_counter() - start
+    print('{:<40} {:>10.3f}s'.format(label, timing['elapsed']))
+
+
+def seed_approvals(rows, objects=None, first_object=1):
+    '''Inserts `rows` approvals with generate_series, PostgreSQL only.
+
+    Every tenth approval is pending, the rest are decided. Approvals are
+    spread over two content types and `objects` target ids, starting at
+    `first_object`.
+    '''
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import connection
+
+    from django_approval.test_utils.test_app.models import Child, Parent
+
+    objects = objects or max(rows // 10, 1)
+    child = ContentType.objects.get_for_model(Child).pk
+    parent = ContentType.objects.get_for_model(Parent).pk
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO django_approval_approval
+                (created, modified, content_type_id, object_id, action, status,
+                 comment, source, diff, snapshot, changed_fields, payload_hash)
+            SELECT
+                now() - n * interval '1 second',
+                now(),
+                CASE WHEN n %% 2 = 0 THEN %(child)s ELSE %(parent)s END,
+                n %% %(objects)s + %(first_object)s,
+                (ARRAY['create', 'update', 'delete'])[n %% 3 + 1],
+                CASE
+                    WHEN n %% 10 = 0 THEN ''
+                    WHEN n %% 10 < 6 THEN 'approved'
+                    ELSE 'rejected'
+                END,
+                '', '{}'::jsonb, '', '', '[]'::jsonb, ''
+            FROM generate_series(1, %(rows)s) AS n
+        ''', {'child': child, 'parent': parent, 'objects': objects, 'first_object': first_object, 'rows': rows})
+        cursor.execute('ANALYZE django_approval_approval')
@@ -1,29 +1,57 @@
-from urllib.parse import urlencode
+from functools import lru_cache
+from urllib.parse import quote, urlencode
 
 from django.apps import apps
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin import SimpleListFilter
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import unquote
+from django.contrib.admin.views.main import ERROR_FLAG, IGNORED_PARAMS, PAGE_VAR, ChangeList
 from django.contrib.contenttypes.admin import GenericInlineModelAdmin
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db.models import Count
+from django.dispatch import receiver
 from django.shortcuts import redirect
-from django.urls import reverse, resolve
+from django.urls import NoReverseMatch, get_script_prefix, get_urlconf, reverse, resolve
+from django.utils.http import RFC3986_SUBDELIMS
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
 
-from django_approval.models import Approval
-from django_approval.choices import Status, Action
+from django_approval.cache import get_content_type_ids
+from django_approval.conf import get_setting
+from django_approval.exceptions import ApprovalError
+from django_approval.models import Approval, ApprovalArchive, ApprovalChangeset, ApprovalJob
+from django_approval.paginator import CURSOR_VAR, KEYSET_ORDERING, ApprovalPaginator, parse_cursor
+from django_approval.choices import Status, Action, Decision, JobState
 from django_approval import forms
 
 APPROVE_NAME = 'approve'
 REJECT_NAME = 'reject'
+# characters that reverse() leaves unquoted in arguments
+URL_SAFE = RFC3986_SUBDELIMS + '/~:@'
 
 
-def get_admin_name(model, name):
+# stands in for a url argument when a url is reversed as a template
+URL_PLACEHOLDER = '~approval-url-{}~'
+
+
+def get_model(model):
     if isinstance(model, str):
         app_name, model_name = model.split('.')
         model = apps.get_model(app_name, model_name)
+    # instances and classes are both keyed on the class
+    return model._meta.model
+
 
+def get_admin_name(model, name):
+    return _get_admin_name(get_model(model), name)
+
+
+@lru_cache(maxsize=None)
+def _get_admin_name(model, name):
     name = '{}_{}_{}'.format(
         model._meta.app_label,
         model._meta.model_name,
@@ -32,13 +60,44 @@ def get_admin_name(model, name):
     return name
 
 
-def reverse_admin_name(model, name, args=None, kwargs=None, params=None):
-    if isinstance(model, str):
-        app_name, model_name = model.split('.')
-        model = apps.get_model(app_name, model_name)
+@lru_cache(maxsize=None)
+def get_url_template(model, name, arg_count=0, kwarg_names=(), urlconf=None, prefix=None):
+    '''The reversed url with placeholders for the arguments, None when the
+    url patterns do not accept the placeholders'''
+    args = [URL_PLACEHOLDER.format(index) for index in range(arg_count)]
+    kwargs = {key: URL_PLACEHOLDER.format(key) for key in kwarg_names}
+    try:
+        return reverse(
+            'admin:{}'.format(get_admin_name(model, name)),
+            args=args or None, kwargs=kwargs or None, urlconf=urlconf
+        )
+    except NoReverseMatch:
+        return None
 
-    name = get_admin_name(model, name)
-    url = reverse('admin:{}'.format(name), args=args, kwargs=kwargs)
+
+@receiver(setting_changed)
+def clear_url_templates(setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        get_url_template.cache_clear()
+
+
+def reverse_admin_name(model, name, args=None, kwargs=None, params=None):
+    '''Reverses an admin url, the url is only resolved once per model and name
+    and the arguments are filled in afterwards'''
+    model = get_model(model)
+    args = args or ()
+    kwargs = kwargs or {}
+    template = get_url_template(
+        model, name, len(args), tuple(sorted(kwargs)), get_urlconf(), get_script_prefix()
+    )
+    if template is None:
+        url = reverse('admin:{}'.format(get_admin_name(model, name)), args=args, kwargs=kwargs)
+    else:
+        url = template
+        values = dict(enumerate(args))
+        values.update(kwargs)
+        for key, value in values.items():
+            url = url.replace(URL_PLACEHOLDER.format(key), quote(str(value), safe=URL_SAFE))
     if params:
         url = '{url}?{params}'.format(url=url, params=urlencode(params))
     return url
@@ -69,26 +128,29 @@ class ParentApprovalAdmin(admin.ModelAdmin):
         # order is important !!
         return added_urls + urls
 
-    def reject(self, request, *args, **kwargs):
-        pk = kwargs.get('approval_id')
-        obj = Approval.objects.get(pk=pk)
-        obj.reject(user=request.user)
+    def decide(self, request, approval_id, decision):
+        obj = Approval.objects.get(pk=approval_id)
+        try:
+            if obj.decide(decision, user=request.user):
+                self.message_user(request, _('The decision was queued.'))
+        except ApprovalError as error:
+            self.message_user(request, str(error), messages.ERROR)
 
         name = 'admin:' + get_admin_name(self.model, 'change')
         return redirect(name, self.current_pk)
 
-    def approve(self, request, *args, **kwargs):
-        pk = kwargs.get('approval_id')
-        obj = Approval.objects.get(pk=pk)
-        obj.approve(user=request.user)
+    def reject(self, request, *args, **kwargs):
+        return self.decide(request, kwargs.get('approval_id'), Decision.reject)
 
-        name = 'admin:' + get_admin_name(self.model, 'change')
-        return redirect(name, self.current_pk)
+    def approve(self, request, *args, **kwargs):
+        return self.decide(request, kwargs.get('approval_id'), Decision.approve)
 
 
 class ApprovalInlineModelAdmin(GenericInlineModelAdmin):
     formset = forms.ApprovalGenericInlineFormset
     approval_for = None
+    # (inline class, parent model): foreign key name, see get_parent_fk_name
+    _parent_fk_names = {}
     model = Approval
     extra = 0
     readonly_fields = (
@@ -127,45 +189,45 @@ class ApprovalInlineModelAdmin(GenericInlineModelAdmin):
         self.verbose_name_plural = '{} approvals'.format(self.approval_for._meta.model_name)
         self.verbose_name = '{} approval'.format(self.approval_for._meta.model_name)
         super().__init__(*args, **kwargs)
-
-    def get_field_names(self, fields):
-        for field in fields:
-            if field.is_relation and hasattr(field.related_model, 'approvals'):
-                yield (field.related_model, field.remote_field.name)
-
-    def parent_fk_name(self):
-        '''Depends on the method get_queryset'''
-        fields = self.ParentModel._meta.get_fields(include_hidden=True)
-        for model, name in self.get_field_names(fields):
-            if model == self.approval_for:
-                yield name
+        self.ParentModel = self.parent_model
+        self.parent_fk_name = self.get_parent_fk_name(self.parent_model)
+
+    @classmethod
+    def get_parent_fk_name(cls, parent_model):
+        '''The foreign key from approval_for to the parent model.
+
+        It is looked up once per inline class and parent model, the admin
+        checks instantiate the inlines so that happens on start up.
+        '''
+        key = (cls, parent_model)
+        if key not in cls._parent_fk_names:
+            names = [
+                field.name for field in cls.approval_for._meta.get_fields()
+                if field.many_to_one and field.related_model == parent_model
+            ]
+            if not names:
+                msg = '{} has no foreign key to {}'.format(
+                    cls.approval_for.__name__, parent_model.__name__
+                )
+                raise ImproperlyConfigured(msg)
+            cls._parent_fk_names[key] = names[0]
+        return cls._parent_fk_names[key]
 
     def get_queryset(self, request):
-        resolved = resolve(request.path)
-        object_id = resolved.kwargs['object_id']
-        Model = self.approval_for
-
-        # removes the actual name of view
-        app = resolved.url_name.split('_')[:-1]
-
-        # assumption is that there will never be underscores in class names
-        model_name = app[-1]
-        app_name = '_'.join(app[:-1])
-
-        self.ParentModel = apps.get_model(app_name, model_name)
-
-        parent_field_fk = '{}_id'.format(next(self.parent_fk_name()))
-        queryset = Model.objects.filter(**{parent_field_fk: object_id})
-
-        content_type = ContentType.objects.get_for_model(Model)
+        # the url has been resolved by the time the view runs, requests that
+        # did not go through the url resolver are resolved here
+        resolved = request.resolver_match or resolve(request.path_info)
         qs = super().get_queryset(request)
+        if 'object_id' not in resolved.kwargs:
+            # the add view, a new parent has no approvals yet
+            return qs.none()
+        object_id = unquote(resolved.kwargs['object_id'])
+
+        children = self.approval_for._default_manager.filter(**{self.parent_fk_name: object_id})
         # above queryset gives us all approvals, we filter out all approvals
-        # except the ones related to the model in `approval_for`
-        qs = qs.filter(**{
-            self.ct_field: content_type,
-            '{}__in'.format(self.ct_fk_field): queryset,
-        })
-        return qs
+        # except the ones for children of the parent that is being changed
+        qs = qs.for_model(self.approval_for, queryset=children)
+        return qs.with_targets().with_job_state()
 
     def created(self, obj):
         return obj.created
@@ -200,6 +262,8 @@ class ApprovalInlineModelAdmin(GenericInlineModelAdmin):
         ])
         if action_taken:
             return 'Action taken'
+        if getattr(obj, 'job_state', None) == JobState.queued:
+            return 'Queued'
         return link
     approval.short_description = 'Decide'
 
@@ -232,21 +296,25 @@ class Filter(SimpleListFilter):
 
 class ModelFilter(Filter):
     title = _('models')
-    parameter_name = 'model'
+    parameter_name = 'content_type'
 
     def lookups(self, request, model_admin):
-        qs = (
-            Approval.objects
-            .all().values_list('content_type__model', flat=True)
-            .distinct()
-        )
-
-        return [(None, 'All')] + [(value, value.title()) for value in qs]
+        lookups = [(None, 'All')]
+        for pk in get_content_type_ids():
+            try:
+                content_type = ContentType.objects.get_for_id(pk)
+            except ContentType.DoesNotExist:
+                # removed since the ids were cached
+                continue
+            lookups.append((str(content_type.pk), content_type.app_labeled_name))
+        return lookups
 
     def queryset(self, request, queryset):
         if self.value() is None:
             return queryset
-        return queryset.filter(content_type__model=self.value())
+        if not self.value().isdigit():
+            raise IncorrectLookupParameters('Invalid content type: {}'.format(self.value()))
+        return queryset.filter(content_type_id=self.value())
 
 
 class StatusFilter(Filter):
@@ -265,21 +333,70 @@ class ActionFilter(Filter):
         return tuple([(None, 'All')]) + Action.choices
 
 
+class ApprovalChangeList(ChangeList):
+    '''Pages through the approvals with the cursors of ApprovalPaginator.
+
+    Changing the filters or the ordering starts at the first page again.
+    '''
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        return super().get_query_string(new_params, list(remove or []) + [CURSOR_VAR])
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_page_url = None
+        self.first_page_url = self.get_query_string(remove=[PAGE_VAR]) if CURSOR_VAR in request.GET else None
+        if self.show_all and self.can_show_all:
+            return
+        if self.paginator.keyset:
+            page = self.paginator.page(1)
+            self.result_list = page.object_list
+            if page.next_cursor:
+                self.next_page_url = self.get_query_string({CURSOR_VAR: page.next_cursor}, [PAGE_VAR])
+        elif self.paginator.estimated and not self.multi_page:
+            # an estimate can be too low, the list is still limited to a page
+            self.result_list = self.paginator.page(1).object_list
+
+
 @admin.register(Approval)
 class ApprovalModelAdmin(admin.ModelAdmin):
     '''
     When clicking approve or reject. We know which approval object that we should
     update from. But when the approval object is in "update", there may be
-    several "updates" that are conflicting for target object.
+    several "updates" that are conflicting for target object. The conflicts
+    column shows how many other pending approvals there are for the object,
+    approving an update rejects the older pending updates.
 
-    Should be able to approve several models in one go.
+    Selected approvals can be approved or rejected in one go through the
+    admin actions.
+
+    The list is paged by keyset, newest first, and is only counted exactly
+    when the filters are served by an index, see ApprovalPaginator.
     '''
+    actions = ['approve_selected', 'reject_selected']
+    ordering = KEYSET_ORDERING
+    paginator = ApprovalPaginator
+    show_full_result_count = False
+    # the filter combinations an index covers, other lists are estimated
+    counted_filters = (
+        frozenset(['content_type']),
+        frozenset(['content_type', 'status']),
+        frozenset(['status']),
+        frozenset(['status', 'action']),
+    )
     list_filter = [ModelFilter, ActionFilter, StatusFilter]
     list_display = [
         '__str__',
         'author',
         'action',
         'status',
+        'conflicts',
+        'job_state',
     ]
     readonly_fields = [
         'created',
@@ -287,7 +404,8 @@ class ApprovalModelAdmin(admin.ModelAdmin):
         'content_type',
         'action',
         'status',
-        'author'
+        'author',
+        'diff_html',
     ]
     fieldsets = (
         (None, {
@@ -295,14 +413,135 @@ class ApprovalModelAdmin(admin.ModelAdmin):
                 ('created', 'content_type', 'content_object'),
                 ('action', 'status'),
                 ('comment', 'author'),
+                'diff_html',
             )
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_targets().with_job_state().with_conflicts()
+
+    def get_changelist(self, request, **kwargs):
+        return ApprovalChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        lookups = frozenset(request.GET).difference(IGNORED_PARAMS, [PAGE_VAR, ERROR_FLAG, CURSOR_VAR])
+        try:
+            cursor = parse_cursor(request.GET[CURSOR_VAR]) if CURSOR_VAR in request.GET else None
+        except ValueError:
+            raise IncorrectLookupParameters
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            cursor=cursor,
+            # the changelist repeats the default ordering after the sorted columns
+            keyset=tuple(queryset.query.order_by[:len(KEYSET_ORDERING)]) == KEYSET_ORDERING,
+            estimate=lookups not in self.counted_filters,
+        )
+
     def content_object(self, obj):
         return obj.content_object
     content_object.short_description = 'Object'
 
+    def conflicts(self, obj):
+        return obj.conflicts
+    conflicts.short_description = _('Conflicts')
+    conflicts.admin_order_field = 'conflicts'
+
+    def job_state(self, obj):
+        return JobState.values.get(obj.job_state, '-')
+    job_state.short_description = _('Queue')
+
+    def has_add_permission(self, request):
+        return False
+
+    def _message_report(self, request, report, verb):
+        failed = [result for result in report if result.error]
+        done = len(report) - len(failed)
+        self.message_user(request, _('{} approvals were {}.').format(done, verb))
+        if failed:
+            msg = _('{} approvals could not be {}.').format(len(failed), verb)
+            self.message_user(request, msg, level=messages.ERROR)
+
+    def _decide_selected(self, request, queryset, decision, verb):
+        if get_setting('ASYNC'):
+            jobs = queryset.enqueue(decision, user=request.user)
+            self.message_user(request, _('{} decisions were queued.').format(len(jobs)))
+            return
+        report = getattr(queryset, decision)(user=request.user)
+        self._message_report(request, report, verb)
+
+    def approve_selected(self, request, queryset):
+        self._decide_selected(request, queryset, Decision.approve, _('approved'))
+    approve_selected.short_description = _('Approve selected approvals')
+
+    def reject_selected(self, request, queryset):
+        self._decide_selected(request, queryset, Decision.reject, _('rejected'))
+    reject_selected.short_description = _('Reject selected approvals')
+
+
+@admin.register(ApprovalChangeset)
+class ApprovalChangesetAdmin(admin.ModelAdmin):
+    '''All approvals of a changeset are approved or rejected together'''
+    actions = ['approve_selected', 'reject_selected']
+    list_display = ['__str__', 'author', 'status', 'approval_count', 'created']
+    list_filter = ['status']
+    list_select_related = ['author']
+    readonly_fields = ['author', 'status', 'created', 'modified']
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(approval_count=Count('approvals'))
+
+    def approval_count(self, obj):
+        return obj.approval_count
+    approval_count.short_description = _('Approvals')
+    approval_count.admin_order_field = 'approval_count'
+
+    def _decide_selected(self, request, queryset, decision, verb):
+        done = 0
+        for changeset in queryset.filter(status=Status.none).order_by('pk'):
+            try:
+                changeset.decide(decision, user=request.user)
+            except ApprovalError as error:
+                self.message_user(request, '{}: {}'.format(changeset, error), messages.ERROR)
+            else:
+                done += 1
+        self.message_user(request, _('{} changesets were {}.').format(done, verb))
+
+    def approve_selected(self, request, queryset):
+        self._decide_selected(request, queryset, Decision.approve, _('approved'))
+    approve_selected.short_description = _('Approve selected changesets')
+
+    def reject_selected(self, request, queryset):
+        self._decide_selected(request, queryset, Decision.reject, _('rejected'))
+    reject_selected.short_description = _('Reject selected changesets')
+
+
+@admin.register(ApprovalArchive)
+class ApprovalArchiveAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'author', 'action', 'status', 'modified', 'archived']
+    list_filter = ['status', 'action']
+    list_select_related = ['content_type', 'author']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('source', 'diff')
+
+
+@admin.register(ApprovalJob)
+class ApprovalJobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'decision', 'state', 'attempts', 'user', 'modified']
+    list_filter = ['state', 'decision']
+    list_select_related = ['user']
+    readonly_fields = ['approval', 'decision', 'state', 'user', 'attempts', 'error', 'created', 'modified']
+
     def has_add_permission(self, request):
         return False
 
@@ -5,3 +5,6 @@ from django.apps import AppConfig
 class DjangoApprovalConfig(AppConfig):
     name = 'django_approval'
     verbose_name = 'Django Approval'
+
+    def ready(self):
+        from . import receivers  # noqa
@@ -0,0 +1,37 @@
+from functools import partial
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+CONTENT_TYPES_KEY = 'django_approval:content_types'
+
+
+def get_content_type_ids():
+    '''The ids of the content types that have approvals, cached until invalidated'''
+    content_type_ids = cache.get(CONTENT_TYPES_KEY)
+    if content_type_ids is None:
+        Approval = apps.get_model('django_approval', 'Approval')
+        content_type_ids = sorted(
+            Approval._base_manager.order_by().values_list('content_type', flat=True).distinct()
+        )
+        cache.set(CONTENT_TYPES_KEY, content_type_ids, None)
+    return content_type_ids
+
+
+def invalidate_content_type_ids(content_type_ids=None, using=None):
+    '''Drops the cache once the transaction commits, unless all of
+    content_type_ids are in it already.
+
+    Dropped earlier, the cache could be filled again with the rows of a
+    transaction that is then rolled back, and the entry never expires.
+    '''
+    transaction.on_commit(partial(_invalidate, content_type_ids), using=using)
+
+
+def _invalidate(content_type_ids):
+    if content_type_ids is not None:
+        cached = cache.get(CONTENT_TYPES_KEY)
+        if cached is None or set(content_type_ids).issubset(cached):
+            return
+    cache.delete(CONTENT_TYPES_KEY)
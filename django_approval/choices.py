@@ -13,3 +13,20 @@ class Status(DjangoChoices):
     approved = ChoiceItem('approved', _('Approved'))
     rejected = ChoiceItem('rejected', _('Rejected'))
     none = ChoiceItem('', _('No action taken'))
+
+
+class Decision(DjangoChoices):
+    approve = ChoiceItem('approve', _('Approve'))
+    reject = ChoiceItem('reject', _('Reject'))
+
+
+class JobState(DjangoChoices):
+    queued = ChoiceItem('queued', _('Queued'))
+    applied = ChoiceItem('applied', _('Applied'))
+    failed = ChoiceItem('failed', _('Failed'))
+
+
+class Event(DjangoChoices):
+    requested = ChoiceItem('requested', _('Requested'))
+    approved = ChoiceItem('approved', _('Approved'))
+    rejected = ChoiceItem('rejected', _('Rejected'))
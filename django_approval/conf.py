@@ -0,0 +1,28 @@
+from django.conf import settings
+
+DEFAULTS = {
+    # number of approvals handled per bulk statement
+    'BATCH_SIZE': 500,
+    # queue decisions made in the admin for the approval_worker command
+    'ASYNC': False,
+    # days to keep decided approvals before archive_approvals moves them,
+    # {'default': {'approved': 90}, 'app_label.model': {'rejected': 30}}
+    'RETENTION': {},
+    # reject older pending updates of an object when an update is approved
+    'SUPERSEDE': True,
+    # write approval events to ApprovalEvent for flush_approval_events instead
+    # of sending the signals when the transaction commits
+    'OUTBOX': False,
+    # ApprovalPolicy keyword arguments per model, keyed like RETENTION
+    'POLICIES': {},
+    # seconds the groups and permissions of a user are cached for the policies
+    'POLICY_TTL': 300,
+    # sources of more than this many bytes of json are stored compressed,
+    # None stores them as they are
+    'COMPRESS_THRESHOLD': None,
+}
+
+
+def get_setting(name):
+    '''Settings for the app are prefixed with APPROVAL_ in the django settings'''
+    return getattr(settings, 'APPROVAL_{}'.format(name), DEFAULTS[name])
@@ -0,0 +1,10 @@
+class ApprovalError(ValueError):
+    '''An approval could not be decided'''
+
+
+class AlreadyDecided(ApprovalError):
+    '''The approval was approved or rejected by someone else in the meantime'''
+
+
+class StaleApproval(ApprovalError):
+    '''The target object changed after the approval was made'''
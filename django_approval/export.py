@@ -0,0 +1,57 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# the columns of an exported approval, content_type is exported as app_label.model
+EXPORT_FIELDS = (
+    'id',
+    'created',
+    'modified',
+    'content_type',
+    'object_id',
+    'action',
+    'status',
+    'comment',
+    'author_id',
+    'source',
+    'diff',
+)
+FORMATS = ('jsonl', 'csv')
+
+
+def dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+class JSONLinesWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(dumps(row) + '\n')
+
+
+class CSVWriter:
+    '''Writes the header with the first row, source is written as json'''
+
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS)
+        self.has_header = False
+
+    def write(self, row):
+        if not self.has_header:
+            self.writer.writeheader()
+            self.has_header = True
+        row['source'] = dumps(row['source'])
+        row['created'] = row['created'].isoformat()
+        row['modified'] = row['modified'].isoformat()
+        self.writer.writerow(row)
+
+
+def get_writer(format, stream):
+    if format not in FORMATS:
+        raise ValueError('Unknown export format: {}'.format(format))
+    if format == 'csv':
+        return CSVWriter(stream)
+    return JSONLinesWriter(stream)
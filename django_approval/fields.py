@@ -0,0 +1,41 @@
+import base64
+import json
+import zlib
+
+from django.db import models
+
+from .conf import get_setting
+
+# a compressed value is stored as {COMPRESSED_KEY: base64 of the zlib compressed json}
+COMPRESSED_KEY = '__zlib__'
+
+
+def compress(value, encoder=None):
+    dumped = json.dumps(value, cls=encoder, separators=(',', ':')).encode('utf-8')
+    return {COMPRESSED_KEY: base64.b64encode(zlib.compress(dumped)).decode('ascii')}
+
+
+def decompress(value):
+    if isinstance(value, dict) and len(value) == 1 and COMPRESSED_KEY in value:
+        return json.loads(zlib.decompress(base64.b64decode(value[COMPRESSED_KEY])))
+    return value
+
+
+class SourceField(models.JSONField):
+    '''
+    A JSONField that compresses values of more than APPROVAL_COMPRESS_THRESHOLD
+    bytes of json, compressed values are decompressed when they are loaded.
+
+    The database cannot look into compressed values, ApprovalQueryset.changing
+    does not find them.
+    '''
+
+    def get_prep_value(self, value):
+        threshold = get_setting('COMPRESS_THRESHOLD')
+        if threshold and value is not None and not isinstance(value, str):
+            if len(json.dumps(value, cls=self.encoder, separators=(',', ':'))) > threshold:
+                value = compress(value, self.encoder)
+        return super().get_prep_value(value)
+
+    def from_db_value(self, value, expression, connection):
+        return decompress(super().from_db_value(value, expression, connection))
@@ -1,10 +1,25 @@
+import json
+from collections import defaultdict
+
 from django import forms
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.forms import BaseGenericInlineFormSet
-from django.core.serializers import serialize
+from django.db import transaction
+from django.forms.models import BaseInlineFormSet, BaseModelFormSet
+
+from .cache import invalidate_content_type_ids
+from .models import Approval, ApprovalChangeset
+from .choices import Action, Event, Status
+from .policy import need_approval
+from .signals import notify
+from .snapshot import get_snapshot, get_snapshots
+
 
-from .models import Approval
-from .choices import Action, Status
+def get_pks(values):
+    '''The sorted primary keys of objects, or of primary keys'''
+    return sorted(getattr(value, 'pk', value) for value in values or ())
 
 
 class ApprovalGenericInlineFormset(BaseGenericInlineFormSet):
@@ -35,37 +50,182 @@ class FormUsingApproval(forms.ModelForm):
         self.request = kwargs.pop("request", None)
         super().__init__(*args, **kwargs)
 
-    def save(self, commit=True):
-        """can compare initial with cleaned_data
-
-        do a diff of all fields in the dictionary and save the html output
-        the self.initial may contain fewer fields than self.cleaned_data.
-        only compare the fields provided by self.initial
+    def get_diff(self):
+        '''The changed fields as {name: [old, new]}, compared with self.initial.
+
+        Values are compared as they are stored, so a foreign key is compared
+        by its primary key and a many to many field by the list of primary
+        keys, like the python serializer does. Called after validation, when
+        self.instance already holds the new values.
+        '''
+        diff = {}
+        for name in self.changed_data:
+            try:
+                field = self.instance._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.many_to_many:
+                # the relation is only saved with the object, the new values are in cleaned_data
+                diff[name] = [get_pks(self.initial.get(name)), get_pks(self.cleaned_data.get(name))]
+            else:
+                diff[name] = [self.initial.get(name), field.value_from_object(self.instance)]
+        return diff
+
+    def get_changed_fields(self):
+        '''The names of the changed model fields that are stored in a column'''
+        opts = self.instance._meta
+        return [
+            field.name for field in opts.concrete_fields
+            if field.name in self.changed_data and not field.primary_key
+        ]
+
+    def build_approval(self, user=None):
+        '''The unsaved approval for the changes in this form, without a snapshot'''
+        action = Action.update if self.instance.pk else Action.create
+        changed_fields = self.get_changed_fields() if self.instance.pk else []
+        approval = Approval(
+            object_id=self.instance.pk,
+            content_type=ContentType.objects.get_for_model(self.Meta.model),
+            author=user,
+            action=action,
+            status=Status.none,
+            comment='',  # fix this later
+            source=Approval.make_source(self.instance, fields=changed_fields),
+            changed_fields=changed_fields,
+            diff=json.dumps(self.get_diff(), cls=DjangoJSONEncoder, separators=(',', ':'))
+        )
+        approval.payload_hash = approval.get_payload_hash()
+        return approval
 
-        Consider that you might need to be able to compare foreign keys.
+    def save(self, commit=True):
+        """
+        Creates an approval instead of saving the instance, which sends
+        the approval_requested signal.
 
-        A signal should be created when an approval is created.
-        A signal for each type; create, update, delete.
+        An unchanged existing object is returned as it is. When the author
+        already has a pending approval for the same change that approval is
+        returned instead of making another one.
         """
+        if self.instance.pk and not self.has_changed():
+            # nothing is saved, but the admin calls save_m2m after save(commit=False)
+            self.save_m2m = lambda: None
+            return self.instance
 
-        # make a diff to figure out if there is a change.
-        # if we don't have a pk for instance it's definitely a new
         user = getattr(self.request, 'user', None)
-
-        content_type = ContentType.objects.get_for_model(self.Meta.model)
-        action = Action.update if self.instance.pk else Action.create
-        source = serialize('json', [self.instance])
-
-        if self.Meta.model.need_approval(user):
-            approval = Approval.objects.create(
-                object_id=self.instance.pk,
-                content_type=content_type,
-                author=user,
-                action=action,
-                status=Status.none,
-                comment='',  # fix this later
-                source=source,
-                diff=''
-            )
+        fields = self.get_changed_fields() if self.instance.pk else None
+
+        if need_approval(self.Meta.model, user, fields=fields):
+            approval = self.build_approval(user)
+            if approval.author_id:
+                duplicate = Approval.objects.all().duplicates(approval).first()
+                if duplicate is not None:
+                    self.instance = duplicate
+                    self.save_m2m = lambda: None
+                    return duplicate
+            if approval.action == Action.update:
+                # the stored row, self.instance already holds the new values
+                approval.snapshot = get_snapshot(
+                    self.Meta.model, approval.object_id, fields=approval.changed_fields
+                )
+            approval.save()
             self.instance = approval
         return super().save(commit=commit)
+
+
+class ChangesetFormSetMixin:
+    '''
+    Saving the formset makes one ApprovalChangeset with an approval for every
+    changed, added or deleted form, the approvals are inserted with a single
+    statement. The forms need to be FormUsingApproval forms.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.request = kwargs.pop('request', None)
+        super().__init__(*args, **kwargs)
+        self.changeset = None
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['request'] = self.request
+        return kwargs
+
+    def build_approvals(self, user=None):
+        '''The approvals of the forms, and the forms of updates that need no approval'''
+        deleted = self.deleted_forms if self.can_delete else []
+        approvals, exempt = [], []
+        for form in self.forms:
+            if form not in deleted and form.instance.pk and form.has_changed():
+                if not need_approval(self.model, user, fields=form.get_changed_fields()):
+                    exempt.append(form)
+                    continue
+            if form in deleted:
+                if form.instance.pk:
+                    approval = Approval(
+                        object_id=form.instance.pk,
+                        content_type=ContentType.objects.get_for_model(self.model),
+                        author=user,
+                        action=Action.delete,
+                        status=Status.none,
+                        source=Approval.make_source(form.instance),
+                        diff='',
+                    )
+                    approval.payload_hash = approval.get_payload_hash()
+                    approvals.append(approval)
+            elif form.has_changed():
+                approvals.append(form.build_approval(user))
+        return approvals, exempt
+
+    def set_snapshots(self, approvals):
+        '''Snapshots of the updated objects, one query per set of changed fields'''
+        by_fields = defaultdict(list)
+        for approval in approvals:
+            if approval.action == Action.update:
+                by_fields[tuple(approval.changed_fields)].append(approval)
+        for fields, members in by_fields.items():
+            snapshots = get_snapshots(
+                self.model, [approval.object_id for approval in members], fields=fields
+            )
+            for approval in members:
+                approval.snapshot = snapshots.get(approval.object_id, '')
+
+    def save(self, commit=True):
+        '''Returns the approvals of the changeset instead of the saved objects.
+
+        Only the objects of exempt forms are saved, they are the changed objects
+        the admin reads for its change message.
+        '''
+        user = getattr(self.request, 'user', None)
+        if not self.model.need_approval(user):
+            return super().save(commit=commit)
+
+        approvals, exempt = self.build_approvals(user)
+        self.changeset = ApprovalChangeset(author=user)
+        self.new_objects, self.changed_objects, self.deleted_objects = [], [], []
+        if not commit:
+            return approvals
+        for form in exempt:
+            self.changed_objects.append((form.save(), form.changed_data))
+        if not approvals:
+            return approvals
+
+        with transaction.atomic():
+            self.changeset.save()
+            self.set_snapshots(approvals)
+            for approval in approvals:
+                approval.changeset = self.changeset
+            Approval.objects.bulk_create(approvals)
+            pks = [approval.pk for approval in approvals]
+            if None in pks:
+                # the backend does not return the ids of inserted rows
+                pks = list(self.changeset.approvals.values_list('pk', flat=True))
+            invalidate_content_type_ids({approval.content_type_id for approval in approvals})
+            notify(Event.requested, pks, user=user)
+        return approvals
+
+
+class ApprovalModelFormSet(ChangesetFormSetMixin, BaseModelFormSet):
+    pass
+
+
+class ApprovalInlineFormSet(ChangesetFormSetMixin, BaseInlineFormSet):
+    pass
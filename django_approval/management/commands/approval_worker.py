@@ -0,0 +1,68 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from django_approval.models import ApprovalJob
+
+
+class Command(BaseCommand):
+    help = 'Applies the approve and reject decisions that are queued as approval jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Number of threads that process jobs, each with its own connection.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Number of jobs claimed per transaction.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='Seconds to wait before polling an empty queue again.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit as soon as the queue is empty.'
+        )
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        if options['concurrency'] == 1:
+            processed = self.work(options)
+            self.stdout.write('Processed {} jobs'.format(processed))
+            return
+
+        threads = [
+            threading.Thread(target=self.work_in_thread, args=(options,))
+            for _ in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, options):
+        processed = 0
+        while not self.stop.is_set():
+            count = ApprovalJob.objects.process(limit=options['batch_size'])
+            processed += count
+            if count:
+                continue
+            if options['once']:
+                break
+            self.stop.wait(options['sleep'])
+        return processed
+
+    def work_in_thread(self, options):
+        try:
+            processed = self.work(options)
+            self.stdout.write('Processed {} jobs'.format(processed))
+        finally:
+            connection.close()
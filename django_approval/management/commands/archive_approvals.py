@@ -0,0 +1,45 @@
+import gzip
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from django_approval.models import Approval
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves decided approvals that are past their retention, see APPROVAL_RETENTION, '
+        'to the approval archive table or to a compressed jsonl file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Archive everything decided more than this many days ago, ignores the policy.'
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--output',
+            help='Append to this gzipped jsonl file instead of the archive table.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the approvals that would be archived.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            qs = Approval.objects.all().expired(days=options['days']).archivable()
+        except (ValueError, TypeError, ContentType.DoesNotExist) as error:
+            raise CommandError('Invalid APPROVAL_RETENTION: {}'.format(error))
+
+        if options['dry_run']:
+            self.stdout.write('{} approvals would be archived'.format(qs.count()))
+            return
+
+        if options['output']:
+            with gzip.open(options['output'], 'at') as stream:
+                count = qs.archive(batch_size=options['batch_size'], stream=stream)
+        else:
+            count = qs.archive(batch_size=options['batch_size'])
+        self.stdout.write('Archived {} approvals'.format(count))
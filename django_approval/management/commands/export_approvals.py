@@ -0,0 +1,78 @@
+import gzip
+import sys
+from datetime import datetime, time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from django_approval.choices import Action, Status
+from django_approval.export import FORMATS
+from django_approval.models import Approval
+
+# Status.none is an empty string which is awkward on the command line
+STATUSES = {'pending': Status.none, 'approved': Status.approved, 'rejected': Status.rejected}
+
+
+class Command(BaseCommand):
+    help = 'Exports the approval history as jsonl or csv without loading it into memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='File to write to, - for stdout.')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--content-type', action='append', default=[],
+            help='app_label.model to export, can be given several times.'
+        )
+        parser.add_argument('--status', choices=sorted(STATUSES))
+        parser.add_argument('--action', choices=sorted(Action.values))
+        parser.add_argument('--created-after', help='Date or datetime, inclusive.')
+        parser.add_argument('--created-before', help='Date or datetime, exclusive.')
+
+    def get_queryset(self, options):
+        qs = Approval.objects.all()
+        if options['content_type']:
+            content_types = [self.get_content_type(value) for value in options['content_type']]
+            qs = qs.filter(content_type__in=content_types)
+        if options['status']:
+            qs = qs.filter(status=STATUSES[options['status']])
+        if options['action']:
+            qs = qs.filter(action=options['action'])
+        if options['created_after']:
+            qs = qs.filter(created__gte=self.parse_moment(options['created_after']))
+        if options['created_before']:
+            qs = qs.filter(created__lt=self.parse_moment(options['created_before']))
+        return qs
+
+    def get_content_type(self, value):
+        try:
+            app_label, model = value.lower().split('.')
+            return ContentType.objects.get_by_natural_key(app_label, model)
+        except (ValueError, ContentType.DoesNotExist):
+            raise CommandError('Unknown content type: {}'.format(value))
+
+    def parse_moment(self, value):
+        moment = parse_datetime(value)
+        if moment is None and parse_date(value):
+            moment = datetime.combine(parse_date(value), time.min)
+        if moment is None:
+            raise CommandError('Not a date or datetime: {}'.format(value))
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def handle(self, *args, **options):
+        qs = self.get_queryset(options)
+        if options['output'] == '-':
+            stream = gzip.open(sys.stdout.buffer, 'wt') if options['gzip'] else self.stdout
+            count = qs.stream_export(stream, options['format'], options['chunk_size'])
+            if options['gzip']:
+                stream.close()
+        else:
+            opener = gzip.open if options['gzip'] else open
+            with opener(options['output'], 'wt', newline='') as stream:
+                count = qs.stream_export(stream, options['format'], options['chunk_size'])
+        self.stderr.write('Exported {} approvals'.format(count))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from django_approval.models import ApprovalEvent
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends the approval signals that are waiting in the outbox, see APPROVAL_OUTBOX, '
+        'until the outbox is empty.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Number of events sent per transaction.'
+        )
+
+    def handle(self, *args, **options):
+        sent = 0
+        while True:
+            count = ApprovalEvent.objects.flush(batch_size=options['batch_size'])
+            if not count:
+                break
+            sent += count
+        self.stdout.write('Sent {} approval events'.format(sent))
@@ -1,30 +1,576 @@
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
 from django.apps import apps
-from django.db import models
+
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from .choices import Action, Event, JobState, Status
+from .cache import invalidate_content_type_ids
+from .conf import get_setting
+from .export import EXPORT_FIELDS, get_writer
+from .signals import SIGNALS, notify
+from .snapshot import bump_version, get_snapshots
+
+# one row in the report returned by ApprovalQueryset.approve / reject
+ApprovalResult = namedtuple(
+    'ApprovalResult', ['approval_id', 'action', 'status', 'object_id', 'error']
+)
 
 
 class ApprovalQueryset(models.QuerySet):
     def for_model(self, model, queryset=None):
-        if queryset is None:
-            queryset = model.objects.all()
+        '''Approvals for model, optionally limited to the objects in queryset.
+
+        The objects in queryset are matched with a correlated EXISTS which the
+        database can turn into a semi join, rather than an IN over the whole
+        target table.
+        '''
+        # get_for_model is served from the content type cache after first use
         content_type = ContentType.objects.get_for_model(model)
-        # it would be preferable to do a join here if possible
+        approvals = self.filter(content_type=content_type)
+        if queryset is None:
+            return approvals
+        targets = queryset.filter(pk=OuterRef('object_id')).values('pk')
+        return approvals.annotate(has_target=Exists(targets)).filter(has_target=True)
+
+    def pending(self):
+        return self.filter(status=Status.none)
+
+    def duplicates(self, approval):
+        '''Pending approvals by the same author that make the same change as approval.
+
+        Matched on payload_hash, which is served by the partial index
+        approval_payload_idx.
+        '''
         return self.filter(
-            content_type__pk=content_type.pk, object_id__in=queryset
+            status=Status.none, payload_hash=approval.payload_hash, author_id=approval.author_id
+        ).exclude(pk=approval.pk)
+
+    def changing(self, **values):
+        '''Approvals that set the given fields to the given values.
+
+        Matched on source within the database, with a containment where the
+        backend has one. On PostgreSQL that is served by a GIN index.
+        '''
+        if connections[self.db].features.supports_json_field_contains:
+            return self.filter(source__contains={'fields': values})
+        return self.filter(**{'source__fields__{}'.format(name): value for name, value in values.items()})
+
+    def with_job_state(self):
+        '''Annotates job_state, the state of the latest queued decision'''
+        Job = self.model._meta.get_field('jobs').related_model
+        jobs = Job.objects.filter(approval=OuterRef('pk')).order_by('-pk')
+        return self.annotate(job_state=Subquery(jobs.values('state')[:1]))
+
+    def with_conflicts(self):
+        '''Annotates conflicts, the number of other pending approvals for the same object.
+
+        Only pending approvals for existing objects can conflict, the lookup of
+        the others is served by the partial index approval_pending_idx.
+        '''
+        others = (
+            self.model._base_manager
+            .filter(
+                content_type=OuterRef('content_type'),
+                object_id=OuterRef('object_id'),
+                status=Status.none,
+            )
+            .exclude(pk=OuterRef('pk'))
+            .order_by()
+            .values('content_type')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        return self.annotate(conflicts=Case(
+            When(
+                status=Status.none,
+                object_id__isnull=False,
+                then=Coalesce(Subquery(others, output_field=models.IntegerField()), 0),
+            ),
+            default=Value(0),
+            output_field=models.IntegerField(),
+        ))
+
+    def conflicting(self):
+        return self.with_conflicts().filter(conflicts__gt=0)
+
+    def supersede(self, user=None):
+        '''Rejects the pending updates that are older than an approval in the
+        queryset for the same object. Returns the ids of the rejected approvals.
+
+        The older updates are locked first, one that was decided by someone
+        else in the meantime is left alone.
+        '''
+        newer = self.model._base_manager.filter(
+            pk__in=self.values('pk'),
+            content_type=OuterRef('content_type'),
+            object_id=OuterRef('object_id'),
+            created__gt=OuterRef('created'),
         )
+        pending = self.model._base_manager.using(self.db).filter(status=Status.none)
+        with transaction.atomic(using=self.db):
+            # the targets of the queryset bound the candidates to approval_pending_idx,
+            # instead of every pending update in the table
+            superseded = list(
+                pending.select_for_update()
+                .filter(action=Action.update, object_id__isnull=False)
+                .filter(content_type__in=self.values('content_type'), object_id__in=self.values('object_id'))
+                .annotate(superseded=Exists(newer))
+                .filter(superseded=True)
+                .order_by('pk')
+                .values_list('pk', flat=True)
+            )
+            pending.filter(pk__in=superseded).update(status=Status.rejected, modified=timezone.now())
+            notify(Event.rejected, superseded, user=user, using=self.db)
+        return superseded
+
+    def enqueue(self, decision, user=None):
+        '''Queues a decision for every pending approval, see ApprovalJob'''
+        Job = self.model._meta.get_field('jobs').related_model
+        jobs = [
+            Job(approval_id=pk, decision=decision, user=user)
+            for pk in self.pending().values_list('pk', flat=True)
+        ]
+        return Job.objects.bulk_create(jobs, batch_size=get_setting('BATCH_SIZE'))
+
+    def stream_export(self, stream, format='jsonl', chunk_size=2000):
+        '''Writes the approvals to a text stream as jsonl or csv, row by row.
+
+        Rows are read with a server side cursor where the database supports
+        it, so memory use does not depend on the number of approvals.
+        Returns the number of exported approvals.
+        '''
+        writer = get_writer(format, stream)
+        fields = [field for field in EXPORT_FIELDS if field != 'content_type']
+        rows = (
+            self.order_by('pk')
+            .values(*fields, app_label=F('content_type__app_label'), model=F('content_type__model'))
+            .iterator(chunk_size=chunk_size)
+        )
+        count = 0
+        for row in rows:
+            row['content_type'] = '{}.{}'.format(row.pop('app_label'), row.pop('model'))
+            writer.write({field: row[field] for field in EXPORT_FIELDS})
+            count += 1
+        return count
+
+    def expired(self, days=None):
+        '''Decided approvals that are past their retention, see APPROVAL_RETENTION.
+
+        The policy maps a content type, or 'default', to the number of days a
+        status is kept after the decision. With days the policy is ignored.
+        '''
+        decided = self.exclude(status=Status.none)
+        now = timezone.now()
+        if days is not None:
+            return decided.filter(modified__lt=now - timedelta(days=days))
+
+        policy = get_setting('RETENTION')
+        default = policy.get('default', {})
+        conditions = models.Q()
+        listed = []
+        for label, statuses in policy.items():
+            if label == 'default':
+                continue
+            content_type = ContentType.objects.get_by_natural_key(*label.lower().split('.'))
+            listed.append(content_type.pk)
+            for status, keep in dict(default, **statuses).items():
+                if keep is not None:
+                    conditions |= models.Q(
+                        content_type=content_type, status=status, modified__lt=now - timedelta(days=keep)
+                    )
+        for status, keep in default.items():
+            if keep is not None:
+                conditions |= models.Q(
+                    status=status, modified__lt=now - timedelta(days=keep)
+                ) & ~models.Q(content_type__in=listed)
+
+        if not conditions:
+            return self.none()
+        return decided.filter(conditions)
+
+    def archivable(self):
+        '''The decided approvals without events that flush_approval_events has
+        yet to send, archiving would delete those events'''
+        ApprovalEvent = apps.get_model('django_approval', 'ApprovalEvent')
+        unsent = ApprovalEvent.objects.filter(approval=OuterRef('pk'))
+        return self.exclude(status=Status.none).exclude(Exists(unsent))
+
+    def archive(self, batch_size=None, stream=None):
+        '''Moves the archivable approvals to ApprovalArchive, or to stream as
+        jsonl with the columns of ApprovalArchive.
+
+        Every batch is moved in its own short transaction which only locks the
+        rows of that batch, rows locked by others are skipped. An interrupted
+        run can be started again and continues where it stopped. Returns the
+        number of archived approvals.
+        '''
+        Archive = apps.get_model('django_approval', 'ApprovalArchive')
+        batch_size = batch_size or get_setting('BATCH_SIZE')
+        decided = self.select_related(None).defer(None).archivable().order_by('pk')
+        fields = [field.attname for field in self.model._meta.concrete_fields]
+        writer = None if stream is None else get_writer('jsonl', stream)
+        archived = 0
+        while True:
+            with transaction.atomic(using=self.db):
+                batch = list(decided.select_for_update(skip_locked=True)[:batch_size])
+                if not batch:
+                    break
+                rows = [{name: getattr(approval, name) for name in fields} for approval in batch]
+                if writer is None:
+                    Archive.objects.using(self.db).bulk_create(
+                        [Archive(**row) for row in rows], ignore_conflicts=True
+                    )
+                else:
+                    for row in rows:
+                        writer.write(row)
+                self.model._base_manager.using(self.db).filter(
+                    pk__in=[approval.pk for approval in batch]
+                ).delete()
+                archived += len(batch)
+        # the archived approvals may have been the last ones of a content type
+        if archived:
+            invalidate_content_type_ids(using=self.db)
+        return archived
+
+    def without_payload(self):
+        '''Defers source and diff, which lists do not show. They are loaded when
+        they are accessed.'''
+        return self.defer('source', 'diff')
+
+    def with_targets(self):
+        '''Resolves content_object for all approvals with one query per content
+        type, for lists, so without the payload'''
+        return self.without_payload().select_related('content_type', 'author').prefetch_related('content_object')
+
+    def _batches(self, batch_size, fields=None):
+        '''Yields the pending approvals in chunks of batch_size, or the values
+        of fields when they are given.
+
+        The rows of a chunk are locked, approvals that were decided by someone
+        else while waiting for the lock drop out.
+        '''
+        pks = list(self.pending().order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            chunk = pks[start:start + batch_size]
+            locked = self.model._base_manager.using(self.db).select_for_update().filter(
+                pk__in=chunk, status=Status.none
+            ).order_by('pk')
+            yield list(locked.values_list(*fields) if fields else locked)
+
+    def approve(self, user=None, batch_size=None):
+        '''Approves every pending approval in the queryset with set based writes.
+
+        Approvals are grouped by content type and action, each group is
+        applied to the target model with one bulk statement per batch. Returns
+        a list of ApprovalResult, one for each pending approval.
+        '''
+        batch_size = batch_size or get_setting('BATCH_SIZE')
+        supersede = get_setting('SUPERSEDE')
+        report = []
+        older = []
+        with transaction.atomic(using=self.db):
+            for batch in self._batches(batch_size):
+                if supersede:
+                    batch, skipped = self._latest_updates(batch)
+                    older.extend(skipped)
+                report.extend(self._approve_batch(batch, batch_size, user))
+            if supersede:
+                report.extend(self._supersede_report(report, older, batch_size, user))
+        return report
+
+    def _latest_updates(self, approvals):
+        '''Splits off the updates for which the batch has a newer update of the same object'''
+        latest = {}
+        for approval in approvals:
+            if approval.action == Action.update and approval.object_id:
+                key = (approval.content_type_id, approval.object_id)
+                if key not in latest or latest[key].created < approval.created:
+                    latest[key] = approval
+        kept, older = [], []
+        for approval in approvals:
+            key = (approval.content_type_id, approval.object_id)
+            if approval.action == Action.update and key in latest and latest[key] is not approval:
+                older.append(approval)
+            else:
+                kept.append(approval)
+        return kept, older
+
+    def _supersede_report(self, report, older, batch_size, user):
+        approved = [
+            result.approval_id for result in report
+            if result.action == Action.update and result.error is None
+        ]
+        rejected = set()
+        for start in range(0, len(approved), batch_size):
+            chunk = approved[start:start + batch_size]
+            rejected.update(self.model.objects.using(self.db).filter(pk__in=chunk).supersede(user=user))
+        return [
+            ApprovalResult(approval.pk, approval.action, Status.rejected, approval.object_id, None)
+            if approval.pk in rejected else
+            ApprovalResult(
+                approval.pk, approval.action, approval.status, approval.object_id,
+                'A newer update of the object could not be approved'
+            )
+            for approval in older
+        ]
+
+    def _approve_batch(self, approvals, batch_size, user=None):
+        groups = defaultdict(list)
+        for approval in approvals:
+            groups[(approval.content_type_id, approval.action)].append(approval)
+
+        report = []
+        applied = []
+        now = timezone.now()
+        for (content_type_id, action), members in groups.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            apply = {
+                Action.create: self._bulk_create,
+                Action.update: self._bulk_update,
+                Action.delete: self._bulk_delete,
+            }[action]
+            members, errors = apply(model, members, batch_size)
+            applied.extend(members)
+            report.extend(errors)
+
+        stale = [result.approval_id for result in report if result.status == Status.rejected]
+        self.model._base_manager.using(self.db).filter(pk__in=stale).update(
+            status=Status.rejected, modified=now
+        )
+        notify(Event.rejected, stale, user=user, using=self.db)
+        created = [approval for approval in applied if approval.action == Action.create]
+        for approval in created:
+            approval.status = Status.approved
+            approval.modified = now
+        self.model._base_manager.using(self.db).bulk_update(
+            created, ['object_id', 'status', 'modified'], batch_size=batch_size
+        )
+        # updates keep their object id, deleted targets no longer have one
+        self.model._base_manager.using(self.db).filter(
+            pk__in=[approval.pk for approval in applied if approval.action != Action.create]
+        ).update(
+            status=Status.approved,
+            modified=now,
+            object_id=Case(
+                When(action=Action.delete, then=Value(None)),
+                default=F('object_id'),
+            ),
+        )
+
+        notify(Event.approved, [approval.pk for approval in applied], user=user, using=self.db)
+
+        for approval in applied:
+            object_id = None if approval.action == Action.delete else approval.object_id
+            report.append(ApprovalResult(
+                approval.pk, approval.action, Status.approved, object_id, None
+            ))
+        return report
+
+    def _deserialize(self, approvals):
+        objects, applied, errors = [], [], []
+        for approval in approvals:
+            try:
+                obj = approval.get_source_object()
+            except ValueError as error:
+                errors.append(ApprovalResult(
+                    approval.pk, approval.action, approval.status, approval.object_id, str(error)
+                ))
+                continue
+            objects.append(obj)
+            applied.append(approval)
+        return objects, applied, errors
+
+    def _bulk_create(self, model, approvals, batch_size):
+        objects, applied, errors = self._deserialize(approvals)
+        if connections[self.db].features.can_return_rows_from_bulk_insert:
+            model._base_manager.using(self.db).bulk_create(objects, batch_size=batch_size)
+        else:
+            for obj in objects:
+                obj.save(using=self.db)
+        for approval, obj in zip(applied, objects):
+            approval.object_id = obj.pk
+        return applied, errors
+
+    def _bulk_update(self, model, approvals, batch_size):
+        missing = [approval for approval in approvals if not approval.object_id]
+        errors = [
+            ApprovalResult(
+                approval.pk, approval.action, approval.status, approval.object_id,
+                'Inconsistent state: an update always need an object_id'
+            )
+            for approval in missing
+        ]
+        approvals, stale = self._split_stale(
+            model, [approval for approval in approvals if approval.object_id]
+        )
+        objects, applied, source_errors = self._deserialize(approvals)
+        # one UPDATE per batch for every set of changed fields
+        all_fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        by_fields = defaultdict(list)
+        for approval, obj in zip(applied, objects):
+            obj.pk = approval.object_id
+            bumped = bump_version(model, obj)
+            by_fields[tuple(dict.fromkeys((approval.changed_fields or all_fields) + bumped))].append(obj)
+        for fields, members in by_fields.items():
+            model._base_manager.using(self.db).bulk_update(members, fields, batch_size=batch_size)
+        return applied, errors + stale + source_errors
+
+    def _split_stale(self, model, approvals):
+        '''Splits off the updates of which the target changed since they were made.
+
+        The snapshots of the targets are read, and the targets locked, with one
+        query per set of changed fields. Stale approvals are reported as rejected.
+        '''
+        by_fields = defaultdict(list)
+        for approval in approvals:
+            if approval.snapshot:
+                by_fields[tuple(approval.changed_fields)].append(approval.object_id)
+        snapshots = {
+            (fields, object_id): snapshot
+            for fields, object_ids in by_fields.items()
+            for object_id, snapshot in get_snapshots(
+                model, object_ids, fields=fields, using=self.db, lock=True
+            ).items()
+        }
+        current, stale = [], []
+        for approval in approvals:
+            key = (tuple(approval.changed_fields), approval.object_id)
+            if approval.snapshot and snapshots.get(key) != approval.snapshot:
+                stale.append(ApprovalResult(
+                    approval.pk, approval.action, Status.rejected, approval.object_id,
+                    'The object changed after the approval was made'
+                ))
+            else:
+                current.append(approval)
+        return current, stale
+
+    def _bulk_delete(self, model, approvals, batch_size):
+        object_ids = [approval.object_id for approval in approvals]
+        model._base_manager.using(self.db).filter(pk__in=object_ids).delete()
+        return approvals, []
+
+    def reject(self, user=None, batch_size=None):
+        '''Rejects every pending approval in the queryset, one UPDATE per batch.
+
+        The approvals are locked first, like approve does, so an approval that
+        someone else decided in the meantime keeps its status. Returns a list of
+        ApprovalResult, one for each rejected approval.
+        '''
+        batch_size = batch_size or get_setting('BATCH_SIZE')
+        now = timezone.now()
+        rejected = []
+        with transaction.atomic(using=self.db):
+            for rows in self._batches(batch_size, fields=('pk', 'action', 'object_id')):
+                pks = [pk for pk, _, _ in rows]
+                self.model._base_manager.using(self.db).filter(pk__in=pks, status=Status.none).update(
+                    status=Status.rejected, modified=now
+                )
+                notify(Event.rejected, pks, user=user, using=self.db)
+                rejected.extend(rows)
+        return [
+            ApprovalResult(pk, action, Status.rejected, object_id, None)
+            for pk, action, object_id in rejected
+        ]
 
 
 class ApprovalManager(models.Manager):
     def get_queryset(self):
-        return ApprovalQueryset(self.model, using=self._db)
+        # __str__ needs the content type, and lists almost always show the author
+        return ApprovalQueryset(self.model, using=self._db).select_related('content_type', 'author')
 
     def for_model(self, model, queryset=None):
-        return self.get_queryset().for_model(model=self.model, queryset=queryset)
+        return self.get_queryset().for_model(model=model, queryset=queryset)
 
     def get_object(self, model, object_id):
-        content_type = ContentType.objects.get_for_model(model)
-        Model = apps.get_model(content_type.app_name, content_type.model)
-        return Model.objects.get(pk=object_id)
+        return model._default_manager.get(pk=object_id)
+
+
+class ApprovalJobQueryset(models.QuerySet):
+    def queued(self):
+        return self.filter(state=JobState.queued)
+
+    def process(self, limit=None):
+        '''Claims up to limit queued jobs and applies them.
+
+        Jobs that are locked by another worker are skipped, which lets several
+        workers drain the queue side by side. Returns the number of jobs that
+        were processed.
+        '''
+        limit = limit or get_setting('BATCH_SIZE')
+        with transaction.atomic(using=self.db):
+            jobs = list(
+                self.queued().select_for_update(skip_locked=True, of=('self',))
+                .select_related('approval', 'user').order_by('pk')[:limit]
+            )
+            for job in jobs:
+                self._apply(job)
+            self.model._base_manager.using(self.db).bulk_update(
+                jobs, ['state', 'error', 'attempts', 'modified']
+            )
+        return len(jobs)
+
+    def _apply(self, job):
+        '''Decides the approval of job as the user who queued it, with
+        Approval.approve or reject like the admin does without APPROVAL_ASYNC.
+        Those roll back their own savepoint when they fail.'''
+        try:
+            getattr(job.approval, job.decision)(user=job.user)
+        except Exception as error:
+            self._finish(job, str(error) or repr(error))
+        else:
+            self._finish(job)
+
+    def _finish(self, job, error=None):
+        job.attempts += 1
+        job.state = JobState.failed if error else JobState.applied
+        job.error = error or ''
+        job.modified = timezone.now()
+
+
+class ApprovalJobManager(models.Manager):
+    def get_queryset(self):
+        return ApprovalJobQueryset(self.model, using=self._db)
+
+    def process(self, limit=None):
+        return self.get_queryset().process(limit=limit)
+
+
+class ApprovalEventQueryset(models.QuerySet):
+    def flush(self, batch_size=None):
+        '''Sends the signals of up to batch_size events and deletes them.
+
+        Events locked by another flush are skipped. When a receiver raises the
+        transaction is rolled back and the events are sent again by the next
+        flush. Returns the number of events that were sent.
+        '''
+        batch_size = batch_size or get_setting('BATCH_SIZE')
+        with transaction.atomic(using=self.db):
+            events = list(
+                self.select_for_update(skip_locked=True, of=('self',)).select_related('approval', 'user')
+                .order_by('pk')[:batch_size]
+            )
+            for event in events:
+                SIGNALS[event.event].send(
+                    sender=type(event.approval), approval=event.approval, user=event.user
+                )
+            self.model._base_manager.using(self.db).filter(
+                pk__in=[event.pk for event in events]
+            ).delete()
+        return len(events)
+
+
+class ApprovalEventManager(models.Manager):
+    def get_queryset(self):
+        return ApprovalEventQueryset(self.model, using=self._db)
+
+    def flush(self, batch_size=None):
+        return self.get_queryset().flush(batch_size=batch_size)
 
 
 class ApprovableQueryset(models.QuerySet):
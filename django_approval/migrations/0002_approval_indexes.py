@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_approval', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='approval',
+            options={'ordering': ('content_type', 'object_id', '-created'), 'verbose_name': 'approval', 'verbose_name_plural': 'approvals'},
+        ),
+        migrations.AddIndex(
+            model_name='approval',
+            index=models.Index(fields=['content_type', 'object_id', '-created'], name='approval_target_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='approval',
+            index=models.Index(condition=models.Q(status=''), fields=['content_type', 'object_id'], name='approval_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='approval',
+            index=models.Index(fields=['status', 'action'], name='approval_status_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_approval', '0002_approval_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('decision', models.CharField(choices=[('approve', 'Approve'), ('reject', 'Reject')], max_length=8)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('applied', 'Applied'), ('failed', 'Failed')], default='queued', max_length=8)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('approval', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='django_approval.approval')),
+                ('user', models.ForeignKey(blank=True, help_text='The user who made the decision', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'approval job',
+                'verbose_name_plural': 'approval jobs',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='approvaljob',
+            index=models.Index(condition=models.Q(state='queued'), fields=['id'], name='approval_job_queued_idx'),
+        ),
+    ]
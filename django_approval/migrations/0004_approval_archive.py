@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:12
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_approval', '0003_approval_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalArchive',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField()),
+                ('modified', models.DateTimeField()),
+                ('object_id', models.PositiveIntegerField(null=True)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=8)),
+                ('status', models.CharField(blank=True, choices=[('approved', 'Approved'), ('rejected', 'Rejected'), ('', 'No action taken')], max_length=8)),
+                ('comment', models.CharField(blank=True, max_length=255)),
+                ('source', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('diff', models.TextField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'archived approval',
+                'verbose_name_plural': 'archived approvals',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_approval', '0004_approval_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='approval',
+            name='snapshot',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='approvalarchive',
+            name='snapshot',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
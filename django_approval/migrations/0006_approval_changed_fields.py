@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_approval', '0005_approval_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='approval',
+            name='changed_fields',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='approvalarchive',
+            name='changed_fields',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
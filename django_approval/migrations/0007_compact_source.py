@@ -0,0 +1,82 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:24
+
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def compact(source, changed_fields):
+    '''The single serialized object, limited to the changed fields'''
+    if isinstance(source, str):
+        try:
+            source = json.loads(source)
+        except ValueError:
+            return None
+    if isinstance(source, list):
+        if len(source) != 1 or not isinstance(source[0], dict):
+            return None
+        source = source[0]
+    if changed_fields and isinstance(source.get('fields'), dict):
+        source['fields'] = {
+            name: value for name, value in source['fields'].items() if name in changed_fields
+        }
+    return source
+
+
+def compact_sources(apps, schema_editor):
+    for name in ('Approval', 'ApprovalArchive'):
+        model = apps.get_model('django_approval', name)
+        manager = model._base_manager.using(schema_editor.connection.alias)
+        changed = []
+        for row in manager.only('source', 'changed_fields').iterator(chunk_size=BATCH_SIZE):
+            source = compact(row.source, row.changed_fields)
+            if source is not None and source != row.source:
+                row.source = source
+                changed.append(row)
+            if len(changed) >= BATCH_SIZE:
+                manager.bulk_update(changed, ['source'])
+                changed = []
+        manager.bulk_update(changed, ['source'])
+
+
+def expand_sources(apps, schema_editor):
+    for name in ('Approval', 'ApprovalArchive'):
+        model = apps.get_model('django_approval', name)
+        manager = model._base_manager.using(schema_editor.connection.alias)
+        changed = []
+        for row in manager.only('source').iterator(chunk_size=BATCH_SIZE):
+            if isinstance(row.source, dict):
+                row.source = [row.source]
+                changed.append(row)
+            if len(changed) >= BATCH_SIZE:
+                manager.bulk_update(changed, ['source'])
+                changed = []
+        manager.bulk_update(changed, ['source'])
+
+
+def add_source_index(apps, schema_editor):
+    # jsonb containment only has an index on PostgreSQL
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX approval_source_idx ON django_approval_approval '
+            'USING gin (source jsonb_path_ops)'
+        )
+
+
+def remove_source_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS approval_source_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_approval', '0006_approval_changed_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_sources, expand_sources),
+        migrations.RunPython(add_source_index, remove_source_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_approval', '0007_compact_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('event', models.CharField(choices=[('requested', 'Requested'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=16)),
+                ('approval', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='django_approval.approval')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'approval event',
+                'verbose_name_plural': 'approval events',
+                'ordering': ('pk',),
+            },
+        ),
+    ]
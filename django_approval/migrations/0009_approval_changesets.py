@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_approval', '0008_approval_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalChangeset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('status', models.CharField(blank=True, choices=[('approved', 'Approved'), ('rejected', 'Rejected'), ('', 'No action taken')], default='', max_length=8)),
+                ('author', models.ForeignKey(blank=True, help_text='The user who authored the changes', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'approval changeset',
+                'verbose_name_plural': 'approval changesets',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddField(
+            model_name='approval',
+            name='changeset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='approvals', to='django_approval.approvalchangeset'),
+        ),
+        migrations.AddField(
+            model_name='approvalarchive',
+            name='changeset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='django_approval.approvalchangeset'),
+        ),
+    ]
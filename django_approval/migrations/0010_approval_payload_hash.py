@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_approval', '0009_approval_changesets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='approval',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='approvalarchive',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='approval',
+            index=models.Index(condition=models.Q(status=''), fields=['payload_hash'], name='approval_payload_idx'),
+        ),
+    ]
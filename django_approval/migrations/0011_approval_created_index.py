@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_approval', '0010_approval_payload_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='approval',
+            index=models.Index(fields=['-created', '-id'], name='approval_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:41
+
+import django.core.serializers.json
+from django.db import migrations
+import django_approval.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_approval', '0011_approval_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='approval',
+            name='source',
+            field=django_approval.fields.SourceField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='The fields as they would be saved.'),
+        ),
+        migrations.AlterField(
+            model_name='approvalarchive',
+            name='source',
+            field=django_approval.fields.SourceField(encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+    ]
@@ -1,25 +1,94 @@
 # -*- coding: utf-8 -*-
-from django.apps import apps
+import hashlib
+import json
+
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models, transaction
 from django.contrib.auth import get_user_model
-from django.contrib.postgres.fields import JSONField
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.core.serializers import deserialize, serialize
+from django.core.serializers.base import DeserializationError
 from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext_lazy as _
 
 from model_utils.models import TimeStampedModel
 
 from .choices import Status
 from .choices import Action
+from .choices import Decision
+from .choices import Event
+from .choices import JobState
+from .conf import get_setting
+from .exceptions import AlreadyDecided, ApprovalError, StaleApproval
+from .fields import SourceField
 from .manager import ApprovalManager
+from .manager import ApprovalEventManager
+from .manager import ApprovalJobManager
+from .policy import get_policy
+from .signals import notify
+from .snapshot import bump_version, get_snapshots
 
 
 User = get_user_model()
 
 
+class ApprovalChangeset(TimeStampedModel):
+    '''
+    The approvals made by one submission of a formset. They are approved or
+    rejected together, either all of them or none.
+    '''
+    author = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        help_text=_('The user who authored the changes')
+    )
+    status = models.CharField(
+        choices=Status.choices,
+        max_length=8,
+        default=Status.none,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = _('approval changeset')
+        verbose_name_plural = _('approval changesets')
+        ordering = ('-created',)
+
+    def __str__(self):
+        return 'Changeset id:{}'.format(self.pk)
+
+    def decide(self, decision, user=None):
+        '''Approves or rejects all approvals of the changeset in one transaction.
+
+        When one of the approvals cannot be approved nothing is applied, and
+        ApprovalError is raised. Returns the report of ApprovalQueryset.
+        '''
+        with transaction.atomic(using=self._state.db):
+            status = type(self)._base_manager.using(self._state.db).select_for_update().filter(
+                pk=self.pk
+            ).values_list('status', flat=True).first()
+            if status != Status.none:
+                raise AlreadyDecided(_('The changeset was already decided'))
+            report = getattr(Approval.objects.using(self._state.db).filter(changeset=self), decision)(user=user)
+            failed = [result for result in report if result.error]
+            if failed:
+                raise ApprovalError(_('{} approvals of the changeset could not be {}: {}').format(
+                    len(failed), _('approved') if decision == Decision.approve else _('rejected'),
+                    failed[0].error
+                ))
+            self.status = Status.approved if decision == Decision.approve else Status.rejected
+            self.save(update_fields=['status', 'modified'])
+        return report
+
+    def approve(self, user=None):
+        return self.decide(Decision.approve, user=user)
+
+    def reject(self, user=None):
+        return self.decide(Decision.reject, user=user)
+
+
 class Approval(TimeStampedModel):
     '''
     Action tells us what the approval object is about
@@ -45,27 +114,61 @@ class Approval(TimeStampedModel):
         User, on_delete=models.SET_NULL, null=True, blank=True,
         help_text=_('The user who authored the change')
     )
-    source = JSONField(encoder=DjangoJSONEncoder, help_text=_('The fields as they would be saved.'))
+    # {'model': app_label.model, 'pk': pk, 'fields': {name: value}} as made by
+    # the python serializer, see make_source. Large sources can be stored
+    # compressed, see fields.py. Lists defer source and diff, see with_targets.
+    source = SourceField(encoder=DjangoJSONEncoder, help_text=_('The fields as they would be saved.'))
     # created_by
 
-    # contains html output of a diff for all fields.
-    # possibly we would like the diff to be compared with current
-    # object to what is stored as a change.
-    # there is no diff for new objects.
+    # json of {field name: [old value, new value]} for the changed fields,
+    # as computed by the form when the approval was created.
     diff = models.TextField()
-    # change = models. json field, with all the changes per field.
-    # change = what changed.
+    # the version of the target when the approval was made, see snapshot.py.
+    # An update is only applied while the target still has this version.
+    snapshot = models.CharField(max_length=64, blank=True)
+    # names of the fields an update changes, only those are written when it is
+    # approved. Empty means all fields.
+    changed_fields = models.JSONField(default=list, blank=True)
+    changeset = models.ForeignKey(
+        ApprovalChangeset, on_delete=models.CASCADE, null=True, blank=True, related_name='approvals'
+    )
+    # sha1 of what the approval would change, see get_payload_hash. Identical
+    # pending approvals are found through approval_payload_idx.
+    payload_hash = models.CharField(max_length=40, blank=True)
 
     objects = ApprovalManager()
 
     class Meta:
         verbose_name = _('approval')
         verbose_name_plural = _('approvals')
+        # ordering on the foreign key column avoids joining the content types,
+        # and it matches approval_target_idx below
         ordering = (
-            'content_type__app_label',
-            'content_type__model',
-            'object_id'
+            'content_type',
+            'object_id',
+            '-created',
         )
+        indexes = [
+            models.Index(
+                fields=['content_type', 'object_id', '-created'],
+                name='approval_target_idx'
+            ),
+            models.Index(
+                fields=['content_type', 'object_id'],
+                name='approval_pending_idx',
+                condition=models.Q(status=Status.none)
+            ),
+            models.Index(fields=['status', 'action'], name='approval_status_idx'),
+            # the keyset pages of the admin, see paginator.py
+            models.Index(fields=['-created', '-id'], name='approval_created_idx'),
+            models.Index(
+                fields=['payload_hash'],
+                name='approval_payload_idx',
+                condition=models.Q(status=Status.none)
+            ),
+            # on PostgreSQL migration 0007 adds approval_source_idx, a GIN index
+            # on source for ApprovalQueryset.changing
+        ]
 
     def __str__(self):
         return '{} approval obj id:{}'.format(
@@ -77,57 +180,273 @@ class Approval(TimeStampedModel):
     natural_key.dependencies = ['contenttypes.contenttype']
 
     def get_model(self):
-        return apps.get_model(
-            self.content_object.app_name, self.content_object.model
+        return self.content_type.model_class()
+
+    @property
+    def changes(self):
+        '''The diff as a dictionary of {field name: [old value, new value]}'''
+        if not self.diff:
+            return {}
+        return json.loads(self.diff)
+
+    def diff_html(self):
+        '''The diff as a html table, rendered when it is displayed'''
+        model = self.get_model()
+        rows = []
+        for name, (old, new) in sorted(self.changes.items()):
+            try:
+                label = model._meta.get_field(name).verbose_name
+            except FieldDoesNotExist:
+                label = name
+            rows.append((label, '' if old is None else old, '' if new is None else new))
+        if not rows:
+            return ''
+        return format_html(
+            '<table><thead><tr><th>{}</th><th>{}</th><th>{}</th></tr></thead><tbody>{}</tbody></table>',
+            _('Field'), _('Before'), _('After'),
+            format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>', rows)
         )
+    diff_html.short_description = _('Changes')
 
     @property
     def serialized_object(self):
         return serialize('python', [self.content_object])
 
-    @transaction.atomic
+    @staticmethod
+    def make_source(obj, fields=None):
+        '''The source for obj, with only the given fields when there are any.
+        An unsaved object has no many to many relations to serialize yet.'''
+        if not fields and obj.pk is None:
+            fields = [field.name for field in obj._meta.concrete_fields]
+        return serialize('python', [obj], fields=fields or None)[0]
+
+    @staticmethod
+    def make_payload_hash(content_type_id, object_id, action, source):
+        '''A hash of the target, the action and the source, equal for approvals
+        that would make the same change'''
+        payload = [content_type_id, object_id, action, source]
+        dumped = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(dumped.encode('utf-8')).hexdigest()
+
+    def get_payload_hash(self):
+        return self.make_payload_hash(self.content_type_id, self.object_id, self.action, self.source)
+
+    def get_source_object(self):
+        '''The unsaved target object as it is described by source'''
+        source = self.source
+        # sources made by older versions are a list, or that list as a json string
+        if isinstance(source, str):
+            try:
+                source = json.loads(source)
+            except ValueError:
+                pass
+        if isinstance(source, dict):
+            source = [source]
+        try:
+            deserialized_obj = next(deserialize('python', source))
+        except (TypeError, StopIteration, DeserializationError, KeyError):
+            raise ValueError('Source is not of a model format: {}'.format(self.source))
+        return deserialized_obj.object
+
     def approve(self, user=None):
+        '''Applies the approval to its target.
+
+        The approval row is locked while it is applied, when someone else
+        decided it in the meantime AlreadyDecided is raised. An update of which
+        the target changed since the approval was made is rejected instead, and
+        StaleApproval is raised.
+        '''
         if self.action == Action.update and not self.object_id:
             msg = _('Inconsistent state: an update always need an object_id')
             raise ValueError(msg)
 
+        with transaction.atomic(using=self._state.db):
+            applied = self._approve(user)
+        if not applied:
+            raise StaleApproval(_('The object changed after the approval was made'))
+
+    def _approve(self, user):
+        # the target is locked before the approval, the same order in which
+        # supersede locks the other approvals of the target
+        if self.action == Action.update:
+            snapshots = get_snapshots(
+                self.get_model(), [self.object_id], fields=self.changed_fields,
+                using=self._state.db, lock=True
+            )
+        self._lock_pending()
+
+        if self.action == Action.update and self.snapshot:
+            if snapshots.get(self.object_id) != self.snapshot:
+                self.reject(user=user)
+                return False
+
         if self.action == Action.delete:
             self.content_object.delete()
             self.object_id = None
             self.status = Status.approved
             self.save()
-            return
+            notify(Event.approved, [self.pk], user=user, using=self._state.db)
+            return True
 
-        try:
-            deserialized_obj = next(deserialize('python', self.source))
-        except TypeError:
-            raise ValueError('Source is not of a model format: {}'.format(self.source))
-
-        obj = deserialized_obj.object
-        obj.save()
+        obj = self.get_source_object()
+        update_fields = None
+        if self.action == Action.update:
+            # the version moves on, so later updates of the old version are stale
+            bumped = bump_version(self.get_model(), obj)
+            if self.changed_fields:
+                update_fields = list(dict.fromkeys(self.changed_fields + bumped))
+        obj.save(update_fields=update_fields)
         self.changed_by = user
         self.status = Status.approved
         self.object_id = obj.pk
         self.save()
+        notify(Event.approved, [self.pk], user=user, using=self._state.db)
+        if self.action == Action.update and get_setting('SUPERSEDE'):
+            Approval.objects.filter(pk=self.pk).supersede(user=user)
+        return True
+
+    def _lock_pending(self):
+        '''Locks the approval row, raises AlreadyDecided when it is no longer pending'''
+        status = type(self)._base_manager.using(self._state.db).select_for_update().filter(
+            pk=self.pk
+        ).values_list('status', flat=True).first()
+        if status != Status.none:
+            raise AlreadyDecided(_('The approval was already decided'))
 
     def reject(self, user=None):
-        self.changed_by = user
-        self.status = Status.rejected
-        self.save()
+        '''Rejects the approval, like approve it raises AlreadyDecided when
+        someone else decided it in the meantime.'''
+        with transaction.atomic(using=self._state.db):
+            self._lock_pending()
+            self.changed_by = user
+            self.status = Status.rejected
+            self.save()
+            notify(Event.rejected, [self.pk], user=user, using=self._state.db)
+
+    def decide(self, decision, user=None):
+        '''Approves or rejects the approval.
+
+        With APPROVAL_ASYNC the decision is queued as an ApprovalJob instead,
+        and the job is returned.
+        '''
+        if get_setting('ASYNC'):
+            return ApprovalJob.objects.create(approval=self, decision=decision, user=user)
+        getattr(self, decision)(user=user)
+
+
+class ApprovalArchive(models.Model):
+    '''
+    Decided approvals that are past their retention are moved here by the
+    archive_approvals command. The id is the id the approval had.
+    '''
+    id = models.IntegerField(primary_key=True)
+    created = models.DateTimeField()
+    modified = models.DateTimeField()
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField(null=True)
+    content_object = GenericForeignKey('content_type', 'object_id')
+    action = models.CharField(choices=Action.choices, max_length=8)
+    status = models.CharField(choices=Status.choices, max_length=8, blank=True)
+    comment = models.CharField(max_length=255, blank=True)
+    author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    source = SourceField(encoder=DjangoJSONEncoder)
+    diff = models.TextField()
+    snapshot = models.CharField(max_length=64, blank=True)
+    changed_fields = models.JSONField(default=list, blank=True)
+    changeset = models.ForeignKey(
+        ApprovalChangeset, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    payload_hash = models.CharField(max_length=40, blank=True)
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('archived approval')
+        verbose_name_plural = _('archived approvals')
+        ordering = ('-id',)
+
+    def __str__(self):
+        return '{} archived approval obj id:{}'.format(
+            str(self.content_type).title(), self.object_id
+        )
+
+
+class ApprovalJob(TimeStampedModel):
+    '''
+    A queued decision on an approval, applied by the approval_worker command
+    so that the work does not happen within the request.
+    '''
+    approval = models.ForeignKey(Approval, on_delete=models.CASCADE, related_name='jobs')
+    decision = models.CharField(choices=Decision.choices, max_length=8)
+    state = models.CharField(
+        choices=JobState.choices,
+        max_length=8,
+        default=JobState.queued
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        help_text=_('The user who made the decision')
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    objects = ApprovalJobManager()
+
+    class Meta:
+        verbose_name = _('approval job')
+        verbose_name_plural = _('approval jobs')
+        ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='approval_job_queued_idx',
+                condition=models.Q(state=JobState.queued)
+            ),
+        ]
+
+    def __str__(self):
+        return '{} approval id:{} ({})'.format(
+            self.get_decision_display(), self.approval_id, self.get_state_display()
+        )
+
+
+class ApprovalEvent(models.Model):
+    '''
+    The outbox of approval signals. With APPROVAL_OUTBOX the signals are not
+    sent when an approval is made or decided, instead an event is written in
+    the same transaction and the flush_approval_events command sends them.
+    '''
+    created = models.DateTimeField(auto_now_add=True)
+    approval = models.ForeignKey(Approval, on_delete=models.CASCADE, related_name='events')
+    event = models.CharField(choices=Event.choices, max_length=16)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    objects = ApprovalEventManager()
+
+    class Meta:
+        verbose_name = _('approval event')
+        verbose_name_plural = _('approval events')
+        ordering = ('pk',)
+
+    def __str__(self):
+        return '{} approval id:{}'.format(self.get_event_display(), self.approval_id)
 
 
 class ApprovableModelMixin:
     '''put need approval on the model
 
-    permission by user.
-    staff_user?
-
+    Who needs an approval for which changes is described by approval_policy,
+    an ApprovalPolicy or its keyword arguments, see policy.py.
     '''
 
     approvals = GenericRelation(Approval)
+    # a field that changes with every save, like a version counter or a
+    # modification time. When set approvals only compare this column to find
+    # out whether the object changed, otherwise all columns are hashed.
+    approval_version_field = None
+    approval_policy = None
 
     @classmethod
-    def need_approval(cls, user):
-        '''Permission by user'''
-        return True
+    def need_approval(cls, user, fields=None):
+        '''Whether user needs an approval, fields are the changed fields of an update'''
+        return get_policy(cls).need_approval(user, fields)
 
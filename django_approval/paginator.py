@@ -0,0 +1,135 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# the query parameter that holds the cursor of a keyset page
+CURSOR_VAR = 'cursor'
+# the ordering keyset pages are read in, newest first
+KEYSET_ORDERING = ('-created', '-id')
+
+
+def make_cursor(created, pk):
+    '''The cursor of the page that starts after the approval created at created with id pk'''
+    return '{}_{}'.format(created.isoformat(), pk)
+
+
+def parse_cursor(value):
+    '''(created, id) of a cursor made by make_cursor, raises ValueError'''
+    created, _, pk = value.rpartition('_')
+    created = parse_datetime(created)
+    if created is None:
+        raise ValueError('Invalid cursor: {}'.format(value))
+    return created, int(pk)
+
+
+def estimate_count(queryset):
+    '''The number of rows of queryset as estimated by the database, None when
+    the backend has no estimate.
+
+    Without a filter the statistics of the table are used. A filtered
+    queryset is estimated by the planner on PostgreSQL.
+    '''
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if not queryset.query.where:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)', [table])
+                row = cursor.fetchone()
+                # a table that was never analyzed has no statistics
+                return int(row[0]) if row and row[0] > 0 else None
+            sql, params = queryset.order_by().values('pk').query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return plan[0]['Plan']['Plan Rows']
+        if connection.vendor == 'mysql' and not queryset.query.where:
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+    return None
+
+
+def exact_count(queryset):
+    '''COUNT(*) of queryset without the annotations that are no aggregate.
+
+    They do not change the number of rows, but a subquery in an annotation
+    would be evaluated for every row that is counted.
+    '''
+    queryset = queryset.order_by()
+    query = queryset.query
+    query.annotations = {
+        alias: annotation for alias, annotation in query.annotations.items() if annotation.contains_aggregate
+    }
+    if query.annotation_select_mask is not None:
+        query.set_annotation_mask(query.annotation_select_mask.intersection(query.annotations))
+    return queryset.count()
+
+
+class ApprovalPaginator(Paginator):
+    '''
+    A paginator for large approval tables.
+
+    With keyset the first page, and the page after cursor, are read with
+    WHERE (created, id) < cursor instead of an OFFSET. That reads one page of
+    the approval_created_idx index however far the page is, the queryset
+    needs to be ordered by KEYSET_ORDERING. Other pages fall back to OFFSET.
+
+    With estimate the count is estimated by the database instead of a
+    COUNT(*) over the table, see estimate_count. Exact counts leave out the
+    annotations of the queryset, see exact_count.
+    '''
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 cursor=None, keyset=False, estimate=False):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.cursor = cursor
+        self.keyset = keyset
+        self.estimate = estimate
+        self.estimated = False
+        self._keyset_page = None
+
+    @cached_property
+    def count(self):
+        if self.estimate:
+            count = estimate_count(self.object_list)
+            if count is not None:
+                self.estimated = True
+                return count
+        if isinstance(self.object_list, QuerySet):
+            return exact_count(self.object_list)
+        return super().count
+
+    def page(self, number):
+        if not self.keyset or number != 1:
+            return super().page(number)
+        if self._keyset_page is None:
+            self._keyset_page = self.keyset_page()
+        return self._keyset_page
+
+    def keyset_page(self):
+        '''The page after cursor, with next_cursor set when there are more'''
+        queryset = self.object_list
+        if self.cursor is not None:
+            created, pk = self.cursor
+            # created__lte bounds the index scan, the rest breaks ties
+            queryset = queryset.filter(Q(created__lte=created), Q(created__lt=created) | Q(pk__lt=pk))
+        rows = list(queryset[:self.per_page + 1])
+        page = self._get_page(rows[:self.per_page], 1, self)
+        page.next_cursor = None
+        if len(rows) > self.per_page:
+            last = rows[self.per_page - 1]
+            # the rows are approvals, or dictionaries when the queryset has values()
+            if isinstance(last, dict):
+                page.next_cursor = make_cursor(last['created'], last['id'])
+            else:
+                page.next_cursor = make_cursor(last.created, last.pk)
+        return page
@@ -0,0 +1,114 @@
+import inspect
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .conf import get_setting
+
+USER_KEY = 'django_approval:policy:{}:{}'
+VERSION_KEY = 'django_approval:policy_version'
+
+
+class ApprovalPolicy:
+    '''
+    Decides whether a change made by a user needs an approval.
+
+    Superusers, members of exempt_groups and users with one of
+    exempt_permissions ('app_label.codename') can change without approval.
+    With sensitive_fields an update only needs an approval when it changes
+    one of those fields, creates and deletes always need one.
+    '''
+
+    def __init__(self, exempt_superusers=False, exempt_groups=(), exempt_permissions=(),
+                 sensitive_fields=None):
+        self.exempt_superusers = exempt_superusers
+        self.exempt_groups = frozenset(exempt_groups)
+        self.exempt_permissions = frozenset(exempt_permissions)
+        self.sensitive_fields = None if sensitive_fields is None else frozenset(sensitive_fields)
+
+    def need_approval(self, user, fields=None):
+        '''fields are the names of the changed fields of an update, None otherwise'''
+        if self.sensitive_fields is not None and fields is not None:
+            if not self.sensitive_fields.intersection(fields):
+                return False
+        if user is None or not user.is_authenticated:
+            return True
+        if self.exempt_superusers and user.is_superuser:
+            return False
+        if self.exempt_groups or self.exempt_permissions:
+            groups, permissions = get_user_facts(user)
+            if groups & self.exempt_groups or permissions & self.exempt_permissions:
+                return False
+        return True
+
+
+def get_user_facts(user):
+    '''The group names and permissions of user.
+
+    They are kept on the user for the rest of the request and in the cache
+    for APPROVAL_POLICY_TTL seconds, until the groups or permissions change.
+    '''
+    facts = getattr(user, '_approval_facts', None)
+    if facts is None:
+        key = USER_KEY.format(cache.get_or_set(VERSION_KEY, 1, None), user.pk)
+        facts = cache.get(key)
+        if facts is None:
+            facts = (
+                frozenset(user.groups.values_list('name', flat=True)),
+                frozenset(user.get_all_permissions()),
+            )
+            cache.set(key, facts, get_setting('POLICY_TTL'))
+        user._approval_facts = facts
+    return facts
+
+
+def invalidate_user_facts(user_ids=None):
+    '''Drops the cached facts of the users, or of everyone'''
+    version = cache.get_or_set(VERSION_KEY, 1, None)
+    if user_ids is None:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            pass
+        return
+    cache.delete_many([USER_KEY.format(version, pk) for pk in user_ids])
+
+
+def need_approval(model, user, fields=None):
+    '''model.need_approval(user, fields). Models that override the older
+    need_approval(cls, user) are asked without the changed fields.'''
+    if takes_fields(getattr(model.need_approval, '__func__', model.need_approval)):
+        return model.need_approval(user, fields=fields)
+    return model.need_approval(user)
+
+
+@lru_cache(maxsize=None)
+def takes_fields(function):
+    parameters = inspect.signature(function).parameters.values()
+    return any(parameter.name == 'fields' or parameter.kind == parameter.VAR_KEYWORD for parameter in parameters)
+
+
+@lru_cache(maxsize=None)
+def get_policy(model):
+    '''The policy of model, compiled once.
+
+    APPROVAL_POLICIES is keyed on 'app_label.model' with a 'default' entry,
+    like APPROVAL_RETENTION, and holds the keyword arguments of ApprovalPolicy.
+    It takes precedence over the approval_policy attribute of the model.
+    '''
+    policies = get_setting('POLICIES')
+    label = '{}.{}'.format(model._meta.app_label, model._meta.model_name)
+    policy = policies.get(label, getattr(model, 'approval_policy', None))
+    if policy is None:
+        policy = policies.get('default', {})
+    if isinstance(policy, dict):
+        policy = ApprovalPolicy(**policy)
+    return policy
+
+
+@receiver(setting_changed)
+def clear_policies(setting, **kwargs):
+    if setting == 'APPROVAL_POLICIES':
+        get_policy.cache_clear()
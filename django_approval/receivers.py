@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_content_type_ids
+from .choices import Event
+from .models import Approval
+from .policy import invalidate_user_facts
+from .signals import notify
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Approval)
+def approval_created(sender, instance, created, using=None, **kwargs):
+    if created:
+        invalidate_content_type_ids([instance.content_type_id], using=using)
+        notify(Event.requested, [instance.pk], user=instance.author, using=using)
+
+
+@receiver(post_delete, sender=ContentType)
+def content_type_deleted(sender, using=None, **kwargs):
+    # its approvals are deleted with it
+    invalidate_content_type_ids(using=using)
+
+
+def user_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    '''The groups or permissions of users changed, their policy facts are stale'''
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_user_facts([instance.pk])
+    else:
+        invalidate_user_facts(pk_set if action != 'post_clear' else None)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    invalidate_user_facts()
+
+
+for relation in ('groups', 'user_permissions'):
+    if hasattr(User, relation):
+        m2m_changed.connect(
+            user_relation_changed, sender=getattr(User, relation).through,
+            dispatch_uid='django_approval_user_{}'.format(relation)
+        )
@@ -0,0 +1,50 @@
+from functools import partial
+
+from django.apps import apps
+from django.db import transaction
+from django.dispatch import Signal
+
+from .choices import Event
+from .conf import get_setting
+
+# sent with sender=Approval and the keyword arguments approval and user, once
+# the transaction that made or decided the approval is committed
+approval_requested = Signal()
+approval_approved = Signal()
+approval_rejected = Signal()
+
+SIGNALS = {
+    Event.requested: approval_requested,
+    Event.approved: approval_approved,
+    Event.rejected: approval_rejected,
+}
+
+
+def notify(event, approval_ids, user=None, using=None):
+    '''Sends the signal of event for the approvals after the transaction commits.
+
+    With APPROVAL_OUTBOX the events are written to ApprovalEvent within the
+    transaction instead, and the flush_approval_events command sends them.
+    '''
+    approval_ids = list(approval_ids)
+    if not approval_ids:
+        return
+    if get_setting('OUTBOX'):
+        ApprovalEvent = apps.get_model('django_approval', 'ApprovalEvent')
+        ApprovalEvent.objects.using(using).bulk_create([
+            ApprovalEvent(approval_id=pk, event=event, user=user) for pk in approval_ids
+        ])
+        return
+    Approval = apps.get_model('django_approval', 'Approval')
+    if SIGNALS[event].has_listeners(Approval):
+        transaction.on_commit(partial(send, event, approval_ids, user, using), using=using)
+
+
+def send(event, approval_ids, user=None, using=None):
+    '''Sends the signal of event for every approval, loaded in batches'''
+    Approval = apps.get_model('django_approval', 'Approval')
+    batch_size = get_setting('BATCH_SIZE')
+    for start in range(0, len(approval_ids), batch_size):
+        approvals = Approval.objects.using(using).filter(pk__in=approval_ids[start:start + batch_size])
+        for approval in approvals.order_by('pk'):
+            SIGNALS[event].send(sender=Approval, approval=approval, user=user)
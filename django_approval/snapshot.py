@@ -0,0 +1,75 @@
+import hashlib
+import json
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+def get_snapshot_fields(model, fields=None):
+    '''The columns that make up the snapshot of an object of model.
+
+    A model can name a field that changes with every save, a version counter
+    or a modification time, as approval_version_field. Otherwise the given
+    fields are used, or all concrete fields except the primary key.
+    '''
+    version_field = getattr(model, 'approval_version_field', None)
+    if version_field:
+        return [model._meta.get_field(version_field).attname]
+    if fields:
+        return sorted(model._meta.get_field(name).attname for name in fields)
+    return [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def bump_version(model, obj):
+    '''Moves the version field and the auto_now fields of obj on, so that an
+    update written with update_fields changes the snapshot. Returns their names.
+
+    An integer version is incremented in the database, a datetime set to now
+    and a uuid replaced.
+    '''
+    names = []
+    version_field = getattr(model, 'approval_version_field', None)
+    if version_field:
+        field = model._meta.get_field(version_field)
+        if isinstance(field, models.DateTimeField):
+            value = timezone.now()
+        elif isinstance(field, models.UUIDField):
+            value = uuid.uuid4()
+        else:
+            value = models.F(field.attname) + 1
+        setattr(obj, field.attname, value)
+        names.append(field.name)
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now', False) and field.name not in names:
+            field.pre_save(obj, add=False)
+            names.append(field.name)
+    return names
+
+
+def make_snapshot(model, values):
+    '''The version itself, or a hash of the column values'''
+    if getattr(model, 'approval_version_field', None):
+        return str(values[0])
+    dumped = json.dumps(list(values), cls=DjangoJSONEncoder, separators=(',', ':'))
+    return hashlib.sha1(dumped.encode('utf-8')).hexdigest()
+
+
+def get_snapshots(model, object_ids, fields=None, using=None, lock=False):
+    '''{pk: snapshot} for the objects of model, read with a single query.
+
+    The values are read as they are stored, no serializer is involved. With
+    fields only those columns are compared, see get_snapshot_fields. With
+    lock the rows stay locked until the end of the transaction.
+    '''
+    queryset = model._base_manager.using(using).filter(pk__in=object_ids)
+    if lock:
+        queryset = queryset.select_for_update()
+    rows = queryset.order_by().values_list('pk', *get_snapshot_fields(model, fields))
+    return {row[0]: make_snapshot(model, row[1:]) for row in rows}
+
+
+def get_snapshot(model, object_id, fields=None, using=None):
+    '''The snapshot of one object, an empty string when it does not exist'''
+    return get_snapshots(model, [object_id], fields=fields, using=using).get(object_id, '')
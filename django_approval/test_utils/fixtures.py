@@ -0,0 +1,230 @@
+'''
+Large approval datasets for load tests and benchmarks, see the
+generate_approval_fixtures command.
+
+Parents, children and approvals of the children are written in chunks, with
+COPY on PostgreSQL and bulk_create elsewhere, instead of one at a time like
+the factories. With drop_indexes the plain indexes of the tables are dropped
+during the load and made again after it, in one pass per index.
+'''
+import csv
+import io
+import itertools
+import json
+import math
+import random
+import string
+from datetime import timedelta
+
+from django.core.management.color import no_style
+from django.contrib.contenttypes.models import ContentType
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.utils import timezone
+
+from django_approval.choices import Action, Status
+from django_approval.models import Approval
+from django_approval.test_utils.test_app.models import Child, Parent
+
+STATUS_MIX = {Status.none: 10, Status.approved: 60, Status.rejected: 30}
+ACTION_MIX = {Action.create: 20, Action.update: 70, Action.delete: 10}
+METHODS = ('auto', 'copy', 'bulk_create')
+# NULL in the csv written to COPY, an empty value is an empty string
+COPY_NULL = '\\N'
+# the statements that make the indexes of a table, the primary key and unique
+# indexes are left alone
+INDEX_SQL = {
+    'postgresql': 'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema()',
+    'sqlite': "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+}
+# maintenance_work_mem while the dropped indexes are made again on PostgreSQL
+INDEX_MEMORY = '512MB'
+
+
+def generate_fixtures(approvals, objects=None, children_per_parent=10, statuses=None, actions=None,
+                      payload_size=0, hot_objects=0, hot_share=0.5, days=365, author=None,
+                      chunk_size=5000, method='auto', drop_indexes=False, seed=None, using=DEFAULT_DB_ALIAS):
+    '''Writes `approvals` approvals of `objects` new children, and their parents.
+
+    statuses and actions map choices on their weight, see STATUS_MIX and
+    ACTION_MIX. A pending create has no object_id, other approvals target a
+    child, and a share hot_share of them target one of the first hot_objects
+    children. The sources are padded to about payload_size bytes, the
+    approvals are created over the last `days` days. With drop_indexes the
+    indexes of the tables are made after the rows are written, which is
+    faster for large loads. Returns the number of rows written per model.
+    '''
+    objects = objects or max(approvals // 10, 1)
+    hot_objects = min(hot_objects, objects)
+    connection = connections[using]
+    if method == 'auto':
+        method = 'copy' if connection.vendor == 'postgresql' else 'bulk_create'
+    if method == 'copy' and connection.vendor != 'postgresql':
+        raise ValueError('COPY needs PostgreSQL')
+    if drop_indexes and connection.vendor not in INDEX_SQL:
+        raise ValueError('Dropping indexes needs PostgreSQL or SQLite')
+    rng = random.Random(seed)
+
+    with transaction.atomic(using=using):
+        indexes = remove_indexes([Parent, Child, Approval], using) if drop_indexes else []
+        first_parent = next_id(Parent, using)
+        first_child = next_id(Child, using)
+        parents = math.ceil(objects / children_per_parent)
+        write(Parent, (
+            {'id': first_parent + index, 'name': 'parent-{}'.format(index)} for index in range(parents)
+        ), chunk_size, method, using)
+        write(Child, (
+            {
+                'id': first_child + index,
+                'field1': 'field1-{}'.format(index),
+                'field2': 'field2-{}'.format(index),
+                'parent_id': first_parent + index // children_per_parent,
+            } for index in range(objects)
+        ), chunk_size, method, using)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Parent, Child]):
+                cursor.execute(sql)
+
+        rows = make_approvals(
+            rng, approvals, first_child, objects, children_per_parent, first_parent,
+            statuses or STATUS_MIX, actions or ACTION_MIX, payload_size, hot_objects, hot_share, days,
+            author, ContentType.objects.db_manager(using).get_for_model(Child).pk, chunk_size,
+        )
+        write(Approval, rows, chunk_size, method, using)
+        if indexes:
+            add_indexes(indexes, using)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in (Parent, Child, Approval):
+                    cursor.execute('ANALYZE {}'.format(connection.ops.quote_name(model._meta.db_table)))
+    return {'parents': parents, 'children': objects, 'approvals': approvals}
+
+
+def make_approvals(rng, count, first_child, objects, children_per_parent, first_parent, statuses, actions,
+                   payload_size, hot_objects, hot_share, days, author, content_type, chunk_size):
+    '''The columns of the approvals, oldest first'''
+    now = timezone.now()
+    step = timedelta(days=days) / max(count, 1)
+    start = now - step * count
+    decided_after = min(timedelta(hours=1), step * count)
+    # the padding of a source is a random slice of one block of text
+    block = ''.join(rng.choices(string.ascii_letters + string.digits, k=payload_size * 2))
+    for offset in range(0, count, chunk_size):
+        size = min(chunk_size, count - offset)
+        chunk = zip(
+            range(offset, offset + size),
+            rng.choices(list(statuses), list(statuses.values()), k=size),
+            rng.choices(list(actions), list(actions.values()), k=size),
+        )
+        for index, status, action in chunk:
+            if hot_objects and rng.random() < hot_share:
+                child = rng.randrange(hot_objects)
+            else:
+                child = rng.randrange(objects)
+            object_id = first_child + child
+            fields = {'field1': 'field1-{}'.format(child)}
+            changed_fields, diff = [], ''
+            if action == Action.update:
+                fields['field1'] = 'edit-{}'.format(index)
+                changed_fields = ['field1']
+                diff = json.dumps({'field1': ['field1-{}'.format(child), fields['field1']]}, separators=(',', ':'))
+            else:
+                fields['field2'] = 'field2-{}'.format(child)
+                fields['parent'] = first_parent + child // children_per_parent
+            if action == Action.create and status == Status.none:
+                object_id = None
+            source = {'model': 'test_app.child', 'pk': object_id, 'fields': fields}
+            if payload_size:
+                # outside of fields, so approving ignores it
+                position = rng.randrange(payload_size)
+                source['padding'] = block[position:position + payload_size]
+            created = start + step * index
+            yield {
+                'created': created,
+                'modified': created if status == Status.none else min(created + decided_after, now),
+                'content_type_id': content_type,
+                'object_id': object_id,
+                'action': action,
+                'status': status,
+                'comment': '',
+                'author_id': author,
+                'source': source,
+                'diff': diff,
+                'snapshot': '',
+                'changed_fields': changed_fields,
+                'changeset_id': None,
+                'payload_hash': Approval.make_payload_hash(content_type, object_id, action, source),
+            }
+
+
+def next_id(model, using):
+    return (model._base_manager.using(using).aggregate(last=models.Max('pk'))['last'] or 0) + 1
+
+
+def remove_indexes(models, using):
+    '''Drops the indexes of the tables of models, except for the primary key and
+    unique ones. Returns the statements that make them again.'''
+    connection = connections[using]
+    statements = []
+    with connection.cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            constraints = connection.introspection.get_constraints(cursor, table)
+            cursor.execute(INDEX_SQL[connection.vendor], [table])
+            for name, sql in cursor.fetchall():
+                constraint = constraints.get(name)
+                if not constraint or constraint['primary_key'] or constraint['unique'] or not sql:
+                    continue
+                cursor.execute('DROP INDEX {}'.format(connection.ops.quote_name(name)))
+                statements.append(sql)
+    return statements
+
+
+def add_indexes(statements, using):
+    '''Makes the indexes that remove_indexes dropped'''
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # PostgreSQL does not index a table with foreign key checks that
+            # are deferred to the commit, they are checked now instead
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            # sorts the index entries in memory, until the commit
+            cursor.execute("SET LOCAL maintenance_work_mem = '{}'".format(INDEX_MEMORY))
+        for sql in statements:
+            cursor.execute(sql)
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+def write(model, rows, chunk_size, method, using):
+    '''Inserts rows, dictionaries of the attnames of model, chunk by chunk'''
+    rows = iter(rows)
+    chunk = list(itertools.islice(rows, chunk_size))
+    while chunk:
+        if method == 'copy':
+            copy(model, chunk, using)
+        else:
+            model._base_manager.using(using).bulk_create([model(**row) for row in chunk], batch_size=chunk_size)
+        chunk = list(itertools.islice(rows, chunk_size))
+
+
+def copy(model, rows, using):
+    '''Inserts rows with COPY in csv. Json is prepared by its field, which
+    compresses large sources, other values are written as they are.'''
+    connection = connections[using]
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    json_fields = [index for index, field in enumerate(fields) if isinstance(field, models.JSONField)]
+    stream = io.StringIO()
+    writer = csv.writer(stream, lineterminator='\n')
+    for row in rows:
+        values = [COPY_NULL if value is None else value for value in row.values()]
+        for index in json_fields:
+            values[index] = fields[index].get_prep_value(values[index])
+        writer.writerow(values)
+    stream.seek(0)
+    sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        COPY_NULL,
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, stream)
@@ -3,6 +3,8 @@ from django.contrib import admin
 from django_approval.test_utils.test_app import models
 from django_approval.admin import ApprovalTabularInline
 from django_approval.admin import ParentApprovalAdmin
+from django_approval.forms import ApprovalInlineFormSet
+from django_approval.test_utils.test_app.forms import ChildModelForm
 
 
 class ChildApprovalAdmin(ApprovalTabularInline):
@@ -19,3 +21,48 @@ class ParentAdmin(ParentApprovalAdmin):
     inlines = [
         ChildApprovalAdmin
     ]
+
+
+def with_request(form_class, request):
+    '''A subclass of the form or formset class that is made with request'''
+    class RequestForm(form_class):
+        def __init__(self, *args, **kwargs):
+            kwargs['request'] = request
+            super().__init__(*args, **kwargs)
+
+    RequestForm.__name__ = form_class.__name__
+    return RequestForm
+
+
+class RequestFormMixin:
+    '''The admin does not hand the request to its forms, the approval forms
+    need it for the author of the approvals'''
+
+    def get_form(self, request, obj=None, **kwargs):
+        return with_request(super().get_form(request, obj, **kwargs), request)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        return with_request(super().get_formset(request, obj, **kwargs), request)
+
+
+# an admin that edits the children through the approval forms
+site = admin.AdminSite(name='approval_forms')
+
+
+class ChildFormAdmin(RequestFormMixin, admin.ModelAdmin):
+    form = ChildModelForm
+
+
+class ChildFormInline(RequestFormMixin, admin.TabularInline):
+    model = models.Child
+    form = ChildModelForm
+    formset = ApprovalInlineFormSet
+    extra = 1
+
+
+class ParentFormAdmin(admin.ModelAdmin):
+    inlines = [ChildFormInline]
+
+
+site.register(models.Child, ChildFormAdmin)
+site.register(models.Parent, ParentFormAdmin)
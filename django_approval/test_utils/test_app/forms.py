@@ -1,5 +1,5 @@
 from django_approval.forms import FormUsingApproval
-from django_approval.test_utils.test_app.models import Child
+from django_approval.test_utils.test_app.models import Article, Child, Versioned
 
 
 class ChildModelForm(FormUsingApproval):
@@ -7,3 +7,17 @@ class ChildModelForm(FormUsingApproval):
     class Meta:
         model = Child
         fields = '__all__'
+
+
+class VersionedModelForm(FormUsingApproval):
+
+    class Meta:
+        model = Versioned
+        fields = ['name']
+
+
+class ArticleModelForm(FormUsingApproval):
+
+    class Meta:
+        model = Article
+        fields = '__all__'
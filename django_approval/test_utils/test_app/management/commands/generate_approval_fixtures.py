@@ -0,0 +1,108 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from django_approval.choices import Action, Status
+from django_approval.test_utils.fixtures import ACTION_MIX, METHODS, STATUS_MIX, generate_fixtures
+
+# Status.none is an empty string which is awkward on the command line
+STATUSES = {'pending': Status.none, 'approved': Status.approved, 'rejected': Status.rejected}
+
+
+def format_mix(mix, names):
+    labels = {value: name for name, value in names.items()}
+    return ','.join('{}={}'.format(labels[value], weight) for value, weight in mix.items())
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes parents, children and approvals of the test app in chunks, '
+        'for load tests and benchmarks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('approvals', type=int, help='The number of approvals to write.')
+        parser.add_argument(
+            '--objects', type=int, default=None,
+            help='The number of children the approvals target, a tenth of the approvals by default.'
+        )
+        parser.add_argument('--children-per-parent', type=int, default=10)
+        parser.add_argument(
+            '--statuses', default=format_mix(STATUS_MIX, STATUSES),
+            help='The weight of each status, default %(default)s.'
+        )
+        parser.add_argument(
+            '--actions', default=format_mix(ACTION_MIX, {value: value for value in Action.values}),
+            help='The weight of each action, default %(default)s.'
+        )
+        parser.add_argument('--payload-size', type=int, default=0, help='Pad the sources to about this many bytes.')
+        parser.add_argument(
+            '--hot-objects', type=int, default=0,
+            help='The number of children that get a share --hot-share of the approvals.'
+        )
+        parser.add_argument('--hot-share', type=float, default=0.5)
+        parser.add_argument('--days', type=int, default=365, help='Spread the approvals over this many days.')
+        parser.add_argument('--author', help='The username of the author of the approvals.')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--method', choices=METHODS, default='auto', help='COPY on PostgreSQL by default.')
+        parser.add_argument(
+            '--drop-indexes', action='store_true',
+            help='Drop the indexes during the load and make them again after it, faster for large loads.'
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Seed of the random choices.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def parse_mix(self, value, names):
+        '''{choice: weight} of a name=weight,name=weight option'''
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name.strip() not in names:
+                raise CommandError('Unknown choice {}, expected one of {}'.format(name, ', '.join(names)))
+            try:
+                mix[names[name.strip()]] = float(weight)
+            except ValueError:
+                raise CommandError('Invalid weight: {}'.format(part))
+        if sum(mix.values()) <= 0:
+            raise CommandError('The weights of {} add up to nothing'.format(value))
+        return mix
+
+    def handle(self, *args, **options):
+        if not 0 <= options['hot_share'] <= 1:
+            raise CommandError('--hot-share is a fraction between 0 and 1')
+        author = None
+        if options['author']:
+            User = get_user_model()
+            try:
+                author = User._default_manager.db_manager(options['database']).get_by_natural_key(
+                    options['author']
+                ).pk
+            except User.DoesNotExist:
+                raise CommandError('Unknown user: {}'.format(options['author']))
+
+        start = time.perf_counter()
+        try:
+            counts = generate_fixtures(
+                options['approvals'],
+                objects=options['objects'],
+                children_per_parent=options['children_per_parent'],
+                statuses=self.parse_mix(options['statuses'], STATUSES),
+                actions=self.parse_mix(options['actions'], {value: value for value in Action.values}),
+                payload_size=options['payload_size'],
+                hot_objects=options['hot_objects'],
+                hot_share=options['hot_share'],
+                days=options['days'],
+                author=author,
+                chunk_size=options['chunk_size'],
+                method=options['method'],
+                drop_indexes=options['drop_indexes'],
+                seed=options['seed'],
+                using=options['database'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write('Wrote {parents} parents, {children} children and {approvals} approvals'.format(
+            **counts
+        ) + ' in {:.1f}s'.format(time.perf_counter() - start))
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:25
+
+from django.db import migrations, models
+import django_approval.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Versioned',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            bases=(models.Model, django_approval.models.ApprovableModelMixin),
+        ),
+    ]
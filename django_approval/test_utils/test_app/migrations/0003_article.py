@@ -0,0 +1,30 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:27
+
+from django.db import migrations, models
+import django_approval.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_app', '0002_versioned'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=16)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Article',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=32)),
+                ('tags', models.ManyToManyField(blank=True, to='test_app.Tag')),
+            ],
+            bases=(models.Model, django_approval.models.ApprovableModelMixin),
+        ),
+    ]
@@ -10,3 +10,20 @@ class Child(models.Model, ApprovableModelMixin):
     field1 = models.CharField(max_length=32)
     field2 = models.CharField(max_length=32)
     parent = models.ForeignKey(Parent, on_delete=models.CASCADE)
+
+
+class Versioned(models.Model, ApprovableModelMixin):
+    name = models.CharField(max_length=32)
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    approval_version_field = 'version'
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=16)
+
+
+class Article(models.Model, ApprovableModelMixin):
+    title = models.CharField(max_length=32)
+    tags = models.ManyToManyField(Tag, blank=True)
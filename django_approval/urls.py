@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
-from django.conf.urls import url  # noqa
-from django.views.generic import TemplateView  # noqa
+from django.urls import path
+
+from . import views
 
 app_name = 'django_approval'
-urlpatterns = []
+urlpatterns = [
+    path('approvals/', views.approval_list, name='approval_list'),
+    path('approvals/decide/', views.approval_bulk_decide, name='approval_bulk_decide'),
+    path('approvals/<int:pk>/', views.approval_detail, name='approval_detail'),
+    path('approvals/<int:pk>/<str:decision>/', views.approval_decide, name='approval_decide'),
+]
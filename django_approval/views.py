@@ -0,0 +1,219 @@
+'''
+A JSON API for moderation tools, see urls.py.
+
+Rows are read with values() and written as json without building model
+instances. Lists are paged by keyset like the admin, see paginator.py.
+Every response carries an ETag, the detail also a Last-Modified, both taken
+from Approval.modified, so clients that poll get a 304 while nothing
+changed. A decision can be made conditional on the ETag with If-Match.
+'''
+import hashlib
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+from django.views.decorators.http import require_GET, require_POST
+
+from .choices import Action, Decision, Status
+from .conf import get_setting
+from .exceptions import ApprovalError
+from .models import Approval
+from .paginator import CURSOR_VAR, KEYSET_ORDERING, ApprovalPaginator, parse_cursor
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# the columns of an approval in a list, the detail adds the payload
+LIST_FIELDS = (
+    'id',
+    'created',
+    'modified',
+    'object_id',
+    'action',
+    'status',
+    'comment',
+    'author_id',
+    'changeset_id',
+)
+DETAIL_FIELDS = LIST_FIELDS + ('changed_fields', 'source', 'diff')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def api_view(permission):
+    '''Answers with a json error unless the user has permission'''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+            if not request.user.has_perm(permission):
+                return JsonResponse({'error': 'Permission denied'}, status=403)
+            try:
+                return view(request, *args, **kwargs)
+            except BadRequest as error:
+                return JsonResponse({'error': str(error)}, status=400)
+        return wrapper
+    return decorator
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'separators': (',', ':')})
+
+
+def values(queryset, fields):
+    return queryset.values(*fields, app_label=F('content_type__app_label'), model=F('content_type__model'))
+
+
+def to_json(row):
+    '''An approval read by values(), the content type as app_label.model'''
+    row['content_type'] = '{}.{}'.format(row.pop('app_label'), row.pop('model'))
+    if 'diff' in row:
+        row['changes'] = json.loads(row.pop('diff') or '{}')
+    return row
+
+
+def make_etag(*parts):
+    dumped = json.dumps(parts, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return '"{}"'.format(hashlib.sha1(dumped.encode('utf-8')).hexdigest())
+
+
+def conditional(request, etag, modified=None):
+    '''A 304 or 412 response when the conditional headers of request say so'''
+    last_modified = int(modified.timestamp()) if modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None and response.status_code == 304:
+        set_validators(response, etag, modified)
+    return response
+
+
+def set_validators(response, etag, modified=None):
+    response['ETag'] = etag
+    if modified:
+        response['Last-Modified'] = http_date(modified.timestamp())
+    return response
+
+
+def get_validators(pk):
+    '''The ETag and modified time of approval pk, read without its payload'''
+    modified = next(iter(Approval._base_manager.filter(pk=pk).order_by().values_list('modified', flat=True)), None)
+    if modified is None:
+        raise Http404('No approval with id {}'.format(pk))
+    return make_etag(pk, modified), modified
+
+
+def get_choice(request, name, choices):
+    value = request.GET.get(name)
+    if value is not None and value not in choices:
+        raise BadRequest('Invalid {}: {}'.format(name, value))
+    return value
+
+
+def get_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRequest('Invalid {}: {}'.format(name, value))
+
+
+@require_GET
+@api_view('django_approval.view_approval')
+def approval_list(request):
+    '''The approvals newest first, filtered on content_type, object_id, status
+    and action. The next page is at the url in next.'''
+    queryset = Approval.objects.order_by(*KEYSET_ORDERING)
+    status = get_choice(request, 'status', Status.values)
+    action = get_choice(request, 'action', Action.values)
+    if status is not None:
+        queryset = queryset.filter(status=status)
+    if action is not None:
+        queryset = queryset.filter(action=action)
+    if 'content_type' in request.GET:
+        queryset = queryset.filter(content_type_id=get_int(request.GET['content_type'], 'content_type'))
+    if 'object_id' in request.GET:
+        queryset = queryset.filter(object_id=get_int(request.GET['object_id'], 'object_id'))
+    limit = min(get_int(request.GET.get('limit', PAGE_SIZE), 'limit'), MAX_PAGE_SIZE)
+    if limit < 1:
+        raise BadRequest('Invalid limit: {}'.format(limit))
+    try:
+        cursor = parse_cursor(request.GET[CURSOR_VAR]) if CURSOR_VAR in request.GET else None
+    except ValueError as error:
+        raise BadRequest(str(error))
+
+    page = ApprovalPaginator(values(queryset, LIST_FIELDS), limit, cursor=cursor, keyset=True).page(1)
+    etag = make_etag([(row['id'], row['modified']) for row in page.object_list], page.next_cursor)
+    response = conditional(request, etag)
+    if response is not None:
+        return response
+
+    next_url = None
+    if page.next_cursor:
+        params = request.GET.copy()
+        params[CURSOR_VAR] = page.next_cursor
+        next_url = '{}?{}'.format(request.path, urlencode(params, doseq=True))
+    results = [to_json(row) for row in page.object_list]
+    return set_validators(json_response({'results': results, 'next': next_url}), etag)
+
+
+@require_GET
+@api_view('django_approval.view_approval')
+def approval_detail(request, pk):
+    '''The approval with its source and changes'''
+    etag, modified = get_validators(pk)
+    response = conditional(request, etag, modified)
+    if response is not None:
+        return response
+    row = to_json(values(Approval.objects.filter(pk=pk), DETAIL_FIELDS).get())
+    return set_validators(json_response(row), etag, modified)
+
+
+@require_POST
+@api_view('django_approval.change_approval')
+def approval_decide(request, pk, decision):
+    '''Approves or rejects the approval, with If-Match only when it did not
+    change. With APPROVAL_ASYNC the decision is queued and 202 is returned.'''
+    if decision not in Decision.values:
+        raise Http404('Unknown decision: {}'.format(decision))
+    etag, modified = get_validators(pk)
+    response = conditional(request, etag, modified)
+    if response is not None:
+        return response
+
+    approval = Approval.objects.get(pk=pk)
+    try:
+        job = approval.decide(decision, user=request.user)
+    except ApprovalError as error:
+        return json_response({'error': str(error)}, status=409)
+    except ValueError as error:
+        return json_response({'error': str(error)}, status=400)
+    if job is not None:
+        return json_response({'job': job.pk}, status=202)
+    etag, modified = get_validators(pk)
+    row = to_json(values(Approval.objects.filter(pk=pk), LIST_FIELDS).get())
+    return set_validators(json_response(row), etag, modified)
+
+
+@require_POST
+@api_view('django_approval.change_approval')
+def approval_bulk_decide(request):
+    '''Decides the approvals of a json body {"decision": "approve", "ids": [1, 2]}
+    with set based writes, see ApprovalQueryset.approve. Returns the report.'''
+    try:
+        body = json.loads(request.body or b'{}')
+        decision, ids = body['decision'], [int(pk) for pk in body['ids']]
+    except (ValueError, TypeError, KeyError):
+        raise BadRequest('Expected {"decision": "approve" or "reject", "ids": [...]}')
+    if decision not in Decision.values:
+        raise BadRequest('Invalid decision: {}'.format(decision))
+
+    queryset = Approval.objects.filter(pk__in=ids)
+    if get_setting('ASYNC'):
+        jobs = queryset.enqueue(decision, user=request.user)
+        return json_response({'jobs': [job.pk for job in jobs]}, status=202)
+    report = getattr(queryset, decision)(user=request.user)
+    return json_response({'results': [result._asdict() for result in report]})
@@ -56,13 +56,13 @@ setup(
         'django_approval',
     ],
     include_package_data=True,
-    install_requires=["django-model-utils>=2.0", ],
+    install_requires=["Django>=3.1", "django-model-utils>=2.0", ],
     license="Apache Software License 2.0",
     zip_safe=False,
     keywords='django-approval',
     classifiers=[
         'Development Status :: 3 - Alpha',
-        'Framework :: Django :: 2.0',
+        'Framework :: Django :: 3.1',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',
         'Natural Language :: English',
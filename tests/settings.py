@@ -12,12 +12,21 @@ SECRET_KEY = "testing_secret"
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'django_approval',
+# DB_BACKEND=sqlite runs the tests against SQLite instead of PostgreSQL
+if os.environ.get('DB_BACKEND') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'django_approval.sqlite3'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': 'django_approval',
+        }
     }
-}
 
 
 ROOT_URLCONF = "tests.urls"
@@ -1,14 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from unittest import mock
+
+from django.contrib.admin.models import LogEntry
 from django.contrib.admin.sites import AdminSite
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.core.serializers import serialize
-from django.test import TestCase
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from unittest import skipUnless
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, reverse
 
-from django_approval.admin import reverse_admin_name
+from django_approval.admin import ApprovalModelAdmin, get_url_template, reverse_admin_name
+from django_approval.cache import CONTENT_TYPES_KEY, get_content_type_ids
 from django_approval.admin import APPROVE_NAME, REJECT_NAME
-from django_approval.choices import Status
+from django_approval.choices import Action, Status
+from django_approval.models import Approval
+from django_approval.paginator import KEYSET_ORDERING, ApprovalPaginator
 
 from django_approval.test_utils import factories as factory
 from django_approval.test_utils.test_app import models as test_models
@@ -102,3 +115,375 @@ class InlineApproval(TestCase):
 
         qs = inline.get_queryset(get_request)
         self.assertEquals(qs.count(), 2)
+
+    def test_inline_queryset_uses_resolved_url(self):
+        '''The resolver match of the request is used rather than resolving the path again'''
+        site = AdminSite()
+        get_request = request.get('/not/an/admin/url/')
+        get_request.user = self.user
+        get_request.resolver_match = ResolverMatch(
+            lambda: None, args=(), kwargs={'object_id': str(self.parent.pk)}
+        )
+        inline = admin.ChildApprovalAdmin(test_models.Parent, site)
+
+        qs = inline.get_queryset(get_request)
+
+        self.assertEqual(set(qs), {self.approval, self.second_approval})
+
+    def test_add_view(self):
+        '''A new parent shows no approvals'''
+        url = reverse_admin_name(test_models.Parent, 'add')
+
+        resp = self.client.get(url)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.context['inline_admin_formsets'][0].formset.queryset), [])
+
+    def test_parent_fk_name_is_resolved_once(self):
+        '''The foreign key to the parent is cached on the inline class'''
+        site = AdminSite()
+        admin.ChildApprovalAdmin(test_models.Parent, site)
+
+        with mock.patch.object(test_models.Child._meta, 'get_fields') as get_fields:
+            inline = admin.ChildApprovalAdmin(test_models.Parent, site)
+
+        get_fields.assert_not_called()
+        self.assertEqual(inline.parent_fk_name, 'parent')
+
+    def test_inline_without_foreign_key_to_parent(self):
+        '''An inline for a model that does not point at the parent is misconfigured'''
+        with self.assertRaises(ImproperlyConfigured):
+            admin.ChildApprovalAdmin(test_models.Child, AdminSite())
+
+
+class ApprovalChangelistTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = factory.UserFactory()
+        self.client.force_login(self.user)
+        self.changelist_url = reverse('admin:django_approval_approval_changelist')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        '''Targets, content types and authors are fetched in bulk'''
+        factory.ChildApprovalFactory(author=self.user)
+        # warms up the cached content types of the model filter
+        self.client.get(self.changelist_url)
+        few = self.count_queries(self.changelist_url)
+        factory.ChildApprovalFactory.create_batch(5, author=self.user)
+        many = self.count_queries(self.changelist_url)
+
+        self.assertEqual(few, many)
+
+    def test_approval_change_view_shows_diff(self):
+        '''The stored diff is rendered in the detail view'''
+        approval = factory.ChildApprovalFactory(diff='{"field1":["old","new"]}')
+        url = reverse('admin:django_approval_approval_change', args=[approval.pk])
+
+        resp = self.client.get(url)
+
+        self.assertContains(resp, '<td>field1</td><td>old</td><td>new</td>', html=False)
+
+    def test_change_view_queries_do_not_grow_with_rows(self):
+        '''The inline of the parent resolves all child approvals in bulk'''
+        approval = factory.ChildApprovalFactory()
+        parent = approval.content_object.parent
+        parent_url = reverse_admin_name(
+            test_models.Parent, 'change', kwargs={'object_id': parent.pk}
+        )
+        few = self.count_queries(parent_url)
+        factory.ChildApprovalFactory.create_batch(5, content_object__parent=parent)
+        many = self.count_queries(parent_url)
+
+        self.assertEqual(few, many)
+
+
+class ApprovalPaginatorTest(TestCase):
+    def setUp(self):
+        self.user = factory.UserFactory()
+        self.client.force_login(self.user)
+        self.changelist_url = reverse('admin:django_approval_approval_changelist')
+        self.approvals = factory.ChildApprovalFactory.create_batch(5)
+        self.newest_first = list(Approval.objects.order_by(*KEYSET_ORDERING))
+
+    def get_results(self, url, params=None):
+        with mock.patch.object(ApprovalModelAdmin, 'list_per_page', 2):
+            return self.client.get(url, params).context['cl']
+
+    def test_keyset_pages(self):
+        '''The pages follow each other by cursor, newest first and without OFFSET'''
+        pages = []
+        url = self.changelist_url
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                cl = self.get_results(url)
+                pages.append(list(cl.result_list))
+                url = cl.next_page_url and self.changelist_url + cl.next_page_url
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), self.newest_first)
+        self.assertFalse([query for query in context.captured_queries if 'OFFSET' in query['sql']])
+
+    def test_filters_start_at_the_first_page(self):
+        '''Links to other filters drop the cursor'''
+        cl = self.get_results(self.changelist_url)
+        cl = self.get_results(self.changelist_url + cl.next_page_url)
+
+        self.assertNotIn('cursor', cl.get_query_string({'status': Status.approved}))
+        self.assertIsNotNone(cl.first_page_url)
+
+    def test_invalid_cursor(self):
+        '''An invalid cursor is an incorrect lookup'''
+        resp = self.client.get(self.changelist_url, {'cursor': 'invalid'})
+
+        self.assertRedirects(resp, self.changelist_url + '?e=1')
+
+    def test_other_orderings_use_offset_pages(self):
+        '''Sorting on a column pages the stock way'''
+        queryset = Approval.objects.order_by('status', 'pk')
+        paginator = ApprovalPaginator(queryset, 2, keyset=False)
+
+        self.assertEqual(list(paginator.page(2).object_list), list(queryset[2:4]))
+
+    def test_covered_filters_are_counted(self):
+        '''A filter served by an index is counted exactly'''
+        with CaptureQueriesContext(connection) as context:
+            cl = self.get_results(self.changelist_url, {'status': Status.none})
+
+        self.assertFalse(cl.paginator.estimated)
+        self.assertEqual(cl.result_count, 5)
+        self.assertTrue([query for query in context.captured_queries if 'COUNT(*)' in query['sql']])
+
+    def test_count_leaves_out_annotations(self):
+        '''The exact count does not evaluate the subqueries of the list columns'''
+        with CaptureQueriesContext(connection) as context:
+            cl = self.get_results(self.changelist_url, {'status': Status.none})
+        counts = [query['sql'] for query in context.captured_queries if 'COUNT(*)' in query['sql']]
+
+        self.assertEqual(cl.result_count, 5)
+        self.assertEqual(len(counts), 1)
+        self.assertNotIn('SELECT', counts[0][len('SELECT'):])
+
+    @skipUnless(connection.vendor == 'postgresql', 'estimates are made by PostgreSQL')
+    def test_unfiltered_count_is_estimated(self):
+        '''The whole table is counted from its statistics'''
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE django_approval_approval')
+        with CaptureQueriesContext(connection) as context:
+            cl = self.get_results(self.changelist_url)
+
+        self.assertTrue(cl.paginator.estimated)
+        self.assertContains(self.client.get(self.changelist_url), 'about')
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(*)' in query['sql']])
+
+    @skipUnless(connection.vendor == 'postgresql', 'estimates are made by PostgreSQL')
+    def test_uncovered_filter_is_estimated(self):
+        '''A filter without an index is estimated by the planner'''
+        cl = self.get_results(self.changelist_url, {'action': Action.update})
+
+        self.assertTrue(cl.paginator.estimated)
+
+
+class ModelFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.approval = factory.ChildApprovalFactory()
+        self.child_type = ContentType.objects.get_for_model(test_models.Child)
+        self.parent_type = ContentType.objects.get_for_model(test_models.Parent)
+
+    def test_content_types_are_cached(self):
+        '''The distinct scan over approvals only happens once'''
+        self.assertEqual(get_content_type_ids(), [self.child_type.pk])
+        with self.assertNumQueries(0):
+            get_content_type_ids()
+
+    def test_known_content_type_keeps_cache(self):
+        get_content_type_ids()
+        factory.ChildApprovalFactory()
+
+        with self.assertNumQueries(0):
+            get_content_type_ids()
+
+    def test_filter_on_content_type_id(self):
+        '''The filter is keyed on the content type id'''
+        factory.ChildApprovalFactory(content_type=self.parent_type)
+        user = factory.UserFactory()
+        self.client.force_login(user)
+        url = reverse('admin:django_approval_approval_changelist')
+
+        resp = self.client.get(url, {'content_type': self.child_type.pk})
+
+        self.assertEqual(list(resp.context['cl'].result_list), [self.approval])
+        self.assertContains(resp, self.parent_type.app_labeled_name)
+
+    def test_invalid_content_type(self):
+        '''A content type that is not an id is an incorrect lookup'''
+        self.client.force_login(factory.UserFactory())
+        url = reverse('admin:django_approval_approval_changelist')
+
+        resp = self.client.get(url, {'content_type': 'abc'})
+
+        self.assertRedirects(resp, url + '?e=1')
+
+    def test_removed_content_type(self):
+        '''Cached ids of content types that were removed are left out'''
+        self.client.force_login(factory.UserFactory())
+        cache.set(CONTENT_TYPES_KEY, [self.parent_type.pk, 0], None)
+        self.addCleanup(cache.clear)
+
+        resp = self.client.get(reverse('admin:django_approval_approval_changelist'))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, self.parent_type.app_labeled_name)
+
+
+class ContentTypeCacheTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        factory.ChildApprovalFactory()
+        self.child_type = ContentType.objects.get_for_model(test_models.Child)
+        self.parent_type = ContentType.objects.get_for_model(test_models.Parent)
+
+    def test_new_content_type_invalidates_cache(self):
+        '''An approval for a content type that is not cached drops the cache'''
+        get_content_type_ids()
+        factory.ChildApprovalFactory(content_type=self.parent_type)
+
+        self.assertEqual(
+            get_content_type_ids(), sorted([self.child_type.pk, self.parent_type.pk])
+        )
+
+    def test_rolled_back_approval_keeps_cache(self):
+        '''The cache is only dropped once the approval is committed'''
+        get_content_type_ids()
+        with transaction.atomic():
+            factory.ChildApprovalFactory(content_type=self.parent_type)
+            self.assertEqual(get_content_type_ids(), [self.child_type.pk])
+            transaction.set_rollback(True)
+
+        self.assertEqual(get_content_type_ids(), [self.child_type.pk])
+
+    def test_deleted_content_type_invalidates_cache(self):
+        '''Deleting a content type deletes its approvals and drops the cache'''
+        get_content_type_ids()
+        self.child_type.delete()
+
+        self.assertEqual(get_content_type_ids(), [])
+
+
+class ApprovalAdminActionTest(TestCase):
+    def setUp(self):
+        self.approval = factory.ChildApprovalFactory(action=Action.delete)
+        self.user = factory.UserFactory()
+        self.client.force_login(self.user)
+        self.changelist_url = reverse('admin:django_approval_approval_changelist')
+
+    def test_approve_selected_action(self):
+        '''Selected approvals are approved in bulk from the changelist'''
+        data = {'action': 'approve_selected', '_selected_action': [self.approval.pk]}
+        self.client.post(self.changelist_url, data)
+        self.approval.refresh_from_db()
+
+        self.assertEqual(self.approval.status, Status.approved)
+
+    def test_reject_selected_action(self):
+        '''Selected approvals are rejected in bulk from the changelist'''
+        data = {'action': 'reject_selected', '_selected_action': [self.approval.pk]}
+        self.client.post(self.changelist_url, data)
+        self.approval.refresh_from_db()
+
+        self.assertEqual(self.approval.status, Status.rejected)
+
+
+class ReverseAdminNameTest(TestCase):
+
+    def test_reverse_matches_django_reverse(self):
+        '''The template based url is the same as the one reverse gives'''
+        url = reverse_admin_name(test_models.Parent, APPROVE_NAME, kwargs={'approval_id': 12})
+
+        self.assertEqual(url, reverse('admin:test_app_parent_approve', kwargs={'approval_id': 12}))
+
+    def test_reverse_with_args_and_params(self):
+        url = reverse_admin_name('test_app.Parent', 'change', args=['a b'], params={'q': 1})
+
+        self.assertEqual(url, reverse('admin:test_app_parent_change', args=['a b']) + '?q=1')
+
+    def test_reverse_accepts_instances(self):
+        '''Instances share the template of their model class'''
+        parent = factory.ParentFactory()
+        reverse_admin_name(test_models.Parent, 'change', args=[parent.pk])
+        size = get_url_template.cache_info().currsize
+
+        url = reverse_admin_name(parent, 'change', args=[parent.pk])
+
+        self.assertEqual(get_url_template.cache_info().currsize, size)
+        self.assertEqual(url, reverse('admin:test_app_parent_change', args=[parent.pk]))
+
+    def test_reverse_is_resolved_once(self):
+        '''The url patterns are only walked the first time'''
+        reverse_admin_name(test_models.Parent, REJECT_NAME, kwargs={'approval_id': 1})
+
+        with mock.patch('django_approval.admin.reverse') as patched:
+            url = reverse_admin_name(test_models.Parent, REJECT_NAME, kwargs={'approval_id': 2})
+
+        patched.assert_not_called()
+        self.assertEqual(url, reverse('admin:test_app_parent_reject', kwargs={'approval_id': 2}))
+
+
+class ApprovalFormAdminTest(TestCase):
+    '''The admin of the test app that edits children through the approval forms'''
+
+    def setUp(self):
+        self.parent = factory.ParentFactory()
+        self.child = factory.ChildFactory(parent=self.parent)
+        self.user = factory.UserFactory()
+        self.client.force_login(self.user)
+
+    def inline_data(self, **changes):
+        child = dict(
+            {'id': self.child.pk, 'field1': self.child.field1, 'field2': self.child.field2}, **changes
+        )
+        data = {
+            'name': self.parent.name,
+            'child_set-TOTAL_FORMS': 2,
+            'child_set-INITIAL_FORMS': 1,
+            'child_set-MIN_NUM_FORMS': 0,
+            'child_set-MAX_NUM_FORMS': 1000,
+            'child_set-1-field1': 'new',
+            'child_set-1-field2': 'new',
+            'child_set-1-parent': self.parent.pk,
+        }
+        for name, value in child.items():
+            data['child_set-0-{}'.format(name)] = value
+        data['child_set-0-parent'] = self.parent.pk
+        return data
+
+    def test_inline_changeset(self):
+        '''An inline submission makes a changeset and a change message'''
+        url = reverse('approval_forms:test_app_parent_change', args=[self.parent.pk])
+
+        resp = self.client.post(url, self.inline_data(field1='changed'))
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(
+            set(Approval.objects.filter(changeset__isnull=False).values_list('action', flat=True)),
+            {Action.create, Action.update}
+        )
+        self.assertEqual(Approval.objects.get(action=Action.update).changed_fields, ['field1'])
+        self.assertTrue(LogEntry.objects.filter(object_id=str(self.parent.pk)).exists())
+
+    def test_unchanged_and_repeated_change(self):
+        '''Resubmitting an unchanged child, or the same change again, saves nothing new'''
+        url = reverse('approval_forms:test_app_child_change', args=[self.child.pk])
+        data = {'field1': self.child.field1, 'field2': self.child.field2, 'parent': self.parent.pk}
+
+        unchanged = self.client.post(url, data)
+        first = self.client.post(url, dict(data, field1='changed'))
+        repeated = self.client.post(url, dict(data, field1='changed'))
+
+        self.assertEqual([unchanged.status_code, first.status_code, repeated.status_code], [302, 302, 302])
+        self.assertEqual(Approval.objects.get().changes['field1'][1], 'changed')
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from django_approval.choices import Event, Status
+from django_approval.models import Approval, ApprovalArchive, ApprovalEvent
+from django_approval.test_utils import factories as factory
+
+RETENTION = {
+    'default': {'approved': 30, 'rejected': 10},
+    'test_app.child': {'rejected': None},
+}
+
+
+def decided(days_ago, status=Status.approved, **kwargs):
+    approval = factory.ChildApprovalFactory(status=status, **kwargs)
+    Approval.objects.filter(pk=approval.pk).update(
+        modified=timezone.now() - timedelta(days=days_ago)
+    )
+    return approval
+
+
+class ExpiredTest(TestCase):
+
+    def test_expired_by_days(self):
+        '''Only decided approvals older than the given days are expired'''
+        old = decided(20)
+        decided(5)
+        factory.ChildApprovalFactory()
+
+        self.assertEqual(list(Approval.objects.all().expired(days=10)), [old])
+
+    @override_settings(APPROVAL_RETENTION=RETENTION)
+    def test_expired_by_policy(self):
+        '''The policy per content type overrides the default policy'''
+        old_approved = decided(40)
+        decided(20)
+        decided(40, status=Status.rejected)
+
+        self.assertEqual(list(Approval.objects.all().expired()), [old_approved])
+
+    def test_nothing_expires_without_policy(self):
+        decided(400)
+
+        self.assertEqual(Approval.objects.all().expired().count(), 0)
+
+
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        self.old = decided(20, comment='archive me')
+        self.other_old = decided(20, status=Status.rejected)
+        self.recent = decided(1)
+        self.pending = factory.ChildApprovalFactory()
+
+    def test_archive_moves_rows(self):
+        '''Archived approvals keep their id and leave the approval table'''
+        count = Approval.objects.all().expired(days=10).archive(batch_size=1)
+
+        self.assertEqual(count, 2)
+        self.assertEqual(set(Approval.objects.all()), {self.recent, self.pending})
+        archived = ApprovalArchive.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.comment, 'archive me')
+        self.assertEqual(archived.content_object, self.old.content_object)
+
+    def test_archive_never_moves_pending_rows(self):
+        Approval.objects.all().archive()
+
+        self.assertEqual(list(Approval.objects.all()), [self.pending])
+
+    def test_archive_keeps_approvals_with_unsent_events(self):
+        '''Approvals of which the outbox still holds events stay until they are sent'''
+        ApprovalEvent.objects.create(approval=self.old, event=Event.approved)
+
+        count = Approval.objects.all().expired(days=10).archive()
+
+        self.assertEqual(count, 1)
+        self.assertTrue(ApprovalEvent.objects.filter(approval=self.old).exists())
+        self.assertFalse(ApprovalArchive.objects.filter(pk=self.old.pk).exists())
+
+        ApprovalEvent.objects.flush()
+        self.assertEqual(Approval.objects.all().expired(days=10).archive(), 1)
+
+    def test_archive_command_to_file(self):
+        '''With --output the rows are appended to a gzipped jsonl file, with the archive columns'''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archive.jsonl.gz')
+            call_command('archive_approvals', days=10, output=path, stdout=io.StringIO())
+            with gzip.open(path, 'rt') as stream:
+                rows = [json.loads(line) for line in stream]
+
+        self.assertEqual({row['id'] for row in rows}, {self.old.pk, self.other_old.pk})
+        columns = {field.attname for field in ApprovalArchive._meta.concrete_fields} - {'archived'}
+        self.assertEqual(set(rows[0]), columns)
+        self.assertEqual(ApprovalArchive.objects.count(), 0)
+        self.assertEqual(Approval.objects.count(), 2)
+
+    def test_archive_command_dry_run(self):
+        stdout = io.StringIO()
+        call_command('archive_approvals', days=10, dry_run=True, stdout=stdout)
+
+        self.assertIn('2 approvals would be archived', stdout.getvalue())
+        self.assertEqual(Approval.objects.count(), 4)
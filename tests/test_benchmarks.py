@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from benchmarks import suite
+from benchmarks.utils import seed_approvals
+
+
+@skipUnless(connection.vendor == 'postgresql', 'the baseline is measured on PostgreSQL')
+class BenchmarkQueriesTest(TestCase):
+
+    def setUp(self):
+        # the smallest size of the suite, counts of the changelist depend on it
+        seed_approvals(suite.SIZES['1k'], first_object=suite.SEEDED_OBJECTS)
+
+    def test_queries_do_not_exceed_the_baseline(self):
+        '''Every case of the benchmark suite makes at most the queries of the baseline'''
+        baseline = suite.load_baseline()['1k']['results']
+        for name, case in suite.CASES.items():
+            with self.subTest(case=name):
+                result = suite.measure(case(3))
+                self.assertLessEqual(result['queries'], baseline[name]['queries'])
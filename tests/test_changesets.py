@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.db import connection
+from django.forms import inlineformset_factory, modelformset_factory
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from django_approval.choices import Action, Status
+from django_approval.exceptions import ApprovalError
+from django_approval.forms import ApprovalInlineFormSet, ApprovalModelFormSet
+from django_approval.models import Approval, ApprovalChangeset
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app.forms import ChildModelForm
+from django_approval.test_utils.test_app.models import Child, Parent
+
+ChildFormSet = modelformset_factory(
+    Child, form=ChildModelForm, formset=ApprovalModelFormSet, extra=1, can_delete=True
+)
+ChildInlineFormSet = inlineformset_factory(
+    Parent, Child, form=ChildModelForm, formset=ApprovalInlineFormSet, fields='__all__', extra=1
+)
+
+
+def formset_data(prefix, children, extra=None, overrides=None):
+    '''POST data of a formset for children, overrides are {index: {field: value}}'''
+    rows = [
+        {'id': child.pk, 'field1': child.field1, 'field2': child.field2, 'parent': child.parent_id}
+        for child in children
+    ]
+    if extra:
+        rows.append(extra)
+    data = {
+        '{}-TOTAL_FORMS'.format(prefix): len(rows),
+        '{}-INITIAL_FORMS'.format(prefix): len(children),
+    }
+    for index, row in enumerate(rows):
+        row.update((overrides or {}).get(index, {}))
+        for name, value in row.items():
+            data['{}-{}-{}'.format(prefix, index, name)] = value
+    return data
+
+
+class ChangesetFormSetTest(TestCase):
+
+    def setUp(self):
+        self.parent = factory.ParentFactory()
+        self.children = [factory.ChildFactory(parent=self.parent) for _ in range(3)]
+        self.request = RequestFactory().post('/')
+        self.request.user = factory.UserFactory()
+
+    def save(self, overrides):
+        data = formset_data(
+            'form', self.children, extra={'field1': 'new', 'field2': 'new', 'parent': self.parent.pk},
+            overrides=overrides
+        )
+        formset = ChildFormSet(data, queryset=Child.objects.order_by('pk'), request=self.request)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        return formset, formset.save()
+
+    def test_one_changeset_per_submission(self):
+        '''Every changed, added or deleted form becomes an approval of one changeset'''
+        with CaptureQueriesContext(connection) as queries:
+            formset, approvals = self.save({0: {'field1': 'changed'}, 1: {'DELETE': 'on'}})
+        inserts = [
+            query for query in queries
+            if query['sql'].startswith('INSERT INTO "django_approval_approval"')
+        ]
+
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ApprovalChangeset.objects.get(), formset.changeset)
+        self.assertEqual(formset.changeset.author, self.request.user)
+        self.assertEqual(
+            sorted(formset.changeset.approvals.values_list('action', flat=True)),
+            [Action.create, Action.delete, Action.update]
+        )
+        self.assertEqual(Child.objects.get(pk=self.children[0].pk).field1, self.children[0].field1)
+
+    def test_update_of_the_changeset(self):
+        '''Updates only hold their changed fields and a snapshot'''
+        formset, approvals = self.save({0: {'field1': 'changed'}})
+        update = formset.changeset.approvals.get(action=Action.update)
+
+        self.assertEqual(update.changed_fields, ['field1'])
+        self.assertEqual(update.source['fields'], {'field1': 'changed'})
+        self.assertNotEqual(update.snapshot, '')
+
+    def test_approve(self):
+        '''All approvals of a changeset are applied together'''
+        formset, approvals = self.save({0: {'field1': 'changed'}, 1: {'DELETE': 'on'}})
+
+        formset.changeset.approve(self.request.user)
+
+        self.assertEqual(Child.objects.get(pk=self.children[0].pk).field1, 'changed')
+        self.assertFalse(Child.objects.filter(pk=self.children[1].pk).exists())
+        self.assertTrue(Child.objects.filter(field1='new').exists())
+        self.assertEqual(formset.changeset.status, Status.approved)
+        self.assertEqual(formset.changeset.approvals.filter(status=Status.approved).count(), 3)
+
+    def test_approve_is_all_or_nothing(self):
+        '''When one approval is stale none of the changeset is applied'''
+        formset, approvals = self.save({0: {'field1': 'changed'}, 1: {'field1': 'changed'}})
+        Child.objects.filter(pk=self.children[1].pk).update(field1='concurrent')
+
+        with self.assertRaises(ApprovalError):
+            formset.changeset.approve()
+
+        self.assertEqual(Child.objects.get(pk=self.children[0].pk).field1, self.children[0].field1)
+        self.assertFalse(Child.objects.filter(field1='new').exists())
+        self.assertEqual(formset.changeset.approvals.filter(status=Status.none).count(), 3)
+        self.assertEqual(ApprovalChangeset.objects.get().status, Status.none)
+
+    def test_reject(self):
+        '''Rejecting a changeset rejects all of its approvals'''
+        formset, approvals = self.save({0: {'field1': 'changed'}})
+
+        formset.changeset.reject()
+
+        self.assertEqual(formset.changeset.approvals.filter(status=Status.rejected).count(), 2)
+        self.assertEqual(formset.changeset.status, Status.rejected)
+
+    def test_unchanged_formset(self):
+        '''Nothing is saved when no form changed'''
+        data = formset_data('form', self.children)
+        formset = ChildFormSet(data, queryset=Child.objects.order_by('pk'), request=self.request)
+        self.assertTrue(formset.is_valid(), formset.errors)
+
+        self.assertEqual(formset.save(), [])
+        self.assertEqual(Approval.objects.count(), 0)
+        self.assertEqual(ApprovalChangeset.objects.count(), 0)
+
+    def test_inline_formset(self):
+        '''The inline formset sets the parent on new objects'''
+        data = formset_data('child_set', self.children, extra={'field1': 'new', 'field2': 'new'})
+        formset = ChildInlineFormSet(data, instance=self.parent, request=self.request)
+        self.assertTrue(formset.is_valid(), formset.errors)
+
+        approvals = formset.save()
+        formset.changeset.approve()
+
+        self.assertEqual(len(approvals), 1)
+        self.assertEqual(Child.objects.get(field1='new').parent, self.parent)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from django_approval.choices import Action, Status
+from django_approval.models import Approval
+from django_approval.test_utils import factories as factory
+
+
+class StreamExportTest(TestCase):
+
+    def setUp(self):
+        self.approval = factory.ChildApprovalFactory(source=[{'model': 'test_app.child'}])
+        self.rejected = factory.ChildApprovalFactory(status=Status.rejected, action=Action.update)
+
+    def test_export_jsonl(self):
+        '''Every approval is one json line, including the source'''
+        stream = io.StringIO()
+
+        count = Approval.objects.all().stream_export(stream)
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+        self.assertEqual(count, 2)
+        self.assertEqual(lines[0]['id'], self.approval.pk)
+        self.assertEqual(lines[0]['content_type'], 'test_app.child')
+        self.assertEqual(lines[0]['source'], [{'model': 'test_app.child'}])
+
+    def test_export_csv(self):
+        '''The csv has a header and the source as a json column'''
+        stream = io.StringIO()
+
+        Approval.objects.all().stream_export(stream, format='csv', chunk_size=1)
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(json.loads(rows[0]['source']), [{'model': 'test_app.child'}])
+        self.assertEqual(rows[1]['status'], Status.rejected)
+
+    def test_export_unknown_format(self):
+        with self.assertRaises(ValueError):
+            Approval.objects.all().stream_export(io.StringIO(), format='xml')
+
+
+class ExportCommandTest(TestCase):
+
+    def setUp(self):
+        self.approval = factory.ChildApprovalFactory()
+        self.rejected = factory.ChildApprovalFactory(status=Status.rejected, action=Action.update)
+
+    def export(self, **options):
+        stdout = io.StringIO()
+        call_command('export_approvals', stdout=stdout, stderr=io.StringIO(), **options)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_export_filters(self):
+        '''Status, action and content type narrow down the export'''
+        self.assertEqual(len(self.export()), 2)
+        self.assertEqual([row['id'] for row in self.export(status='rejected')], [self.rejected.pk])
+        self.assertEqual([row['id'] for row in self.export(status='pending')], [self.approval.pk])
+        self.assertEqual([row['id'] for row in self.export(action='update')], [self.rejected.pk])
+        self.assertEqual(self.export(content_type=['test_app.parent']), [])
+
+    def test_export_created_range(self):
+        '''Approvals can be exported by created date'''
+        Approval.objects.filter(pk=self.rejected.pk).update(
+            created=timezone.now() - timedelta(days=10)
+        )
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+
+        self.assertEqual([row['id'] for row in self.export(created_after=since)], [self.approval.pk])
+        self.assertEqual([row['id'] for row in self.export(created_before=since)], [self.rejected.pk])
+
+    def test_export_unknown_content_type(self):
+        with self.assertRaises(CommandError):
+            self.export(content_type=['nope.nope'])
+
+    def test_export_to_gzip_file(self):
+        '''The export can be compressed on the fly'''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'approvals.jsonl.gz')
+            call_command('export_approvals', output=path, gzip=True, stderr=io.StringIO())
+            with gzip.open(path, 'rt') as stream:
+                lines = stream.read().splitlines()
+
+        self.assertEqual(len(lines), 2)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from django_approval.fields import COMPRESSED_KEY
+from django_approval.models import Approval
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app.models import Child
+
+
+def stored_source(approval):
+    '''The source as it is in the table'''
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT source FROM django_approval_approval WHERE id = %s', [approval.pk])
+        return str(cursor.fetchone()[0])
+
+
+class SourceCompressionTest(TestCase):
+
+    def setUp(self):
+        self.large = Approval.make_source(Child(pk=1, field1='x' * 200, field2='b', parent_id=1))
+        self.small = Approval.make_source(Child(pk=2, field1='small', field2='b', parent_id=1), fields=['field1'])
+
+    def test_sources_are_not_compressed_by_default(self):
+        '''Without APPROVAL_COMPRESS_THRESHOLD sources are stored as they are'''
+        approval = factory.ChildApprovalFactory(source=self.large)
+
+        self.assertNotIn(COMPRESSED_KEY, stored_source(approval))
+
+    @override_settings(APPROVAL_COMPRESS_THRESHOLD=100)
+    def test_large_sources_are_compressed(self):
+        '''Sources over the threshold are compressed and read back as they were'''
+        large = factory.ChildApprovalFactory(source=self.large)
+        small = factory.ChildApprovalFactory(source=self.small)
+
+        self.assertIn(COMPRESSED_KEY, stored_source(large))
+        self.assertNotIn(COMPRESSED_KEY, stored_source(small))
+        self.assertEqual(Approval.objects.get(pk=large.pk).source, self.large)
+        self.assertEqual(Approval.objects.get(pk=large.pk).get_source_object().field1, 'x' * 200)
+        self.assertEqual(list(Approval.objects.all().changing(field1='small')), [small])
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase, override_settings
+
+from django_approval.choices import Action, Status
+from django_approval.models import Approval
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.fixtures import add_indexes, generate_fixtures, remove_indexes
+from django_approval.test_utils.test_app.models import Child, Parent
+
+
+class GenerateFixturesTest(TestCase):
+
+    def test_counts(self):
+        '''Parents, children and approvals are written in chunks'''
+        counts = generate_fixtures(50, objects=12, children_per_parent=5, chunk_size=7, seed=1)
+
+        self.assertEqual(counts, {'parents': 3, 'children': 12, 'approvals': 50})
+        self.assertEqual(Parent.objects.count(), 3)
+        self.assertEqual(Child.objects.filter(parent=Parent.objects.last()).count(), 2)
+        self.assertEqual(Approval.objects.count(), 50)
+
+    def test_ids_follow_existing_rows(self):
+        '''New objects get ids after the existing ones, and factories after them'''
+        existing = factory.ChildFactory()
+
+        generate_fixtures(10, objects=2, seed=1)
+        created = factory.ChildFactory()
+
+        self.assertEqual(Child.objects.order_by('pk')[1].pk, existing.pk + 1)
+        self.assertEqual(created.pk, existing.pk + 3)
+        self.assertFalse(Approval.objects.filter(object_id__lte=existing.pk).exists())
+
+    def test_mix(self):
+        '''Only the statuses and actions with a weight are made'''
+        generate_fixtures(
+            40, statuses={Status.none: 1, Status.rejected: 0}, actions={Action.update: 1}, seed=1
+        )
+
+        self.assertEqual(set(Approval.objects.values_list('status', 'action')), {(Status.none, Action.update)})
+        approval = Approval.objects.first()
+        self.assertEqual(approval.changed_fields, ['field1'])
+        self.assertEqual(approval.changes['field1'][1], approval.source['fields']['field1'])
+
+    def test_pending_creates_have_no_object(self):
+        '''A pending create targets no object yet'''
+        generate_fixtures(20, statuses={Status.none: 1}, actions={Action.create: 1}, seed=1)
+
+        self.assertFalse(Approval.objects.filter(object_id__isnull=False).exists())
+
+    def test_hot_objects(self):
+        '''A share of the approvals targets the hot objects'''
+        generate_fixtures(100, objects=50, hot_objects=2, hot_share=1, actions={Action.update: 1}, seed=1)
+
+        self.assertEqual(Approval.objects.values('object_id').distinct().count(), 2)
+
+    def test_approvals_can_be_decided(self):
+        '''The approvals are made like FormUsingApproval makes them'''
+        generate_fixtures(
+            20, statuses={Status.none: 1}, actions={Action.update: 1}, payload_size=300, seed=1
+        )
+        approval = Approval.objects.first()
+
+        approval.approve()
+
+        self.assertEqual(approval.payload_hash, approval.get_payload_hash())
+        self.assertEqual(len(approval.source['padding']), 300)
+        self.assertEqual(Child.objects.get(pk=approval.object_id).field1, approval.source['fields']['field1'])
+
+    def test_seed(self):
+        '''The same seed writes the same approvals'''
+        generate_fixtures(20, seed=3)
+        first = list(Approval.objects.order_by('pk').values_list('status', 'action', 'object_id'))
+        Approval.objects.all().delete()
+        Parent.objects.all().delete()
+
+        generate_fixtures(20, seed=3)
+        second = list(Approval.objects.order_by('pk').values_list('status', 'action', 'object_id'))
+
+        self.assertEqual(first, second)
+
+    def test_drop_indexes(self):
+        '''All but the primary key and unique indexes are dropped, and made again after the load'''
+        def indexes():
+            with connection.cursor() as cursor:
+                return connection.introspection.get_constraints(cursor, Approval._meta.db_table)
+
+        before = indexes()
+        statements = remove_indexes([Approval], DEFAULT_DB_ALIAS)
+        dropped = indexes()
+        add_indexes(statements, DEFAULT_DB_ALIAS)
+        generate_fixtures(30, drop_indexes=True, seed=1)
+
+        self.assertIn('approval_pending_idx', before)
+        self.assertFalse([
+            name for name, info in dropped.items() if info['index'] and not info['primary_key'] and not info['unique']
+        ])
+        self.assertEqual(indexes(), before)
+        self.assertEqual(Approval.objects.count(), 30)
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY is only used on PostgreSQL')
+    @override_settings(APPROVAL_COMPRESS_THRESHOLD=100)
+    def test_copy(self):
+        '''COPY writes the same approvals as bulk_create, compressed sources included,
+        also with the indexes dropped during the load'''
+        generate_fixtures(10, payload_size=200, method='copy', drop_indexes=True, seed=1)
+        copied = list(Approval.objects.order_by('pk').values_list('status', 'action', 'source'))
+        compressed = Approval.objects.filter(source__has_key='__zlib__').count()
+        Approval.objects.all().delete()
+
+        generate_fixtures(10, payload_size=200, method='bulk_create', seed=1)
+        created = list(Approval.objects.order_by('pk').values_list('status', 'action', 'source'))
+
+        self.assertEqual([row[:2] for row in copied], [row[:2] for row in created])
+        self.assertEqual(compressed, 10)
+        self.assertEqual(len(copied[0][2]['padding']), 200)
+
+
+class GenerateFixturesCommandTest(TestCase):
+
+    def call(self, *args, **options):
+        stdout = io.StringIO()
+        call_command('generate_approval_fixtures', *args, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_command(self):
+        '''The command parses the mixes and reports what it wrote'''
+        output = self.call(
+            '30', '--statuses', 'pending=1,approved=0', '--actions', 'delete=1', '--drop-indexes', '--seed', '1'
+        )
+
+        self.assertIn('Wrote 1 parents, 3 children and 30 approvals', output)
+        self.assertEqual(set(Approval.objects.values_list('status', 'action')), {(Status.none, Action.delete)})
+
+    def test_author(self):
+        '''The approvals are authored by the given user'''
+        user = factory.UserFactory(username='author')
+
+        self.call('5', '--author', 'author')
+
+        self.assertEqual(Approval.objects.filter(author=user).count(), 5)
+        with self.assertRaises(CommandError):
+            self.call('5', '--author', 'nobody')
+
+    def test_invalid_options(self):
+        '''Unknown choices, weights and shares are refused'''
+        for args in (['--statuses', 'waiting=1'], ['--actions', 'update=many'],
+                     ['--statuses', 'pending=0'], ['--hot-share', '2']):
+            with self.assertRaises(CommandError):
+                self.call('5', *args)
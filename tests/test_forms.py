@@ -6,9 +6,18 @@ from django.core.serializers import serialize
 
 from django_approval import models
 from django_approval import choices
+from django_approval.forms import FormUsingApproval
+from django_approval.snapshot import get_snapshot
 from django_approval.test_utils import factories as factory
 from django_approval.test_utils.test_app import forms
-from django_approval.test_utils.test_app.models import Child
+from django_approval.test_utils.test_app.models import Article, Child, Tag
+
+
+class Field1Form(FormUsingApproval):
+
+    class Meta:
+        model = Child
+        fields = ['field1']
 
 
 class UsingApprovalFormTest(TestCase):
@@ -30,12 +39,12 @@ class UsingApprovalFormTest(TestCase):
         self.assertEqual(self.form.is_valid(), True, self.form.errors)
         self.initial['parent'] = self.parent
         test_inst = Child(**self.initial)
-        serialized = serialize('json', [test_inst])
+        serialized = serialize('python', [test_inst])[0]
         instance = self.form.save()
 
         self.assertEqual(models.Approval.objects.count(), 1)
         self.assertEqual(isinstance(instance, models.Approval), True)
-        self.assertJSONEqual(serialized, instance.source)
+        self.assertEqual(models.Approval.objects.get().source, serialized)
         self.assertEqual(instance.status, choices.Status.none)
         self.assertEqual(instance.action, choices.Action.create)
         self.assertEqual(instance.object_id, None)
@@ -48,7 +57,8 @@ class UsingApprovalFormTest(TestCase):
         test_inst.save()
         data = {'field1': 'update', 'field2': 'update2'}
         updated_obj = Child(id=test_inst.pk, **data, parent=self.parent)
-        serialized = serialize('json', [updated_obj])
+        # only the changed fields are stored
+        serialized = serialize('python', [updated_obj], fields=['field1', 'field2'])[0]
         data['parent'] = self.parent.pk
         form = forms.ChildModelForm(data=data, instance=test_inst)
 
@@ -61,7 +71,70 @@ class UsingApprovalFormTest(TestCase):
         self.assertEqual(instance.action, choices.Action.update)
         self.assertEqual(instance.object_id, test_inst.pk)
         self.assertEqual(instance.content_object, test_inst)
-        self.assertJSONEqual(serialized, instance.source)
+        self.assertEqual(models.Approval.objects.get().source, serialized)
+
+    def test_diff_is_stored_for_an_update(self):
+        '''Only the changed fields are stored, with the old and new values'''
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        data = {'field1': 'update', 'field2': 'world', 'parent': self.parent.pk}
+        form = forms.ChildModelForm(data=data, instance=test_inst)
+
+        self.assertEqual(form.is_valid(), True, form.errors)
+        instance = form.save()
+
+        self.assertEqual(instance.changes, {'field1': ['hello', 'update']})
+
+    def test_diff_compares_foreign_keys_by_pk(self):
+        '''A changed foreign key is stored by its primary key'''
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        other_parent = factory.ParentFactory()
+        data = {'field1': 'hello', 'field2': 'world', 'parent': other_parent.pk}
+        form = forms.ChildModelForm(data=data, instance=test_inst)
+
+        self.assertEqual(form.is_valid(), True, form.errors)
+        instance = form.save()
+
+        self.assertEqual(instance.changes, {'parent': [self.parent.pk, other_parent.pk]})
+
+    def test_diff_of_many_to_many_fields(self):
+        '''A changed many to many field is stored as lists of primary keys'''
+        first, second, third = [Tag.objects.create(name=name) for name in ('a', 'b', 'c')]
+        article = Article.objects.create(title='title')
+        article.tags.set([first])
+        form = forms.ArticleModelForm(data={'title': 'title', 'tags': [third.pk, second.pk]}, instance=article)
+
+        self.assertEqual(form.is_valid(), True, form.errors)
+        instance = form.save()
+
+        self.assertEqual(instance.changes, {'tags': [[first.pk], [second.pk, third.pk]]})
+        form = forms.ArticleModelForm(data={'title': 'new', 'tags': [first.pk]})
+        self.assertEqual(form.is_valid(), True, form.errors)
+        self.assertEqual(form.save().changes['tags'], [[], [first.pk]])
+
+    def test_snapshot_of_the_stored_object(self):
+        '''An update remembers the version of the fields it changes'''
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        snapshot = get_snapshot(Child, test_inst.pk, fields=['field1'])
+        data = {'field1': 'update', 'field2': 'world', 'parent': self.parent.pk}
+        form = forms.ChildModelForm(data=data, instance=test_inst)
+
+        self.assertEqual(form.is_valid(), True, form.errors)
+        instance = form.save()
+
+        self.assertEqual(instance.snapshot, snapshot)
+        self.assertEqual(self.form.is_valid(), True, self.form.errors)
+        self.assertEqual(self.form.save().snapshot, '')
+
+    def test_diff_for_a_new_object(self):
+        '''A new object has no old values'''
+        self.assertEqual(self.form.is_valid(), True, self.form.errors)
+        instance = self.form.save()
+
+        self.assertEqual(instance.changes['field1'], [None, 'hello'])
+        self.assertEqual(instance.changes['parent'], [None, self.parent.pk])
 
     def test_form_can_handle_request_argument(self):
         '''The form allows a request argument'''
@@ -69,7 +142,86 @@ class UsingApprovalFormTest(TestCase):
 
     def test_approval_with_partial_update(self):
         '''Form contains partial data for an update, no fields are overwritten'''
-        pass
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        form = Field1Form(data={'field1': 'update'}, instance=test_inst)
+
+        self.assertEqual(form.is_valid(), True, form.errors)
+        instance = form.save()
+        Child.objects.filter(pk=test_inst.pk).update(field2='concurrent')
+        instance.approve()
+        test_inst.refresh_from_db()
+
+        self.assertEqual(instance.changed_fields, ['field1'])
+        self.assertEqual(instance.source['fields'], {'field1': 'update'})
+        self.assertEqual(test_inst.field1, 'update')
+        self.assertEqual(test_inst.field2, 'concurrent')
+
+    def test_changed_fields(self):
+        '''Only the changed model fields are recorded, a new object has none'''
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        data = {'field1': 'update', 'field2': 'world', 'parent': self.parent.pk}
+        form = forms.ChildModelForm(data=data, instance=test_inst)
+
+        self.assertEqual(form.is_valid(), True, form.errors)
+        self.assertEqual(form.save().changed_fields, ['field1'])
+        self.assertEqual(self.form.is_valid(), True, self.form.errors)
+        self.assertEqual(self.form.save().changed_fields, [])
+
+    def test_unchanged_form_makes_no_approval(self):
+        '''Submitting an existing object without changes is not an approval'''
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        data = {'field1': 'hello', 'field2': 'world', 'parent': self.parent.pk}
+        form = forms.ChildModelForm(data=data, instance=test_inst)
+
+        self.assertEqual(form.is_valid(), True, form.errors)
+        with self.assertNumQueries(0):
+            instance = form.save()
+
+        self.assertEqual(instance, test_inst)
+        self.assertEqual(models.Approval.objects.count(), 0)
+
+    def test_identical_pending_approval_is_reused(self):
+        '''Resubmitting the same change returns the pending approval of the author'''
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        data = {'field1': 'update', 'field2': 'world', 'parent': self.parent.pk}
+        author, other = factory.UserFactory(username='author'), factory.UserFactory(username='other')
+
+        def submit(user):
+            request = self.request.post('/')
+            request.user = user
+            form = forms.ChildModelForm(data=data, instance=Child.objects.get(pk=test_inst.pk), request=request)
+            self.assertEqual(form.is_valid(), True, form.errors)
+            return form.save()
+
+        first = submit(author)
+        second = submit(author)
+        third = submit(other)
+
+        self.assertEqual(first.payload_hash, first.get_payload_hash())
+        self.assertEqual(second, first)
+        self.assertNotEqual(third, first)
+        self.assertEqual(models.Approval.objects.count(), 2)
+
+    def test_decided_approval_is_not_reused(self):
+        '''Only pending approvals are reused'''
+        self.initial['parent'] = self.parent
+        test_inst = Child.objects.create(**self.initial)
+        data = {'field1': 'update', 'field2': 'world', 'parent': self.parent.pk}
+        request = self.request.post('/')
+        request.user = factory.UserFactory()
+        form = forms.ChildModelForm(data=data, instance=test_inst, request=request)
+        self.assertEqual(form.is_valid(), True, form.errors)
+        form.save().reject()
+
+        form = forms.ChildModelForm(data=data, instance=Child.objects.get(pk=test_inst.pk), request=request)
+        self.assertEqual(form.is_valid(), True, form.errors)
+        form.save()
+
+        self.assertEqual(models.Approval.objects.count(), 2)
 
     def test_be_able_to_leave_a_comment_through_the_form(self):
         pass
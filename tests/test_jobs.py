@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.management import call_command
+from django.core.serializers import serialize
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+
+from django_approval.admin import reverse_admin_name, APPROVE_NAME
+from django_approval.choices import Action, Decision, Event, JobState, Status
+from django_approval.models import Approval, ApprovalEvent, ApprovalJob
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app.models import Child
+
+
+def create_approval(parent, **data):
+    instance = Child(parent=parent, **data)
+    approval = factory.ChildApprovalFactory(action=Action.create)
+    approval.object_id = None
+    approval.source = serialize('python', [instance])
+    approval.save()
+    return approval
+
+
+class ApprovalJobTest(TestCase):
+
+    def setUp(self):
+        self.parent = factory.ParentFactory()
+        self.approval = create_approval(self.parent, field1='a', field2='b')
+        self.user = factory.UserFactory()
+
+    @override_settings(APPROVAL_ASYNC=True)
+    def test_decide_queues_a_job(self):
+        '''With APPROVAL_ASYNC nothing is applied within decide'''
+        job = self.approval.decide(Decision.approve, user=self.user)
+        self.approval.refresh_from_db()
+
+        self.assertEqual(job.state, JobState.queued)
+        self.assertEqual(job.user, self.user)
+        self.assertEqual(self.approval.status, Status.none)
+
+    def test_decide_applies_directly(self):
+        '''Without APPROVAL_ASYNC the decision is applied right away'''
+        job = self.approval.decide(Decision.reject, user=self.user)
+        self.approval.refresh_from_db()
+
+        self.assertIsNone(job)
+        self.assertEqual(self.approval.status, Status.rejected)
+
+    def test_process_applies_queued_jobs(self):
+        '''Queued decisions are applied and marked as applied'''
+        other = create_approval(self.parent, field1='c', field2='d')
+        Approval.objects.filter(pk=self.approval.pk).enqueue(Decision.approve)
+        Approval.objects.filter(pk=other.pk).enqueue(Decision.reject)
+
+        processed = ApprovalJob.objects.process()
+        self.approval.refresh_from_db()
+        other.refresh_from_db()
+
+        self.assertEqual(processed, 2)
+        self.assertEqual(self.approval.status, Status.approved)
+        self.assertEqual(other.status, Status.rejected)
+        self.assertEqual(ApprovalJob.objects.all().queued().count(), 0)
+        self.assertEqual(ApprovalJob.objects.filter(state=JobState.applied).count(), 2)
+
+    def test_process_marks_failing_jobs(self):
+        '''A job that can not be applied is marked as failed with the error'''
+        self.approval.source = {}
+        self.approval.save()
+        job = self.approval.jobs.create(decision=Decision.approve)
+
+        ApprovalJob.objects.process()
+        job.refresh_from_db()
+
+        self.assertEqual(job.state, JobState.failed)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('Source is not of a model format', job.error)
+
+    @override_settings(APPROVAL_OUTBOX=True)
+    def test_process_decides_as_the_user_of_the_job(self):
+        '''Queued decisions are made by the users who queued them'''
+        other_user = factory.UserFactory(username='other')
+        other = create_approval(self.parent, field1='c', field2='d')
+        Approval.objects.filter(pk=self.approval.pk).enqueue(Decision.approve, user=self.user)
+        Approval.objects.filter(pk=other.pk).enqueue(Decision.approve, user=other_user)
+
+        ApprovalJob.objects.process()
+
+        self.assertEqual(
+            set(ApprovalEvent.objects.filter(event=Event.approved).values_list('approval', 'user')),
+            {(self.approval.pk, self.user.pk), (other.pk, other_user.pk)},
+        )
+
+    def test_process_saves_the_targets(self):
+        '''Queued approvals save their targets, like the approvals made right away'''
+        saved = []
+
+        def receiver(sender, instance, created, **kwargs):
+            saved.append((instance.field1, created))
+
+        self.approval.jobs.create(decision=Decision.approve)
+        post_save.connect(receiver, sender=Child)
+        try:
+            ApprovalJob.objects.process()
+        finally:
+            post_save.disconnect(receiver, sender=Child)
+
+        self.assertEqual(saved, [('a', True)])
+
+    def test_process_fails_jobs_for_decided_approvals(self):
+        '''An approval that was decided after queueing is not decided again'''
+        job = self.approval.jobs.create(decision=Decision.approve)
+        self.approval.reject()
+
+        ApprovalJob.objects.process()
+        job.refresh_from_db()
+        self.approval.refresh_from_db()
+
+        self.assertEqual(job.state, JobState.failed)
+        self.assertEqual(self.approval.status, Status.rejected)
+
+    def test_worker_command_drains_the_queue(self):
+        '''The worker applies everything that is queued and exits with --once'''
+        self.approval.jobs.create(decision=Decision.approve)
+
+        call_command('approval_worker', once=True, batch_size=1)
+        self.approval.refresh_from_db()
+
+        self.assertEqual(self.approval.status, Status.approved)
+
+    @override_settings(APPROVAL_ASYNC=True)
+    def test_admin_approve_view_queues(self):
+        '''The approve link of the parent admin queues the decision'''
+        self.client.force_login(self.user)
+        url = reverse_admin_name(
+            self.parent, APPROVE_NAME, kwargs={'approval_id': self.approval.pk}
+        )
+        parent_url = reverse_admin_name(
+            self.parent, 'change', kwargs={'object_id': self.parent.pk}
+        )
+        self.client.get(parent_url)
+        self.client.get(url)
+        self.approval.refresh_from_db()
+
+        self.assertEqual(self.approval.status, Status.none)
+        self.assertEqual(self.approval.jobs.get().state, JobState.queued)
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class ConcurrentWorkerTest(TransactionTestCase):
+
+    def test_concurrent_workers_apply_every_job_once(self):
+        '''Workers skip jobs locked by each other, every job is applied once'''
+        parent = factory.ParentFactory()
+        for index in range(20):
+            create_approval(parent, field1='a%s' % index, field2='b')
+        Approval.objects.all().enqueue(Decision.approve)
+        count = Child.objects.count()
+
+        call_command('approval_worker', once=True, concurrency=4, batch_size=2)
+
+        self.assertEqual(Child.objects.count(), count + 20)
+        self.assertEqual(ApprovalJob.objects.filter(state=JobState.applied, attempts=1).count(), 20)
+        self.assertEqual(Approval.objects.all().pending().count(), 0)
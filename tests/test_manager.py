@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers import serialize
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from django_approval.choices import Status, Action
+from django_approval.manager import ApprovalQueryset
+from django_approval.models import Approval
+from django_approval.snapshot import get_snapshot
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app.models import Child, Parent
+
+
+class BulkApprovalTest(TestCase):
+
+    def setUp(self):
+        self.parent = factory.ParentFactory()
+
+    def create_approval(self, **data):
+        instance = Child(parent=self.parent, **data)
+        approval = factory.ChildApprovalFactory(action=Action.create)
+        approval.object_id = None
+        approval.source = serialize('python', [instance])
+        approval.save()
+        return approval
+
+    def update_approval(self, **data):
+        approval = factory.ChildApprovalFactory(action=Action.update)
+        instance = Child(pk=approval.object_id, parent=self.parent, **data)
+        approval.source = serialize('python', [instance])
+        approval.save()
+        return approval
+
+    def test_approve_creates_objects_in_bulk(self):
+        '''Create approvals result in new objects and know their object ids'''
+        first = self.create_approval(field1='a', field2='b')
+        second = self.create_approval(field1='c', field2='d')
+        count = Child.objects.count()
+
+        report = Approval.objects.all().approve()
+        first.refresh_from_db()
+        second.refresh_from_db()
+
+        self.assertEqual(Child.objects.count(), count + 2)
+        self.assertEqual(first.status, Status.approved)
+        self.assertEqual(Child.objects.get(pk=first.object_id).field1, 'a')
+        self.assertEqual(Child.objects.get(pk=second.object_id).field1, 'c')
+        self.assertEqual({result.approval_id for result in report}, {first.pk, second.pk})
+
+    def test_approve_updates_objects_in_bulk(self):
+        '''Update approvals overwrite the target objects'''
+        approval = self.update_approval(field1='updated', field2='updated2')
+
+        Approval.objects.all().approve()
+        approval.refresh_from_db()
+
+        self.assertEqual(approval.status, Status.approved)
+        self.assertEqual(Child.objects.get(pk=approval.object_id).field1, 'updated')
+
+    def test_approve_rejects_stale_updates(self):
+        '''Updates of objects that changed since the approval was made are rejected'''
+        stale = self.update_approval(field1='stale', field2='b')
+        current = self.update_approval(field1='current', field2='b')
+        for approval in (stale, current):
+            approval.snapshot = get_snapshot(Child, approval.object_id)
+            approval.save()
+        Child.objects.filter(pk=stale.object_id).update(field1='changed')
+
+        report = {result.approval_id: result for result in Approval.objects.all().approve()}
+        stale.refresh_from_db()
+
+        self.assertEqual(stale.status, Status.rejected)
+        self.assertEqual(report[stale.pk].status, Status.rejected)
+        self.assertIsNotNone(report[stale.pk].error)
+        self.assertEqual(Child.objects.get(pk=stale.object_id).field1, 'changed')
+        self.assertEqual(Child.objects.get(pk=current.object_id).field1, 'current')
+
+    def test_approve_writes_only_changed_fields(self):
+        '''Updates that know their changed fields leave the other columns alone'''
+        approval = self.update_approval(field1='updated', field2='stale')
+        approval.changed_fields = ['field1']
+        approval.save()
+        Child.objects.filter(pk=approval.object_id).update(field2='concurrent')
+
+        with CaptureQueriesContext(connection) as queries:
+            Approval.objects.all().approve()
+        child = Child.objects.get(pk=approval.object_id)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "test_app_child"')]
+
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('field2', updates[0])
+
+        self.assertEqual(child.field1, 'updated')
+        self.assertEqual(child.field2, 'concurrent')
+
+    def test_approve_deletes_objects_in_bulk(self):
+        '''Delete approvals remove the target objects and forget the object id'''
+        approval = factory.ChildApprovalFactory(action=Action.delete)
+        object_id = approval.object_id
+
+        Approval.objects.all().approve()
+        approval.refresh_from_db()
+
+        self.assertFalse(Child.objects.filter(pk=object_id).exists())
+        self.assertEqual(approval.status, Status.approved)
+        self.assertEqual(approval.object_id, None)
+
+    def test_approve_reports_failing_rows(self):
+        '''A broken approval is reported and left pending, the rest is approved'''
+        broken = factory.ChildApprovalFactory(action=Action.update)
+        broken.object_id = None
+        broken.save()
+        approval = self.create_approval(field1='a', field2='b')
+
+        report = {result.approval_id: result for result in Approval.objects.all().approve()}
+        broken.refresh_from_db()
+
+        self.assertIsNotNone(report[broken.pk].error)
+        self.assertIsNone(report[approval.pk].error)
+        self.assertEqual(broken.status, Status.none)
+
+    def test_approve_only_touches_pending_approvals(self):
+        '''Approvals that already have been decided are left alone'''
+        approval = self.create_approval(field1='a', field2='b')
+        approval.status = Status.rejected
+        approval.save()
+
+        report = Approval.objects.all().approve()
+        approval.refresh_from_db()
+
+        self.assertEqual(report, [])
+        self.assertEqual(approval.status, Status.rejected)
+
+    @skipUnlessDBFeature('can_return_rows_from_bulk_insert')
+    def test_approve_queries_do_not_grow_with_rows(self):
+        '''The number of queries depends on the number of batches, not rows'''
+        for index in range(10):
+            self.create_approval(field1='a%s' % index, field2='b')
+
+        with self.assertNumQueries(9):
+            Approval.objects.all().approve(batch_size=5)
+
+    def test_reject_in_bulk(self):
+        '''All pending approvals are rejected without touching targets'''
+        approval = self.create_approval(field1='a', field2='b')
+        count = Child.objects.count()
+
+        report = Approval.objects.all().reject()
+        approval.refresh_from_db()
+
+        self.assertEqual(approval.status, Status.rejected)
+        self.assertEqual(count, Child.objects.count())
+        self.assertEqual(report[0].status, Status.rejected)
+
+    def test_reject_skips_approvals_decided_meanwhile(self):
+        '''An approval approved while the pending ones are read keeps its status'''
+        approved = self.create_approval(field1='a', field2='b')
+        pending = self.create_approval(field1='c', field2='d')
+        original = ApprovalQueryset.pending
+
+        def pending_then_approve(queryset):
+            pks = list(original(queryset).values_list('pk', flat=True))
+            Approval.objects.get(pk=approved.pk).approve()
+            return queryset.filter(pk__in=pks)
+
+        with mock.patch.object(ApprovalQueryset, 'pending', pending_then_approve):
+            report = Approval.objects.all().reject()
+        approved.refresh_from_db()
+
+        self.assertEqual(approved.status, Status.approved)
+        self.assertEqual([result.approval_id for result in report], [pending.pk])
+
+
+class ForModelTest(TestCase):
+
+    def setUp(self):
+        self.approval = factory.ChildApprovalFactory()
+        self.other_approval = factory.ChildApprovalFactory()
+        self.parent_approval = factory.ChildApprovalFactory(
+            content_type=ContentType.objects.get_for_model(Parent)
+        )
+
+    def test_for_model_filters_on_content_type_only(self):
+        '''Without a queryset no subquery over the target table is made'''
+        qs = Approval.objects.for_model(Child)
+
+        self.assertEqual(set(qs), {self.approval, self.other_approval})
+        self.assertNotIn(Child._meta.db_table, str(qs.query))
+
+    def test_for_model_limited_by_queryset(self):
+        '''Only approvals for objects within the queryset are returned'''
+        children = Child.objects.filter(pk=self.approval.object_id)
+        qs = Approval.objects.for_model(Child, queryset=children)
+
+        self.assertEqual(list(qs), [self.approval])
+        self.assertIn('EXISTS', str(qs.query))
+
+    def test_manager_uses_model_argument(self):
+        '''The manager passes on the model instead of the Approval model'''
+        qs = Approval.objects.for_model(Parent)
+
+        self.assertEqual(list(qs), [self.parent_approval])
+
+
+class WithoutPayloadTest(TestCase):
+
+    def setUp(self):
+        self.approval = factory.ChildApprovalFactory(diff='{"field1":["a","b"]}')
+
+    def test_with_targets_defers_the_payload(self):
+        '''Lists do not read source and diff, they are loaded when accessed'''
+        with CaptureQueriesContext(connection) as queries:
+            approval = Approval.objects.all().with_targets().get(pk=self.approval.pk)
+
+        self.assertEqual(approval.get_deferred_fields(), {'source', 'diff'})
+        self.assertNotIn('"source"', queries[0]['sql'])
+        with self.assertNumQueries(1):
+            self.assertEqual(approval.changes, {'field1': ['a', 'b']})
+
+    def test_bulk_decisions_load_the_payload(self):
+        '''Approving a deferred queryset does not load the sources one by one'''
+        factory.ChildApprovalFactory.create_batch(3)
+        queryset = Approval.objects.all().with_targets()
+
+        with CaptureQueriesContext(connection) as queries:
+            queryset.approve()
+        refreshes = [
+            query for query in queries
+            if 'SELECT "django_approval_approval"."id", "django_approval_approval"."source"' in query['sql']
+        ]
+
+        self.assertEqual(refreshes, [])
+
+
+class ChangingTest(TestCase):
+
+    def setUp(self):
+        self.approval = factory.ChildApprovalFactory(source=Approval.make_source(
+            Child(pk=1, field1='wanted', field2='b', parent_id=1), fields=['field1']
+        ))
+        self.other = factory.ChildApprovalFactory(source=Approval.make_source(
+            Child(pk=2, field1='other', field2='b', parent_id=1)
+        ))
+
+    def test_changing(self):
+        '''Approvals are found by the value they set a field to'''
+        self.assertEqual(list(Approval.objects.all().changing(field1='wanted')), [self.approval])
+        self.assertEqual(list(Approval.objects.all().changing(field2='b')), [self.other])
+
+    @skipUnlessDBFeature('supports_json_field_contains')
+    def test_changing_uses_containment(self):
+        '''The lookup is a jsonb containment, which the GIN index serves'''
+        self.assertIn('@>', str(Approval.objects.all().changing(field1='wanted').query))
+
+
+class ConflictTest(TestCase):
+
+    def setUp(self):
+        self.child = factory.ChildFactory()
+        self.first = self.update(created=timezone.now() - timedelta(hours=2), field1='first')
+        self.second = self.update(created=timezone.now() - timedelta(hours=1), field1='second')
+        self.alone = factory.ChildApprovalFactory(action=Action.update)
+
+    def update(self, created, **data):
+        approval = factory.ChildApprovalFactory(content_object=self.child, action=Action.update)
+        instance = Child(pk=self.child.pk, parent=self.child.parent, field2='x', **data)
+        Approval.objects.filter(pk=approval.pk).update(
+            created=created, source=serialize('python', [instance])
+        )
+        approval.refresh_from_db()
+        return approval
+
+    def test_with_conflicts(self):
+        '''Pending approvals for the same object are counted as conflicts'''
+        conflicts = dict(Approval.objects.all().with_conflicts().values_list('pk', 'conflicts'))
+
+        self.assertEqual(conflicts, {self.first.pk: 1, self.second.pk: 1, self.alone.pk: 0})
+
+    def test_decided_approvals_do_not_conflict(self):
+        '''Only pending approvals are counted as conflicting'''
+        self.first.reject()
+
+        self.assertEqual(list(Approval.objects.all().conflicting()), [])
+
+    def test_supersede(self):
+        '''Older pending updates of the same object are rejected'''
+        third = self.update(created=timezone.now(), field1='third')
+        Approval.objects.filter(pk=self.second.pk).update(status=Status.approved)
+
+        rejected = Approval.objects.filter(pk=self.second.pk).supersede()
+        third.refresh_from_db()
+
+        self.assertEqual(rejected, [self.first.pk])
+        self.assertEqual(Approval.objects.get(pk=self.first.pk).status, Status.rejected)
+        self.assertEqual(third.status, Status.none)
+
+    def test_bulk_approve_applies_the_latest_update(self):
+        '''Of several updates for one object only the newest is applied'''
+        report = {result.approval_id: result for result in Approval.objects.all().approve()}
+        self.child.refresh_from_db()
+
+        self.assertEqual(self.child.field1, 'second')
+        self.assertEqual(report[self.first.pk].status, Status.rejected)
+        self.assertEqual(report[self.second.pk].status, Status.approved)
+        self.assertEqual(Approval.objects.get(pk=self.first.pk).status, Status.rejected)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from django_approval.test_utils import factories as factory
+
+
+class CompactSourceMigrationTest(TransactionTestCase):
+    before = [('django_approval', '0006_approval_changed_fields')]
+    after = [('django_approval', '0007_compact_source')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_sources_are_compacted(self):
+        '''Sources stored as a json string or a list become a single object'''
+        child = factory.ChildFactory()
+        apps = self.migrate(self.before)
+        Approval = apps.get_model('django_approval', 'Approval')
+        ContentType = apps.get_model('contenttypes', 'ContentType')
+        content_type = ContentType.objects.get(app_label='test_app', model='child')
+        serialized = {
+            'model': 'test_app.child', 'pk': child.pk,
+            'fields': {'field1': 'a', 'field2': 'b', 'parent': child.parent_id},
+        }
+        string = Approval.objects.create(
+            content_type=content_type, object_id=child.pk, action='update',
+            source=json.dumps([serialized]), diff=''
+        )
+        listed = Approval.objects.create(
+            content_type=content_type, object_id=child.pk, action='update',
+            source=[serialized], changed_fields=['field1'], diff=''
+        )
+
+        apps = self.migrate(self.after)
+        Approval = apps.get_model('django_approval', 'Approval')
+
+        self.assertEqual(Approval.objects.get(pk=string.pk).source, serialized)
+        self.assertEqual(
+            Approval.objects.get(pk=listed.pk).source['fields'], {'field1': 'a'}
+        )
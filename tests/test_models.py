@@ -1,12 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from django.test import TestCase
+import json
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
 from django.core.serializers import serialize
 
 from django_approval.choices import Status, Action
+from django_approval.exceptions import AlreadyDecided, StaleApproval
+from django_approval.models import Approval
+from django_approval.snapshot import get_snapshot
 from django_approval.test_utils import factories as factory
-from django_approval.test_utils.test_app.models import Child
+from django_approval.test_utils.test_app.forms import VersionedModelForm
+from django_approval.test_utils.test_app.models import Child, Versioned
 
 
 class ApprovalModelTest(TestCase):
@@ -41,6 +48,60 @@ class ApprovalModelTest(TestCase):
         with self.assertRaises(ValueError):
             self.approval.approve()
 
+    def test_source_of_older_versions(self):
+        '''Sources stored as a list, or as a json string of it, can be read'''
+        source = Approval.make_source(Child(**self.data))
+        for stored in ([source], json.dumps([source])):
+            self.approval.source = stored
+
+            self.assertEqual(self.approval.get_source_object().field1, 'test1')
+
+    def test_make_source(self):
+        '''The source is a single object with only the given fields'''
+        source = Approval.make_source(self.test_inst, fields=['field1'])
+
+        self.assertEqual(source['model'], 'test_app.child')
+        self.assertEqual(source['pk'], self.test_inst.pk)
+        self.assertEqual(source['fields'], {'field1': self.test_inst.field1})
+
+    def test_approve_twice(self):
+        '''An approval that was decided in the meantime is not applied again'''
+        other = Approval.objects.get(pk=self.approval.pk)
+        other.approve()
+        count = Child.objects.count()
+
+        with self.assertRaises(AlreadyDecided):
+            self.approval.approve()
+        self.assertEqual(count, Child.objects.count())
+
+    def test_stale_update_is_rejected(self):
+        '''An update is rejected when the object changed after it was made'''
+        self.approval.action = Action.update
+        self.approval.object_id = self.test_inst.pk
+        self.approval.snapshot = get_snapshot(Child, self.test_inst.pk)
+        self.approval.source = serialize('python', [Child(pk=self.test_inst.pk, **self.data)])
+        self.approval.save()
+        Child.objects.filter(pk=self.test_inst.pk).update(field1='changed')
+
+        with self.assertRaises(StaleApproval):
+            self.approval.approve()
+        self.approval.refresh_from_db()
+
+        self.assertEqual(self.approval.status, Status.rejected)
+        self.assertEqual(Child.objects.get(pk=self.test_inst.pk).field1, 'changed')
+
+    def test_current_update_is_approved(self):
+        '''An update of an unchanged object is applied'''
+        self.approval.action = Action.update
+        self.approval.object_id = self.test_inst.pk
+        self.approval.snapshot = get_snapshot(Child, self.test_inst.pk)
+        self.approval.source = serialize('python', [Child(pk=self.test_inst.pk, **self.data)])
+        self.approval.save()
+
+        self.approval.approve()
+
+        self.assertEqual(Child.objects.get(pk=self.test_inst.pk).field1, 'test1')
+
     def test_reject_approval(self):
         '''Changes status to rejected, does not create anything; it was rejected'''
         count = Child.objects.count()
@@ -49,6 +110,16 @@ class ApprovalModelTest(TestCase):
         self.assertEqual(self.approval.status, Status.rejected)
         self.assertEqual(count, Child.objects.count())
 
+    def test_reject_decided(self):
+        '''An approval that was decided in the meantime is not rejected'''
+        Approval.objects.get(pk=self.approval.pk).approve()
+
+        with self.assertRaises(AlreadyDecided):
+            self.approval.reject()
+        self.approval.refresh_from_db()
+
+        self.assertEqual(self.approval.status, Status.approved)
+
     def test_approve_stores_who_did_it(self):
         '''We want to track who approved an approval'''
         self.approval.approve(self.user)
@@ -73,6 +144,26 @@ class ApprovalModelTest(TestCase):
         self.assertEqual(self.approval.object_id, None)
         self.assertEqual(self.approval.status, Status.approved)
 
+    def test_default_ordering_does_not_join_content_types(self):
+        '''The default ordering can be served by the approval_target_idx index'''
+        order_by = str(Approval.objects.all().query).split('ORDER BY')[1]
+
+        self.assertNotIn('django_content_type', order_by)
+
+    def test_diff_html_is_rendered_from_the_stored_diff(self):
+        '''The html shows the verbose name, the old and the new value'''
+        self.approval.diff = '{"field1":["<old>","new"]}'
+
+        html = self.approval.diff_html()
+
+        self.assertIn('<td>field1</td><td>&lt;old&gt;</td><td>new</td>', html)
+
+    def test_diff_html_without_changes(self):
+        '''Nothing is rendered for approvals without a diff'''
+        self.approval.diff = ''
+
+        self.assertEqual(self.approval.diff_html(), '')
+
     def test_test_model_has_approvals(self):
         '''Test Model has an easily accessible approvals (ModelMixin)'''
         pass
@@ -80,4 +171,75 @@ class ApprovalModelTest(TestCase):
     def test_approve_one_same_object_id_will_be_rejected(self):
         '''So if we approve an update, all other updates for target object should be
     rejected.'''
-        pass
+        older = factory.ChildApprovalFactory(content_object=self.test_inst, action=Action.update)
+        self.approval.action = Action.update
+        self.approval.object_id = self.test_inst.pk
+        self.approval.source[0]['pk'] = self.test_inst.pk
+        self.approval.save()
+        newer = factory.ChildApprovalFactory(content_object=self.test_inst, action=Action.update)
+        Approval.objects.filter(pk=older.pk).update(created=self.approval.created - timedelta(hours=1))
+        Approval.objects.filter(pk=newer.pk).update(created=self.approval.created + timedelta(hours=1))
+
+        self.approval.approve()
+        older.refresh_from_db()
+        newer.refresh_from_db()
+
+        self.assertEqual(older.status, Status.rejected)
+        self.assertEqual(newer.status, Status.none)
+
+    @override_settings(APPROVAL_SUPERSEDE=False)
+    def test_approve_without_supersede(self):
+        '''Superseding older updates can be switched off'''
+        older = factory.ChildApprovalFactory(content_object=self.test_inst, action=Action.update)
+        Approval.objects.filter(pk=older.pk).update(created=self.approval.created - timedelta(hours=1))
+        self.approval.action = Action.update
+        self.approval.object_id = self.test_inst.pk
+        self.approval.save()
+
+        self.approval.approve()
+        older.refresh_from_db()
+
+        self.assertEqual(older.status, Status.none)
+
+
+class VersionFieldTest(TestCase):
+
+    def setUp(self):
+        self.instance = Versioned.objects.create(name='first')
+        self.updated = self.instance.updated
+        self.approvals = [self.make_update(name) for name in ('second', 'third')]
+
+    def make_update(self, name):
+        form = VersionedModelForm(data={'name': name}, instance=Versioned.objects.get(pk=self.instance.pk))
+        self.assertTrue(form.is_valid())
+        return form.save()
+
+    def test_approve_bumps_the_version(self):
+        '''Approving writes the changed fields, the version and the auto_now fields'''
+        self.approvals[0].approve()
+        self.instance.refresh_from_db()
+
+        self.assertEqual(self.instance.name, 'second')
+        self.assertEqual(self.instance.version, 1)
+        self.assertGreater(self.instance.updated, self.updated)
+
+    def test_second_update_of_a_version_is_stale(self):
+        '''An update made from the same version as an approved one is rejected'''
+        self.approvals[0].approve()
+
+        with self.assertRaises(StaleApproval):
+            self.approvals[1].approve()
+        self.instance.refresh_from_db()
+
+        self.assertEqual(self.instance.name, 'second')
+
+    def test_bulk_approve_bumps_the_version(self):
+        '''Bulk approving also moves the version on'''
+        Approval.objects.filter(pk=self.approvals[0].pk).approve()
+        report = Approval.objects.filter(pk=self.approvals[1].pk).approve()
+        self.instance.refresh_from_db()
+
+        self.assertEqual(self.instance.version, 1)
+        self.assertGreater(self.instance.updated, self.updated)
+        self.assertEqual(report[0].status, Status.rejected)
+        self.assertEqual(self.instance.name, 'second')
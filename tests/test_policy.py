@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from django_approval.models import Approval
+from django_approval.policy import ApprovalPolicy, get_policy
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app import forms
+from django_approval.test_utils.test_app.models import Child
+
+MODERATORS = {'test_app.child': {'exempt_groups': ['moderators']}}
+
+
+class ApprovalPolicyTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_policy.cache_clear()
+        self.addCleanup(get_policy.cache_clear)
+        self.user = factory.UserFactory(username='user', is_superuser=False)
+        self.group = Group.objects.create(name='moderators')
+
+    def fresh(self):
+        '''The user as it is loaded by the next request'''
+        return User.objects.get(pk=self.user.pk)
+
+    def test_default_needs_approval(self):
+        '''Without a policy every change needs an approval'''
+        self.assertTrue(Child.need_approval(self.user))
+        self.assertTrue(Child.need_approval(None))
+
+    @override_settings(APPROVAL_POLICIES={'default': {'exempt_superusers': True}})
+    def test_superusers(self):
+        '''Superusers can be exempt'''
+        self.user.is_superuser = True
+
+        self.assertFalse(Child.need_approval(self.user))
+
+    @override_settings(APPROVAL_POLICIES=MODERATORS)
+    def test_exempt_group(self):
+        '''Members of an exempt group need no approval'''
+        self.assertTrue(Child.need_approval(self.user))
+        self.user.groups.add(self.group)
+
+        self.assertFalse(Child.need_approval(self.fresh()))
+
+    @override_settings(APPROVAL_POLICIES=MODERATORS)
+    def test_facts_are_cached(self):
+        '''Groups are looked up once per user, for the request and in the cache'''
+        Child.need_approval(self.user)
+
+        with self.assertNumQueries(0):
+            Child.need_approval(self.user)
+        user = self.fresh()
+        with self.assertNumQueries(0):
+            Child.need_approval(user)
+
+    @override_settings(APPROVAL_POLICIES=MODERATORS)
+    def test_group_changes_invalidate(self):
+        '''Changing the members from either side drops the cached groups'''
+        Child.need_approval(self.user)
+        self.group.user_set.add(self.user)
+        self.assertFalse(Child.need_approval(self.fresh()))
+
+        self.group.user_set.clear()
+        self.assertTrue(Child.need_approval(self.fresh()))
+
+    @override_settings(APPROVAL_POLICIES={'test_app.child': {'exempt_permissions': ['test_app.change_child']}})
+    def test_exempt_permission(self):
+        '''Users with an exempt permission need no approval'''
+        Child.need_approval(self.user)
+        self.user.user_permissions.add(Permission.objects.get(codename='change_child'))
+
+        self.assertFalse(Child.need_approval(self.fresh()))
+
+    @override_settings(APPROVAL_POLICIES={'test_app.child': {'sensitive_fields': ['field2']}})
+    def test_sensitive_fields(self):
+        '''Only updates of sensitive fields need an approval'''
+        self.assertFalse(Child.need_approval(self.user, fields=['field1']))
+        self.assertTrue(Child.need_approval(self.user, fields=['field1', 'field2']))
+        self.assertTrue(Child.need_approval(self.user))
+
+    @override_settings(APPROVAL_POLICIES={'test_app.child': {'sensitive_fields': ['field2']}})
+    def test_form_saves_insensitive_changes(self):
+        '''A form that changes no sensitive field saves the object directly'''
+        child = factory.ChildFactory()
+        data = {'field1': 'direct', 'field2': child.field2, 'parent': child.parent_id}
+        form = forms.ChildModelForm(data=data, instance=child)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        saved = form.save()
+
+        self.assertEqual(saved, child)
+        self.assertEqual(Child.objects.get(pk=child.pk).field1, 'direct')
+        self.assertEqual(Approval.objects.count(), 0)
+
+    def test_model_attribute(self):
+        '''The policy can be declared on the model'''
+        self.user.is_superuser = True
+        with mock.patch.object(Child, 'approval_policy', ApprovalPolicy(exempt_superusers=True)):
+            get_policy.cache_clear()
+
+            self.assertFalse(Child.need_approval(self.user))
+
+    def test_legacy_override(self):
+        '''A model that overrides need_approval(cls, user) is asked without the fields'''
+        calls = []
+
+        def legacy(cls, user):
+            calls.append(user)
+            return False
+
+        child = factory.ChildFactory()
+        data = {'field1': 'direct', 'field2': child.field2, 'parent': child.parent_id}
+        with mock.patch.object(Child, 'need_approval', classmethod(legacy)):
+            form = forms.ChildModelForm(data=data, instance=child)
+            self.assertTrue(form.is_valid(), form.errors)
+            form.save()
+
+        self.assertEqual(calls, [None])
+        self.assertEqual(Child.objects.get(pk=child.pk).field1, 'direct')
+        self.assertEqual(Approval.objects.count(), 0)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+
+from django_approval.choices import Action, Event
+from django_approval.models import Approval, ApprovalEvent
+from django_approval.signals import approval_approved, approval_rejected, approval_requested
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app.models import Child
+
+
+class Receiver:
+    '''Collects the approvals a signal was sent for'''
+
+    def __init__(self, signal):
+        self.signal = signal
+        self.approvals = []
+        self.users = []
+
+    def __call__(self, sender, approval, user, **kwargs):
+        self.approvals.append(approval)
+        self.users.append(user)
+
+    def __enter__(self):
+        self.signal.connect(self, sender=Approval)
+        return self
+
+    def __exit__(self, *args):
+        self.signal.disconnect(self, sender=Approval)
+
+
+def create_approval(**data):
+    parent = factory.ParentFactory()
+    approval = factory.ChildApprovalFactory(action=Action.create)
+    approval.object_id = None
+    approval.source = Approval.make_source(Child(parent=parent, **data))
+    approval.save()
+    return approval
+
+
+class SignalTest(TransactionTestCase):
+
+    def test_requested(self):
+        '''Making an approval sends approval_requested'''
+        with Receiver(approval_requested) as receiver:
+            approval = factory.ChildApprovalFactory()
+
+        self.assertEqual(receiver.approvals, [approval])
+
+    def test_sent_after_commit(self):
+        '''Nothing is sent before the transaction commits, or when it rolls back'''
+        with Receiver(approval_requested) as receiver:
+            with transaction.atomic():
+                factory.ChildApprovalFactory()
+                self.assertEqual(receiver.approvals, [])
+            try:
+                with transaction.atomic():
+                    factory.ChildApprovalFactory()
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(len(receiver.approvals), 1)
+
+    def test_approved(self):
+        '''Approving sends approval_approved with the approved state and the user'''
+        approval = create_approval(field1='a', field2='b')
+        user = factory.UserFactory()
+        with Receiver(approval_approved) as receiver:
+            approval.approve(user)
+
+        self.assertEqual(receiver.approvals, [approval])
+        self.assertEqual(receiver.approvals[0].object_id, approval.object_id)
+        self.assertEqual(receiver.users, [user])
+
+    def test_rejected(self):
+        '''Rejecting sends approval_rejected'''
+        approval = factory.ChildApprovalFactory()
+        with Receiver(approval_rejected) as receiver:
+            approval.reject()
+
+        self.assertEqual(receiver.approvals, [approval])
+
+    def test_bulk_decisions(self):
+        '''Bulk approve and reject send a signal for every approval'''
+        approvals = [create_approval(field1='a', field2=str(index)) for index in range(3)]
+        with Receiver(approval_approved) as receiver:
+            Approval.objects.filter(pk__in=[approval.pk for approval in approvals[:2]]).approve()
+        with Receiver(approval_rejected) as rejected:
+            Approval.objects.all().reject()
+
+        self.assertEqual(receiver.approvals, approvals[:2])
+        self.assertEqual(rejected.approvals, approvals[2:])
+
+
+@override_settings(APPROVAL_OUTBOX=True)
+class OutboxTest(TransactionTestCase):
+
+    def test_events_are_written_instead(self):
+        '''With the outbox the signal is not sent, an event is written'''
+        with Receiver(approval_requested) as receiver:
+            approval = factory.ChildApprovalFactory()
+
+        self.assertEqual(receiver.approvals, [])
+        self.assertEqual(approval.events.get().event, Event.requested)
+
+    def test_event_in_the_decision_transaction(self):
+        '''An approve that fails leaves no event behind'''
+        approval = factory.ChildApprovalFactory(action=Action.update, source={})
+        ApprovalEvent.objects.all().delete()
+
+        with self.assertRaises(ValueError):
+            approval.approve()
+
+        self.assertEqual(ApprovalEvent.objects.count(), 0)
+
+    def test_flush(self):
+        '''The command sends the signals in order and empties the outbox'''
+        first = factory.ChildApprovalFactory()
+        second = factory.ChildApprovalFactory()
+        second.reject()
+
+        with Receiver(approval_requested) as requested, Receiver(approval_rejected) as rejected:
+            call_command('flush_approval_events', batch_size=2, stdout=io.StringIO())
+
+        self.assertEqual(requested.approvals, [first, second])
+        self.assertEqual(rejected.approvals, [second])
+        self.assertEqual(ApprovalEvent.objects.count(), 0)
+
+    def test_failing_receiver_keeps_events(self):
+        '''Events are only removed once their signals were sent'''
+        factory.ChildApprovalFactory()
+
+        def fail(**kwargs):
+            raise RuntimeError('receiver failed')
+
+        approval_requested.connect(fail, sender=Approval)
+        try:
+            with self.assertRaises(RuntimeError):
+                ApprovalEvent.objects.flush()
+        finally:
+            approval_requested.disconnect(fail, sender=Approval)
+
+        self.assertEqual(ApprovalEvent.objects.count(), 1)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from unittest import mock
+
+from django.test import TestCase
+
+from django_approval.snapshot import get_snapshot, get_snapshots
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app.models import Child
+
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        self.child = factory.ChildFactory()
+
+    def test_snapshot_changes_with_the_object(self):
+        '''Any changed column gives another snapshot'''
+        snapshot = get_snapshot(Child, self.child.pk)
+        Child.objects.filter(pk=self.child.pk).update(field2='changed')
+
+        self.assertNotEqual(get_snapshot(Child, self.child.pk), snapshot)
+
+    def test_snapshot_is_stable(self):
+        '''Saving the same values keeps the snapshot'''
+        snapshot = get_snapshot(Child, self.child.pk)
+        self.child.save()
+
+        self.assertEqual(get_snapshot(Child, self.child.pk), snapshot)
+
+    def test_snapshots_in_one_query(self):
+        '''The snapshots of many objects are read with one query'''
+        other = factory.ChildFactory()
+
+        with self.assertNumQueries(1):
+            snapshots = get_snapshots(Child, [self.child.pk, other.pk])
+        self.assertEqual(set(snapshots), {self.child.pk, other.pk})
+
+    def test_snapshot_of_fields(self):
+        '''With fields changes to other columns keep the snapshot'''
+        snapshot = get_snapshot(Child, self.child.pk, fields=['field1'])
+        Child.objects.filter(pk=self.child.pk).update(field2='changed')
+
+        self.assertEqual(get_snapshot(Child, self.child.pk, fields=['field1']), snapshot)
+
+    def test_missing_object(self):
+        '''An object that does not exist has an empty snapshot'''
+        self.assertEqual(get_snapshot(Child, 0), '')
+
+    def test_version_field(self):
+        '''With approval_version_field only that column is compared'''
+        with mock.patch.object(Child, 'approval_version_field', 'field2', create=True):
+            snapshot = get_snapshot(Child, self.child.pk)
+            Child.objects.filter(pk=self.child.pk).update(field1='changed')
+
+            self.assertEqual(snapshot, self.child.field2)
+            self.assertEqual(get_snapshot(Child, self.child.pk), snapshot)
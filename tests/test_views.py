@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.serializers import serialize
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from django_approval.choices import Action, Status
+from django_approval.models import Approval, ApprovalJob
+from django_approval.test_utils import factories as factory
+from django_approval.test_utils.test_app.models import Child
+
+
+def create_approval(parent, **data):
+    instance = Child(parent=parent, **data)
+    approval = factory.ChildApprovalFactory(action=Action.create)
+    approval.object_id = None
+    approval.source = serialize('python', [instance])[0]
+    approval.save()
+    return approval
+
+
+class ApprovalAPITest(TestCase):
+
+    def setUp(self):
+        self.parent = factory.ParentFactory()
+        self.approvals = [create_approval(self.parent, field1=str(index), field2='b') for index in range(5)]
+        self.approval = self.approvals[0]
+        self.user = factory.UserFactory()
+        self.client.force_login(self.user)
+        self.list_url = reverse('django_approval:approval_list')
+        self.detail_url = reverse('django_approval:approval_detail', args=[self.approval.pk])
+
+    def decide_url(self, approval, decision):
+        return reverse('django_approval:approval_decide', args=[approval.pk, decision])
+
+    def test_permissions(self):
+        '''Anonymous users and users without the permission are turned away'''
+        user = factory.UserFactory(username='other', is_superuser=False)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.list_url).status_code, 401)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(self.list_url).status_code, 403)
+        self.assertEqual(self.client.post(self.decide_url(self.approval, 'approve')).status_code, 403)
+
+    def test_list_pages_by_cursor(self):
+        '''The approvals are listed newest first, the next page is linked'''
+        pages = []
+        url = self.list_url + '?limit=2'
+        while url:
+            data = self.client.get(url).json()
+            pages.append([row['id'] for row in data['results']])
+            url = data['next']
+
+        self.assertEqual(pages, [
+            [self.approvals[4].pk, self.approvals[3].pk],
+            [self.approvals[2].pk, self.approvals[1].pk],
+            [self.approvals[0].pk],
+        ])
+
+    def test_list_rows(self):
+        '''Rows have the content type as app_label.model and no payload'''
+        row = self.client.get(self.list_url, {'limit': 1}).json()['results'][0]
+
+        self.assertEqual(row['content_type'], 'test_app.child')
+        self.assertEqual(row['status'], Status.none)
+        self.assertNotIn('source', row)
+
+    def test_list_filters(self):
+        '''Lists are filtered on status, invalid filters are a bad request'''
+        self.approval.reject()
+
+        data = self.client.get(self.list_url, {'status': Status.rejected}).json()
+
+        self.assertEqual([row['id'] for row in data['results']], [self.approval.pk])
+        self.assertEqual(self.client.get(self.list_url, {'status': 'invalid'}).status_code, 400)
+        self.assertEqual(self.client.get(self.list_url, {'cursor': 'invalid'}).status_code, 400)
+
+    def test_list_not_modified(self):
+        '''An unchanged page is answered with 304, a decision changes the ETag'''
+        etag = self.client.get(self.list_url)['ETag']
+
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.approval.reject()
+        self.assertEqual(self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail(self):
+        '''The detail has the source and the changes'''
+        Approval.objects.filter(pk=self.approval.pk).update(diff='{"field1":[null,"0"]}')
+
+        data = self.client.get(self.detail_url).json()
+
+        self.assertEqual(data['source']['fields']['field1'], '0')
+        self.assertEqual(data['changes'], {'field1': [None, '0']})
+        self.assertEqual(self.client.get(reverse('django_approval:approval_detail', args=[0])).status_code, 404)
+
+    def test_detail_not_modified(self):
+        '''The detail is validated by ETag and Last-Modified without reading the payload'''
+        response = self.client.get(self.detail_url)
+
+        with self.assertNumQueries(3):
+            # the session and the user, then the modified time
+            not_modified = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(
+            self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+    def test_approve(self):
+        '''Approving applies the approval, deciding again is a conflict'''
+        response = self.client.post(self.decide_url(self.approval, 'approve'))
+        self.approval.refresh_from_db()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], Status.approved)
+        self.assertEqual(Child.objects.get(pk=self.approval.object_id).field1, '0')
+        self.assertEqual(self.client.post(self.decide_url(self.approval, 'approve')).status_code, 409)
+        self.assertEqual(self.client.post(self.decide_url(self.approval, 'delay')).status_code, 404)
+
+    def test_reject_decided(self):
+        '''Rejecting an approval that was already approved is a conflict'''
+        self.approval.approve()
+
+        response = self.client.post(self.decide_url(self.approval, 'reject'))
+        self.approval.refresh_from_db()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.approval.status, Status.approved)
+
+    def test_decide_if_match(self):
+        '''A decision with an outdated ETag is refused'''
+        etag = self.client.get(self.detail_url)['ETag']
+        self.approval.comment = 'changed'
+        self.approval.save()
+
+        response = self.client.post(self.decide_url(self.approval, 'reject'), HTTP_IF_MATCH=etag)
+        self.approval.refresh_from_db()
+
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.approval.status, Status.none)
+
+    def test_bulk_decide(self):
+        '''Many approvals are decided with one request'''
+        ids = [approval.pk for approval in self.approvals[:3]]
+        url = reverse('django_approval:approval_bulk_decide')
+
+        response = self.client.post(url, {'decision': 'reject', 'ids': ids}, content_type='application/json')
+
+        self.assertEqual(sorted(result['approval_id'] for result in response.json()['results']), ids)
+        self.assertEqual(Approval.objects.filter(status=Status.rejected).count(), 3)
+        self.assertEqual(self.client.post(url, {'ids': ids}, content_type='application/json').status_code, 400)
+
+    @override_settings(APPROVAL_ASYNC=True)
+    def test_async_decisions_are_queued(self):
+        '''With APPROVAL_ASYNC the decisions are queued'''
+        response = self.client.post(self.decide_url(self.approval, 'approve'))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ApprovalJob.objects.get().pk, response.json()['job'])
+        self.assertEqual(
+            self.client.get(self.detail_url).json()['status'], Status.none
+        )
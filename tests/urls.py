@@ -2,10 +2,13 @@
 from __future__ import unicode_literals, absolute_import
 
 from django.contrib import admin
-from django.conf.urls import url, include
+from django.conf.urls import include
 from django.urls import path
 
+from django_approval.test_utils.test_app.admin import site as approval_forms_site
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    url(r'^admin/', include('django_approval.urls', namespace='django_approval')),
+    path('approval-forms/', approval_forms_site.urls),
+    path('approval/', include('django_approval.urls', namespace='django_approval')),
 ]